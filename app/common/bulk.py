@@ -0,0 +1,193 @@
+import json
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple, Type, TypeVar
+
+from bson import ObjectId
+from fastapi import HTTPException, Request, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pydantic import BaseModel, ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.common.cache import read_cache
+from app.common.references import ReferenceFields, reference_problems
+from app.models.bulk import BulkRowError, BulkUpdateResponse
+
+BULK_CHUNK_SIZE = 1000
+
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+M = TypeVar("M", bound=BaseModel)
+
+# (ops, object_ids, update_docs) -> bulk_api_result; raises BulkWriteError like bulk_write
+ChunkWriter = Callable[[List[UpdateOne], List[ObjectId], List[Dict[str, Any]]], Awaitable[Dict[str, Any]]]
+
+
+class _UnparsableRow:
+    def __init__(self, error: str):
+        self.error = error
+
+
+def _parse_line(line: bytes) -> Any:
+    try:
+        return json.loads(line)
+    except ValueError as error:
+        return _UnparsableRow(f"Invalid JSON: {error}")
+
+
+async def iter_request_rows(request: Request, chunk_size: int = BULK_CHUNK_SIZE) -> AsyncIterator[List[Tuple[int, Any]]]:
+    """
+    Yield the request body as chunks of (row_index, row) without waiting for the whole upload.
+    NDJSON bodies are parsed line by line as they stream in; anything else must be a JSON array.
+    Rows that are not valid JSON are yielded as _UnparsableRow so they get a per-row error.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    chunk: List[Tuple[int, Any]] = []
+    index = 0
+
+    if content_type in NDJSON_CONTENT_TYPES:
+        pending = b""
+        async for part in request.stream():
+            pending += part
+            *lines, pending = pending.split(b"\n")
+            for line in lines:
+                if not line.strip():
+                    continue
+                chunk.append((index, _parse_line(line)))
+                index += 1
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+        if pending.strip():
+            chunk.append((index, _parse_line(pending)))
+        if chunk:
+            yield chunk
+        return
+
+    try:
+        rows = json.loads(await request.body())
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid JSON body: {error}")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array or NDJSON")
+    for start in range(0, len(rows), chunk_size):
+        yield [(start + i, row) for i, row in enumerate(rows[start:start + chunk_size])]
+
+
+def validate_rows(rows: List[Tuple[int, Any]], model: Type[M]) -> Tuple[List[Tuple[int, M]], List[BulkRowError]]:
+    """Validate a chunk against `model`, collecting failures per row instead of raising."""
+    valid: List[Tuple[int, M]] = []
+    errors: List[BulkRowError] = []
+    for index, row in rows:
+        if isinstance(row, _UnparsableRow):
+            errors.append(BulkRowError(index=index, detail=row.error))
+            continue
+        try:
+            valid.append((index, model.model_validate(row)))
+        except ValidationError as error:
+            errors.append(BulkRowError(index=index, detail=error.errors(include_url=False, include_context=False)))
+    return valid, errors
+
+
+def write_errors(error: BulkWriteError, row_indexes: List[int]) -> Dict[int, BulkRowError]:
+    """Map the writeErrors of an unordered bulk write back to request row indexes, keyed by op index."""
+    out: Dict[int, BulkRowError] = {}
+    for write_error in error.details.get("writeErrors", []):
+        op_index = write_error["index"]
+        out[op_index] = BulkRowError(index=row_indexes[op_index], detail=write_error.get("errmsg", "Write failed"))
+    return out
+
+
+def compile_update_ops(
+    valid: List[Tuple[int, Any]],
+    check_changes: Callable[[Dict[str, Any]], str | None] | None = None,
+) -> Tuple[List[UpdateOne], List[int], List[ObjectId], List[Dict[str, Any]], List[BulkRowError]]:
+    """
+    Turn validated {id, changes} rows into UpdateOne ops.
+    Returns (ops, row_indexes, object_ids, update_docs, errors); rows with a bad id or nothing to set
+    become errors.
+    """
+    ops: List[UpdateOne] = []
+    row_indexes: List[int] = []
+    object_ids: List[ObjectId] = []
+    update_docs: List[Dict[str, Any]] = []
+    errors: List[BulkRowError] = []
+    for index, row in valid:
+        if not ObjectId.is_valid(row.id):
+            errors.append(BulkRowError(index=index, detail=f"Invalid ObjectId: {row.id}"))
+            continue
+        update_doc = row.changes.model_dump(exclude_unset=True, exclude_none=True)
+        update_doc.pop("_id", None)
+        update_doc.pop("id", None)
+        problem = "Invalid fields to update" if not update_doc else check_changes and check_changes(update_doc)
+        if problem:
+            errors.append(BulkRowError(index=index, detail=problem))
+            continue
+        object_id = ObjectId(row.id)
+        ops.append(UpdateOne({"_id": object_id}, {"$set": update_doc}))
+        row_indexes.append(index)
+        object_ids.append(object_id)
+        update_docs.append(update_doc)
+    return ops, row_indexes, object_ids, update_docs, errors
+
+
+async def bulk_update_by_id(
+    collection: AsyncIOMotorCollection,
+    request: Request,
+    row_model: Type[BaseModel],
+    *,
+    serializer: Callable[[Dict[str, Any]], Dict[str, Any]],
+    return_documents: bool = False,
+    check_changes: Callable[[Dict[str, Any]], str | None] | None = None,
+    write_chunk: ChunkWriter | None = None,
+    references: ReferenceFields | None = None,
+) -> BulkUpdateResponse:
+    """
+    Apply a JSON array / NDJSON stream of {id, changes} rows with one unordered bulk_write per chunk.
+    Without return_documents that is the only round-trip per chunk unless some row matched
+    nothing, in which case one $in query on _id finds the ids that do not exist; with it, the
+    post-images are fetched with a single $in query per chunk, which also yields those ids.
+    `write_chunk(ops, object_ids, update_docs)` replaces the plain bulk_write when a collection
+    has to maintain derived state along with the update; it returns the bulk_api_result.
+    With `references`, rows setting an id that does not exist become errors; the chunk's ids are
+    checked with one $in query per referenced collection.
+    """
+    response = BulkUpdateResponse()
+    async for rows in iter_request_rows(request):
+        response.requested += len(rows)
+        valid, errors = validate_rows(rows, row_model)
+        ops, row_indexes, object_ids, update_docs, compile_errors = compile_update_ops(valid, check_changes)
+        response.errors.extend(errors + compile_errors)
+        if references and ops:
+            problems = await reference_problems(collection.database, update_docs, references)
+            if problems:
+                response.errors.extend(BulkRowError(index=row_indexes[i], detail=p) for i, p in problems.items())
+                keep = [i for i in range(len(ops)) if i not in problems]
+                ops, row_indexes, object_ids, update_docs = (
+                    [values[i] for i in keep] for values in (ops, row_indexes, object_ids, update_docs)
+                )
+        if not ops:
+            continue
+        try:
+            if write_chunk is not None:
+                result = await write_chunk(ops, object_ids, update_docs)
+            else:
+                result = (await collection.bulk_write(ops, ordered=False)).bulk_api_result
+        except BulkWriteError as error:
+            result = error.details
+            response.errors.extend(write_errors(error, row_indexes).values())
+        response.matched += result.get("nMatched", 0)
+        response.modified += result.get("nModified", 0)
+        read_cache.invalidate(collection.name, object_ids)
+
+        if return_documents:
+            docs = await collection.find({"_id": {"$in": object_ids}}).to_list(length=len(object_ids))
+            response.items.extend(serializer(doc) for doc in docs)
+        elif result.get("nMatched", 0) < len(ops):
+            # Some row matched nothing: look up which ids exist, without fetching the documents
+            docs = await collection.find({"_id": {"$in": object_ids}}, {"_id": 1}).to_list(length=len(object_ids))
+        else:
+            continue
+        found = {doc["_id"] for doc in docs}
+        response.not_found.extend(str(oid) for oid in dict.fromkeys(object_ids) if oid not in found)
+    response.errors.sort(key=lambda e: e.index)
+    return response
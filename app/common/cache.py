@@ -0,0 +1,162 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Set, Tuple
+
+from app.settings import get_app_settings
+
+_MISSING = object()
+
+
+class ReadThroughCache:
+    """
+    Bounded TTL + LRU cache for read endpoints.
+
+    Keys are (collection, "doc", id) for single documents and
+    (collection, "list", generation, params) for list pages. Every write to a
+    collection bumps its generation: list pages of the old generation become
+    unreachable at once, and a load that started before the write is not stored
+    when it finishes, so a reader never sees data older than the last write
+    made by this process.
+
+    discard() is the lighter invalidation for changes list pages may show late,
+    such as the item counters on brands and categories: it drops the documents
+    and bumps their document version, but leaves the generation alone. Such a
+    collection is marked `lagging`, and its list pages and list ETags are then
+    allowed to be up to one TTL old.
+
+    max_entries and ttl left as None are read from the app settings on first use.
+    """
+
+    def __init__(
+        self, max_entries: int | None = None, ttl: float | None = None, clock: Callable[[], float] = time.monotonic
+    ):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        # (collection, id) -> number of discard() calls since the collection's generation last changed
+        self._doc_versions: Dict[Tuple[str, str], int] = {}
+        # Collections whose list pages may lag discard()ed changes by one TTL
+        self.lagging: Set[str] = set()
+        # Collections whose change stream is live, i.e. other workers' writes bump the generation too
+        self.watched: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is None:
+            self._max_entries = get_app_settings().read_cache_max_entries
+        return self._max_entries
+
+    @property
+    def ttl(self) -> float:
+        if self._ttl is None:
+            self._ttl = get_app_settings().read_cache_ttl_seconds
+        return self._ttl
+
+    @staticmethod
+    def doc_key(collection: str, id: Any) -> Tuple[str, str, str]:
+        return collection, "doc", str(id)
+
+    def list_key(self, collection: str, params: Hashable) -> Tuple[str, str, int, Hashable]:
+        return collection, "list", self.generation(collection), params
+
+    def generation(self, collection: str) -> int:
+        return self._generations.get(collection, 0)
+
+    def doc_version(self, collection: str, id: Any) -> int:
+        """Part of a single document's ETag, next to its collection's version."""
+        return self._doc_versions.get((collection, str(id)), 0)
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISSING
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return the cached value for `key`, or await `loader()` and cache it. None is never cached."""
+        value = self.get(key)
+        if value is not _MISSING:
+            return value
+        collection = key[0]
+        version = self._version(key)
+        value = await loader()
+        # A write to the collection (or a discard of this document) while loading makes the result possibly stale
+        if value is not None and self._version(key) == version:
+            self.set(key, value)
+        return value
+
+    def _version(self, key: Hashable) -> Tuple[int, int]:
+        collection, kind = key[0], key[1]
+        return self.generation(collection), self.doc_version(collection, key[2]) if kind == "doc" else 0
+
+    def _bump(self, collection: str) -> None:
+        self._generations[collection] = self.generation(collection) + 1
+        self.invalidations += 1
+        # The new generation changes every ETag of the collection, so document versions can start over
+        for key in [k for k in self._doc_versions if k[0] == collection]:
+            del self._doc_versions[key]
+
+    def invalidate(self, collection: str, ids: Iterable[Any] = ()) -> None:
+        """Drop cached documents `ids` of `collection` and every cached list page of it."""
+        self._bump(collection)
+        for id in ids:
+            self._entries.pop(self.doc_key(collection, id), None)
+
+    def invalidate_collection(self, collection: str) -> None:
+        """Drop everything cached for `collection`, e.g. after it was dropped or events were lost."""
+        self._bump(collection)
+        for key in [k for k in self._entries if k[0] == collection]:
+            del self._entries[key]
+
+    def discard(self, collection: str, ids: Iterable[Any]) -> None:
+        """Drop cached documents `ids` of `collection`, keeping its list pages until they expire."""
+        self.lagging.add(collection)
+        for id in ids:
+            key = (collection, str(id))
+            self._doc_versions[key] = self._doc_versions.get(key, 0) + 1
+            self._entries.pop(self.doc_key(collection, id), None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        for collection in set(self._generations) | {key[0] for key in self._doc_versions}:
+            self._generations[collection] = self.generation(collection) + 1
+        self._doc_versions.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+read_cache = ReadThroughCache()
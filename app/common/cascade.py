@@ -0,0 +1,244 @@
+"""
+Cascade-aware bulk delete for brands and categories.
+
+Deleting a brand or category also pulls every reference to it:
+
+    brand     -> categories.brands, items.brandId
+    category  -> brands.categoryIdList, categories.subCategories,
+                 categories.categoryIdList, categories.rootCategoryId (children),
+                 items.categoryId, items.subCategoryId
+
+Items cannot lose their brand or category, so they follow the policy: "block"
+refuses the delete while any item references the ids, "reassign" points them
+at `reassign_to`. Child categories of a deleted category are detached to the
+top level and their subtree paths rewritten. Reassigned items move their item
+counters (app.common.item_counters) to `reassign_to` with $inc deltas written
+in the same transaction.
+
+All writes are compiled into one bulk_write per collection and run in a
+transaction (see app.common.transactions). Every reference filter is served by
+an index, so the dry run's blast radius is a handful of indexed counts.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorDatabase
+from pymongo import DeleteMany, UpdateMany, UpdateOne
+
+from app.common.cache import read_cache
+from app.common.category_tree import move_subtree_op
+from app.common.item_counters import ITEM_COUNTER_PROJECTION, ItemChange, apply_counter_changes, invalidate_counted
+from app.common.mongo_utils import to_object_id
+from app.common.references import known_references
+from app.common.transactions import run_batches, run_in_transaction
+from app.models.bulk import CascadeDeleteResponse, DeletePolicy
+
+# label -> (collection, filter)
+ReferenceFilters = Dict[str, Tuple[str, Dict[str, Any]]]
+
+
+def _both_forms(oids: List[ObjectId]) -> List[Any]:
+    # References are stored as strings by create and as ObjectIds by update
+    return oids + [str(oid) for oid in oids]
+
+
+def brand_references(oids: List[ObjectId]) -> ReferenceFilters:
+    strs = [str(oid) for oid in oids]
+    return {
+        "items.brandId": ("items", {"brandId": {"$in": strs}}),
+        "categories.brands": ("categories", {"brands.brandId": {"$in": _both_forms(oids)}}),
+    }
+
+
+def category_references(oids: List[ObjectId]) -> ReferenceFilters:
+    strs = [str(oid) for oid in oids]
+    refs = _both_forms(oids)
+    return {
+        "items.categoryId": ("items", {"categoryId": {"$in": strs}}),
+        "items.subCategoryId": ("items", {"subCategoryId": {"$in": strs}}),
+        "brands.categoryIdList": ("brands", {"categoryIdList.categoryId": {"$in": strs}}),
+        "categories.subCategories": (
+            "categories", {"subCategories.subCategoryId": {"$in": refs}, "_id": {"$nin": oids}}
+        ),
+        "categories.categoryIdList": (
+            "categories", {"categoryIdList.categoryId": {"$in": strs}, "_id": {"$nin": oids}}
+        ),
+        "categories.rootCategoryId": ("categories", {"rootCategoryId": {"$in": refs}, "_id": {"$nin": oids}}),
+    }
+
+
+def _item_ops(references: ReferenceFilters, reassign_to: Optional[str]) -> List[Any]:
+    if reassign_to is None:
+        return []
+    return [
+        UpdateMany(flt, {"$set": {label.split(".", 1)[1]: reassign_to}})
+        for label, (collection, flt) in references.items()
+        if collection == "items"
+    ]
+
+
+async def reassigned_item_changes(
+    db: AsyncIOMotorDatabase,
+    references: ReferenceFilters,
+    reassign_to: str,
+    session: Optional[AsyncIOMotorClientSession] = None,
+) -> List[ItemChange]:
+    """(before, after) of every item _item_ops reassigns, for its counter deltas."""
+    filters = {label.split(".", 1)[1]: flt for label, (collection, flt) in references.items() if collection == "items"}
+    changes: List[ItemChange] = []
+    async for item in db.items.find({"$or": list(filters.values())}, ITEM_COUNTER_PROJECTION, session=session):
+        after = dict(item)
+        for field, flt in filters.items():
+            if item.get(field) in flt[field]["$in"]:
+                after[field] = reassign_to
+        changes.append((item, after))
+    return changes
+
+
+def brand_delete_ops(
+    oids: List[ObjectId], reassign_to: Optional[str]
+) -> Dict[str, List[Any]]:
+    references = brand_references(oids)
+    refs = _both_forms(oids)
+    return {
+        "brands": [DeleteMany({"_id": {"$in": oids}})],
+        "categories": [
+            UpdateMany(references["categories.brands"][1], {"$pull": {"brands": {"brandId": {"$in": refs}}}}),
+        ],
+        "items": _item_ops(references, reassign_to),
+    }
+
+
+def category_delete_ops(
+    oids: List[ObjectId], children: List[Dict[str, Any]], reassign_to: Optional[str]
+) -> Dict[str, List[Any]]:
+    references = category_references(oids)
+    strs = [str(oid) for oid in oids]
+    category_ops: List[Any] = [
+        DeleteMany({"_id": {"$in": oids}}),
+        UpdateMany(
+            references["categories.subCategories"][1],
+            {"$pull": {"subCategories": {"subCategoryId": {"$in": _both_forms(oids)}}}},
+        ),
+        UpdateMany(
+            references["categories.categoryIdList"][1],
+            {"$pull": {"categoryIdList": {"categoryId": {"$in": strs}}}},
+        ),
+    ]
+    # Surviving children lose their parent: lift them to the top level with their subtrees
+    for child in children:
+        category_ops.append(UpdateOne({"_id": child["_id"]}, {"$set": {"rootCategoryId": None, "ancestors": []}}))
+        category_ops.append(move_subtree_op(child["_id"], list(child.get("ancestors") or []), []))
+    return {
+        "categories": category_ops,
+        "brands": [
+            UpdateMany(
+                references["brands.categoryIdList"][1],
+                {"$pull": {"categoryIdList": {"categoryId": {"$in": strs}}}},
+            ),
+        ],
+        "items": _item_ops(references, reassign_to),
+    }
+
+
+async def count_references(
+    db: AsyncIOMotorDatabase, references: ReferenceFilters, session: Optional[AsyncIOMotorClientSession] = None
+) -> Dict[str, int]:
+    labels = list(references)
+
+    async def count(label: str) -> int:
+        collection, flt = references[label]
+        return await db[collection].count_documents(flt, session=session)
+
+    if session is None:
+        counts = await asyncio.gather(*(count(label) for label in labels))
+    else:
+        counts = [await count(label) for label in labels]
+    return dict(zip(labels, counts))
+
+
+async def cascade_delete(
+    db: AsyncIOMotorDatabase,
+    collection: str,
+    ids: List[str],
+    *,
+    policy: DeletePolicy = "block",
+    reassign_to: Optional[str] = None,
+    dry_run: bool = False,
+) -> CascadeDeleteResponse:
+    """
+    Delete `ids` from "brands" or "categories" and pull every reference to them.
+    With dry_run nothing is written; the response reports what would be deleted and touched.
+    """
+    oids = list(dict.fromkeys(to_object_id(i) for i in ids))
+    references = brand_references(oids) if collection == "brands" else category_references(oids)
+    if policy == "reassign":
+        if not reassign_to:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="reassign_to is required with policy=reassign")
+        if to_object_id(reassign_to) in oids:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="reassign_to is being deleted")
+    else:
+        reassign_to = None
+
+    async def write(session: Optional[AsyncIOMotorClientSession]):
+        existing = await db[collection].find(
+            {"_id": {"$in": oids}}, {"_id": 1}, session=session
+        ).to_list(length=len(oids))
+        existing_ids = {doc["_id"] for doc in existing}
+        not_found = [i for i in ids if ObjectId(i) not in existing_ids]
+        counts = await count_references(db, references, session)
+        response = CascadeDeleteResponse(
+            requested=len(ids), deleted=len(existing_ids), not_found=not_found, dry_run=dry_run, references=counts
+        )
+        if dry_run:
+            return response, {}
+
+        item_refs = sum(n for label, n in counts.items() if label.startswith("items."))
+        if item_refs and reassign_to is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"{item_refs} item reference(s) to these {collection}; delete or reassign them first (policy=reassign)",
+            )
+        if reassign_to is not None and not await db[collection].find_one(
+            {"_id": to_object_id(reassign_to)}, {"_id": 1}, session=session
+        ):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"reassign_to not found: {reassign_to}")
+
+        if collection == "brands":
+            ops = brand_delete_ops(oids, reassign_to)
+        else:
+            children = []
+            if counts["categories.rootCategoryId"]:
+                children = await db.categories.find(
+                    references["categories.rootCategoryId"][1], {"ancestors": 1}, session=session
+                ).to_list(length=None)
+            ops = category_delete_ops(oids, children, reassign_to)
+        counter_changes: List[ItemChange] = []
+        if reassign_to is not None and item_refs:
+            counter_changes = await reassigned_item_changes(db, references, reassign_to, session)
+
+        # Only send batches whose filters matched something
+        touched = {label.split(".", 1)[0] for label, n in counts.items() if n} | {collection}
+        batches = [
+            (lambda name=name, batch=batch: db[name].bulk_write(batch, ordered=False, session=session))
+            for name, batch in ops.items()
+            if batch and name in touched
+        ]
+        results = await run_batches(session, *batches)
+        response.deleted = sum(result.deleted_count for result in results)
+        # The reassigned items now count towards reassign_to; $inc on the deleted documents matches nothing
+        counted = await apply_counter_changes(db, counter_changes, session)
+        return response, counted
+
+    response, counted = await run_in_transaction(db.client, write)
+
+    if not dry_run:
+        invalidate_counted(counted)
+        read_cache.invalidate(collection, oids)
+        known_references.discard(collection, oids)
+        # Referencing documents were detached or reassigned, which changes their collection's version
+        for collection_name in {label.split(".", 1)[0] for label, n in response.references.items() if n}:
+            read_cache.invalidate_collection(collection_name)
+    return response
@@ -0,0 +1,284 @@
+"""
+Category update with its inverse relations, as one transaction.
+
+update_category used to await up to nine reads and writes one after another.
+Here the category is updated first with find_one_and_update(BEFORE); the
+pre-image gives the brand / subcategory / parent diffs, which are compiled into
+one bulk_write per collection. The post-image is the pre-image with the $set
+applied, so nothing is read back.
+
+A move reads the new parent's path inside the same transaction that writes it.
+The move also writes the new parent (the $addToSet of the child) and the moved
+category, so two moves racing on the same nodes - A under B and B under A, or
+A under B while B itself moves - conflict, and with_transaction runs the loser
+again against the committed tree, where the cycle check or the fresh path
+applies. On a standalone server there is no transaction to give that
+guarantee.
+
+A subCategories edit is a move of each child whose parent changes: an added
+child leaves its old parent and takes this category's path, a dropped child is
+detached to the top level. rootCategoryId/ancestors stay the tree /tree and
+/descendants read, and subCategories keeps matching them.
+"""
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
+
+from app.common.cache import read_cache
+from app.common.category_tree import ancestors_for_move, move_subtree_op
+from app.common.item_counters import zero_counters
+from app.common.mongo_utils import to_object_id
+from app.common.transactions import run_batches, run_in_transaction
+from app.models.category import CreateCategory, UpdateCategory
+
+
+def _oid_or_none(value: Any) -> Optional[ObjectId]:
+    if isinstance(value, ObjectId):
+        return value
+    return ObjectId(value) if isinstance(value, str) and ObjectId.is_valid(value) else None
+
+
+def normalize_brand_oid_set(raw: Any) -> Set[ObjectId]:
+    """
+    Accept either:
+      - [ObjectId, ...]
+      - [{"brandId": <OID|str>}, ...]
+    Return a set of ObjectIds.
+    """
+    if not raw:
+        return set()
+    s: Set[ObjectId] = set()
+    for it in raw:
+        if isinstance(it, ObjectId):
+            s.add(it)
+        elif isinstance(it, dict) and "brandId" in it:
+            s.add(to_object_id(it["brandId"]))
+        else:
+            # tolerate stray strings
+            s.add(to_object_id(it))
+    return s
+
+
+def normalize_sub_oid_set(raw: Any) -> Set[ObjectId]:
+    """
+    Accept list like:
+      - [{"subCategoryId": <OID|str>}, ...]
+      - [{"categoryId": <OID|str>}, ...]  (written by older parent moves)
+      - [<OID|str>, ...]  (if you happened to store raw IDs)
+    Return a set of ObjectIds.
+    """
+    if not raw:
+        return set()
+    s: Set[ObjectId] = set()
+    for it in raw:
+        if isinstance(it, dict):
+            s.add(to_object_id(it.get("subCategoryId", it.get("categoryId"))))
+        else:
+            s.add(to_object_id(it))
+    return s
+
+
+def category_set_from_payload(payload: UpdateCategory) -> Dict[str, Any]:
+    """$set for the category document. Relation lists are only replaced when present in the payload."""
+    category_set: Dict[str, Any] = {}
+    if payload.categoryName is not None:
+        category_set["categoryName"] = payload.categoryName
+    if "brands" in payload.model_fields_set:
+        # Store brands as objects, the shape CategoryResponse expects
+        brand_oids = dict.fromkeys(to_object_id(b.brandId) for b in payload.brands)
+        category_set["brands"] = [{"brandId": oid} for oid in brand_oids]
+    if "subCategories" in payload.model_fields_set:
+        # Store subCategories as objects with ObjectId inside (works with the serializers)
+        sub_oids = dict.fromkeys(to_object_id(sub.subCategoryId) for sub in payload.subCategories)
+        category_set["subCategories"] = [{"subCategoryId": oid} for oid in sub_oids]
+    if payload.rootCategoryId is not None:
+        # Store root as ObjectId; "" detaches the category
+        category_set["rootCategoryId"] = to_object_id(payload.rootCategoryId) if payload.rootCategoryId else None
+    return category_set
+
+
+def category_doc_from_payload(payload: CreateCategory) -> Dict[str, Any]:
+    """New category document, with its relations stored as ObjectIds like category_set_from_payload stores them."""
+    doc: Dict[str, Any] = {
+        "categoryName": payload.categoryName,
+        "subCategories": [
+            {"subCategoryId": oid} for oid in dict.fromkeys(to_object_id(sub.subCategoryId) for sub in payload.subCategories)
+        ],
+        "brands": [{"brandId": oid} for oid in dict.fromkeys(to_object_id(b.brandId) for b in payload.brands)],
+        **zero_counters(),
+    }
+    if payload.rootCategoryId:
+        doc["rootCategoryId"] = to_object_id(payload.rootCategoryId)
+    return doc
+
+
+async def load_subcategory_moves(
+    categories: AsyncIOMotorCollection,
+    cat_id: ObjectId,
+    changes: Dict[str, Any],
+    session: Optional[AsyncIOMotorClientSession] = None,
+) -> Dict[ObjectId, Dict[str, Any]]:
+    """
+    The categories a subCategories edit may move - the requested children and the current ones -
+    with their parent and path. Rejects children that would create a cycle; 404 if one is missing.
+    """
+    new = [sub["subCategoryId"] for sub in changes["subCategories"]]
+    if cat_id in new:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A category cannot be its own subcategory")
+    if "ancestors" in changes:
+        own_ancestors = changes["ancestors"]
+    else:
+        own = await categories.find_one({"_id": cat_id}, {"ancestors": 1}, session=session)
+        if own is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+        own_ancestors = list(own.get("ancestors") or [])
+    if set(new) & set(own_ancestors):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot move a category under one of its own descendants",
+        )
+    docs = await categories.find(
+        {"$or": [{"_id": {"$in": new}}, {"rootCategoryId": {"$in": [cat_id, str(cat_id)]}}]},
+        {"rootCategoryId": 1, "ancestors": 1},
+        session=session,
+    ).to_list(length=None)
+    children = {doc["_id"]: doc for doc in docs}
+    missing = [oid for oid in new if oid not in children]
+    if missing:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Subcategory not found: {missing[0]}")
+    return children
+
+
+def _pull_child_op(parent_id: ObjectId, child_id: ObjectId) -> UpdateOne:
+    return UpdateOne(
+        {"_id": parent_id},
+        {"$pull": {"subCategories": {"$or": [
+            {"subCategoryId": {"$in": [child_id, str(child_id)]}},
+            {"categoryId": str(child_id)},
+        ]}}},
+    )
+
+
+def compile_relation_ops(
+    cat_id: ObjectId,
+    before: Dict[str, Any],
+    category_set: Dict[str, Any],
+    children: Optional[Mapping[ObjectId, Mapping[str, Any]]] = None,
+) -> Tuple[List[Any], List[Any], Dict[str, Set[ObjectId]], bool]:
+    """
+    Diff the pre-image against the $set and return
+    (category_ops, brand_ops, touched ids per collection, moved).
+    `children` is what load_subcategory_moves returned for a subCategories edit.
+    The category ops depend on each other and must be written in order.
+    """
+    category_ops: List[Any] = []
+    brand_ops: List[Any] = []
+    touched: Dict[str, Set[ObjectId]] = {"categories": {cat_id}, "brands": set()}
+    backref = {"categoryIdList": {"categoryId": str(cat_id)}}
+
+    # Brands: keep string categoryId in brand.categoryIdList for portability
+    if "brands" in category_set:
+        existing = normalize_brand_oid_set(before.get("brands", []))
+        new = {brand["brandId"] for brand in category_set["brands"]}
+        if new - existing:
+            brand_ops.append(UpdateMany({"_id": {"$in": list(new - existing)}}, {"$addToSet": backref}))
+        if existing - new:
+            brand_ops.append(UpdateMany({"_id": {"$in": list(existing - new)}}, {"$pull": backref}))
+        touched["brands"] |= new ^ existing
+
+    # SubCategories: mirror the same pattern (categoryIdList on subcategories)
+    if "subCategories" in category_set:
+        existing = normalize_sub_oid_set(before.get("subCategories", []))
+        new = {sub["subCategoryId"] for sub in category_set["subCategories"]}
+        if new - existing:
+            category_ops.append(UpdateMany({"_id": {"$in": list(new - existing)}}, {"$addToSet": backref}))
+        if existing - new:
+            category_ops.append(UpdateMany({"_id": {"$in": list(existing - new)}}, {"$pull": backref}))
+        touched["categories"] |= new ^ existing
+
+    # Root category parent: move this category between parents' children
+    moved = False
+    if "rootCategoryId" in category_set:
+        old_root = _oid_or_none(before.get("rootCategoryId"))
+        new_root = category_set["rootCategoryId"]
+        if old_root != new_root:
+            moved = True
+            if old_root:
+                category_ops.append(_pull_child_op(old_root, cat_id))
+            if new_root:
+                category_ops.append(UpdateOne({"_id": new_root}, {"$addToSet": {"subCategories": {"subCategoryId": cat_id}}}))
+            category_ops.append(
+                move_subtree_op(cat_id, list(before.get("ancestors") or []), category_set["ancestors"])
+            )
+
+    # SubCategories: move the children whose parent changes, after this category's own move above
+    if "subCategories" in category_set and children:
+        new = {sub["subCategoryId"] for sub in category_set["subCategories"]}
+        old_path = list(before.get("ancestors") or [])
+        own_path = category_set.get("ancestors", old_path)
+        for child_id, child in children.items():
+            parent = _oid_or_none(child.get("rootCategoryId"))
+            target = cat_id if child_id in new else None
+            if parent == target or (target is None and parent != cat_id):
+                continue
+            child_path = list(child.get("ancestors") or [])
+            if cat_id in child_path:
+                # Already rewritten by this category's own move
+                child_path = own_path + child_path[child_path.index(cat_id):]
+            child_new_path = own_path + [cat_id] if target else []
+            if parent is not None and parent != cat_id:
+                category_ops.append(_pull_child_op(parent, child_id))
+                touched["categories"].add(parent)
+            category_ops.append(
+                UpdateOne({"_id": child_id}, {"$set": {"rootCategoryId": target, "ancestors": child_new_path}})
+            )
+            category_ops.append(move_subtree_op(child_id, child_path, child_new_path))
+            touched["categories"].add(child_id)
+            moved = True
+    return category_ops, brand_ops, touched, moved
+
+
+async def update_category_relations(db: AsyncIOMotorDatabase, cat_id: ObjectId, payload: UpdateCategory) -> Dict[str, Any]:
+    """
+    Apply `payload` to category `cat_id` and sync the inverse relations atomically.
+    Returns the post-image of the category.
+    """
+    category_set = category_set_from_payload(payload)
+    if not category_set:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid fields to update")
+
+    async def write(session: Optional[AsyncIOMotorClientSession]):
+        # May run more than once: build this attempt's $set without touching category_set
+        changes = dict(category_set)
+        if "rootCategoryId" in changes:
+            # Validates the new parent and rejects cycles before anything is written
+            changes["ancestors"] = await ancestors_for_move(db.categories, cat_id, changes["rootCategoryId"], session)
+        children = None
+        if "subCategories" in changes:
+            children = await load_subcategory_moves(db.categories, cat_id, changes, session)
+        before = await db.categories.find_one_and_update(
+            {"_id": cat_id}, {"$set": changes}, return_document=ReturnDocument.BEFORE, session=session
+        )
+        if before is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+        category_ops, brand_ops, touched, moved = compile_relation_ops(cat_id, before, changes, children)
+        batches = []
+        if category_ops:
+            batches.append(lambda: db.categories.bulk_write(category_ops, session=session))
+        if brand_ops:
+            batches.append(lambda: db.brands.bulk_write(brand_ops, ordered=False, session=session))
+        await run_batches(session, *batches)
+        return {**before, **changes}, touched, moved
+
+    updated, touched, moved = await run_in_transaction(db.client, write)
+
+    read_cache.invalidate("brands", touched["brands"])
+    if moved:
+        # Every descendant's path changed too
+        read_cache.invalidate_collection("categories")
+    else:
+        read_cache.invalidate("categories", touched["categories"])
+    return updated
@@ -0,0 +1,157 @@
+"""
+Materialized category tree.
+
+Every category stores `ancestors`: the ObjectIds of its parents from the top
+of the tree down to its direct parent (rootCategoryId). With the multikey
+index on `ancestors`, a whole subtree is one indexed query, and moving a node
+rewrites its descendants' paths with one update_many (move_subtree_op).
+
+    python -m app.common.category_tree rebuild   # backfill ancestors from rootCategoryId
+"""
+import asyncio
+import sys
+from typing import Any, Dict, List, Mapping, Optional
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorCollection
+from pymongo import UpdateMany, UpdateOne
+
+# Deeper than any real catalog; bounds the $slice in move_subtree_op
+MAX_DEPTH = 1000
+
+
+def _as_oid(value: Any) -> Optional[ObjectId]:
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+
+async def ancestors_for_parent(
+    categories: AsyncIOMotorCollection, parent_id: ObjectId, session: Optional[AsyncIOMotorClientSession] = None
+) -> List[ObjectId]:
+    """Path a child of `parent_id` gets. 404 if the parent does not exist."""
+    parent = await categories.find_one({"_id": parent_id}, {"ancestors": 1}, session=session)
+    if not parent:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Root Category not found")
+    return list(parent.get("ancestors") or []) + [parent_id]
+
+
+async def ancestors_for_move(
+    categories: AsyncIOMotorCollection,
+    category_id: ObjectId,
+    new_parent_id: Optional[ObjectId],
+    session: Optional[AsyncIOMotorClientSession] = None,
+) -> List[ObjectId]:
+    """
+    Path `category_id` gets under `new_parent_id`, rejecting moves that would create a cycle.
+    Pass the session of the transaction that writes the path, so the check and the write see the same tree.
+    """
+    if new_parent_id is None:
+        return []
+    if new_parent_id == category_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="A category cannot be its own parent")
+    ancestors = await ancestors_for_parent(categories, new_parent_id, session)
+    if category_id in ancestors:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot move a category under one of its own descendants",
+        )
+    return ancestors
+
+
+def move_subtree_op(category_id: ObjectId, old_ancestors: List[ObjectId], new_ancestors: List[ObjectId]) -> UpdateMany:
+    """
+    Rewrite the path prefix of every descendant of `category_id` in a single update_many:
+    the first len(old_ancestors) + 1 entries (old path + the node itself) are replaced.
+    """
+    prefix = new_ancestors + [category_id]
+    return UpdateMany(
+        {"ancestors": category_id},
+        [{"$set": {"ancestors": {"$concatArrays": [
+            {"$literal": prefix},
+            {"$slice": ["$ancestors", len(old_ancestors) + 1, MAX_DEPTH]},
+        ]}}}],
+    )
+
+
+def parent_of(doc: Mapping[str, Any]) -> Optional[str]:
+    ancestors = doc.get("ancestors")
+    if ancestors:
+        return str(ancestors[-1])
+    root = _as_oid(doc.get("rootCategoryId"))
+    return str(root) if root else None
+
+
+def build_tree(docs: List[Mapping[str, Any]]) -> List[Dict[str, Any]]:
+    """Nest a flat list of categories into [{_id, categoryName, children: [...]}, ...] in one pass."""
+    nodes = {
+        str(doc["_id"]): {"_id": str(doc["_id"]), "categoryName": doc.get("categoryName"), "children": []}
+        for doc in docs
+    }
+    roots: List[Dict[str, Any]] = []
+    for doc in docs:
+        node = nodes[str(doc["_id"])]
+        parent = nodes.get(parent_of(doc) or "")
+        # Orphans (parent deleted) are shown at the top level
+        (parent["children"] if parent is not None and parent is not node else roots).append(node)
+    return roots
+
+
+async def load_tree(categories: AsyncIOMotorCollection) -> List[Dict[str, Any]]:
+    docs = await categories.find({}, {"categoryName": 1, "ancestors": 1, "rootCategoryId": 1}).to_list(length=None)
+    return build_tree(docs)
+
+
+async def rebuild_paths(categories: AsyncIOMotorCollection) -> int:
+    """
+    Recompute `ancestors` for every category from rootCategoryId, in memory, and write the
+    changed ones back with one bulk_write. Nodes caught in a cycle are cut loose as roots.
+    Returns the number of categories updated.
+    """
+    docs = await categories.find({}, {"rootCategoryId": 1, "ancestors": 1}).to_list(length=None)
+    parents = {doc["_id"]: _as_oid(doc.get("rootCategoryId")) for doc in docs}
+    paths: Dict[ObjectId, List[ObjectId]] = {}
+
+    for start in parents:
+        chain: List[ObjectId] = []
+        node: Optional[ObjectId] = start
+        seen = set()
+        while node is not None and node not in paths:
+            if node in seen:
+                # Cycle: treat the repeated node as a root so the walk terminates
+                paths[node] = []
+                break
+            seen.add(node)
+            chain.append(node)
+            node = parents.get(node)
+        for current in reversed(chain):
+            if current in paths:
+                continue
+            parent = parents.get(current)
+            paths[current] = (paths[parent] + [parent]) if parent in paths and parent in parents else []
+
+    ops = [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {"ancestors": paths[doc["_id"]]}})
+        for doc in docs
+        if list(doc.get("ancestors") or []) != paths[doc["_id"]]
+    ]
+    if ops:
+        await categories.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+async def _main(command: str) -> int:
+    from app.db import db
+
+    if command == "rebuild":
+        print(f"updated {await rebuild_paths(db.categories)} categories")
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "")))
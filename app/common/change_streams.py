@@ -0,0 +1,135 @@
+"""
+Keeps the per-process read cache coherent across uvicorn workers.
+
+Each worker tails MongoDB change streams on the cached collections and drops
+the affected cache entries as soon as any worker (or any other client) writes.
+Change streams need a replica set; a local single-node one is enough:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval 'rs.initiate()'
+    MONGOOSE_CONNECTION=mongodb://localhost:27017/?replicaSet=rs0
+"""
+import asyncio
+import logging
+from typing import Any, Dict, Iterable, Mapping
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.common.cache import ReadThroughCache
+from app.common.item_counters import COUNTER_FIELDS
+from app.common.references import known_references
+from app.settings import get_app_settings
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = ("items", "brands", "categories")
+
+# Server error codes meaning the stream can never work / cannot resume
+_CHANGE_STREAMS_UNSUPPORTED = {40573}
+_RESUME_TOKEN_LOST = {136, 280, 286}
+
+_DOCUMENT_EVENTS = {"insert", "update", "replace", "delete"}
+_COLLECTION_EVENTS = {"drop", "rename", "dropDatabase", "invalidate"}
+
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class CacheInvalidationWatcher:
+    """Background tasks turning change events into ReadThroughCache invalidations."""
+
+    def __init__(
+        self,
+        database: AsyncIOMotorDatabase,
+        cache: ReadThroughCache,
+        collections: Iterable[str] = WATCHED_COLLECTIONS,
+    ):
+        self.database = database
+        self.cache = cache
+        self.collections = tuple(collections)
+        self.resume_tokens: Dict[str, Mapping[str, Any] | None] = {name: None for name in self.collections}
+        self.events_applied = 0
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [
+            asyncio.create_task(self._watch(name), name=f"change-stream:{name}") for name in self.collections
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def apply(self, collection: str, change: Mapping[str, Any]) -> None:
+        op = change.get("operationType")
+        if _counters_only(change):
+            # Item writes move the counters of their brand and categories; list pages may show them one TTL late
+            self.cache.discard(collection, [change["documentKey"]["_id"]])
+        elif op in _DOCUMENT_EVENTS:
+            self.cache.invalidate(collection, [change["documentKey"]["_id"]])
+            if op == "delete":
+                known_references.discard(collection, [change["documentKey"]["_id"]])
+        elif op in _COLLECTION_EVENTS:
+            self.cache.invalidate_collection(collection)
+            known_references.clear(collection)
+        self.events_applied += 1
+
+    async def _watch(self, collection: str) -> None:
+        backoff = 0.5
+        while True:
+            token = self.resume_tokens[collection]
+            try:
+                async with self.database[collection].watch(resume_after=token) as stream:
+                    backoff = 0.5
+                    self.cache.watched.add(collection)
+                    async for change in stream:
+                        self.apply(collection, change)
+                        self.resume_tokens[collection] = stream.resume_token
+                        if change.get("operationType") == "invalidate":
+                            # An invalidated stream cannot be resumed, start over
+                            self.resume_tokens[collection] = None
+                            break
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as error:
+                if error.code in _CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning("Change streams unavailable, %s cache is not shared across workers: %s",
+                                   collection, error)
+                    return
+                if error.code in _RESUME_TOKEN_LOST:
+                    self.resume_tokens[collection] = None
+                self._on_gap(collection, error)
+            except Exception as error:
+                # Network errors, a closed client, a bug in apply(): none of them may end the watcher for good
+                self._on_gap(collection, error)
+            else:
+                continue
+            finally:
+                self.cache.watched.discard(collection)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_BACKOFF_SECONDS)
+
+    def _on_gap(self, collection: str, error: Exception) -> None:
+        """Without a resume token, events may have been missed while reconnecting."""
+        # Driver errors are routine (failover, network); anything else gets its traceback
+        logger.warning(
+            "Change stream on %s interrupted: %s", collection, error,
+            exc_info=None if isinstance(error, PyMongoError) else error,
+        )
+        if self.resume_tokens[collection] is None:
+            self.cache.invalidate_collection(collection)
+            known_references.clear(collection)
+
+
+def _counters_only(change: Mapping[str, Any]) -> bool:
+    if change.get("operationType") != "update":
+        return False
+    description = change.get("updateDescription") or {}
+    updated = description.get("updatedFields") or {}
+    return bool(updated) and not description.get("removedFields") and all(f in COUNTER_FIELDS for f in updated)
+
+
+def change_streams_enabled() -> bool:
+    return get_app_settings().cache_change_streams
@@ -0,0 +1,180 @@
+"""
+gzip / brotli response compression.
+
+A pure ASGI middleware, so it also handles the streamed exports: one-shot
+bodies below `minimum_size` are sent as they are, streamed bodies are
+compressed chunk by chunk and flushed so rows still reach the client as they
+are produced. Brotli is used when the `brotli` package is installed and the
+client accepts it; otherwise gzip.
+
+A compressed body is a different representation, so a strong ETag gets the
+encoding appended ("abc" -> "abc-gzip"); app.common.etag strips it again when
+comparing If-None-Match. A 304 has no body to compress, so it gets the suffix
+when the client's If-None-Match holds the compressed representation for the
+negotiated encoding: the 304 names the same ETag as the 200 it revalidates.
+"""
+import zlib
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.settings import get_app_settings
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+ETAG_ENCODING_SUFFIXES = ("-br", "-gzip")
+
+_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/xml", "application/javascript")
+
+
+def compression_minimum_size() -> int:
+    return get_app_settings().compression_min_size
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Pick "br" or "gzip" from an Accept-Encoding header, honouring q=0."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str, gzip_level: int, brotli_quality: int):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self.compress: Callable[[bytes], bytes] = self._compressor.process
+            self.flush: Callable[[], bytes] = self._compressor.flush
+            self.finish: Callable[[], bytes] = self._compressor.finish
+        else:
+            # wbits=31: gzip container
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+            self.compress = self._compressor.compress
+            self.flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.finish = self._compressor.flush
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: Optional[int] = None, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = compression_minimum_size() if minimum_size is None else minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"accept-encoding"), "")
+        encoding = negotiate(accept) if accept else None
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        suffix = f"-{encoding}".encode()
+        if_none_match = next((v for k, v in scope["headers"] if k == b"if-none-match"), b"")
+
+        start_message: Optional[dict] = None
+        compressor: Optional[_Compressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                if message["status"] == 304 and if_none_match:
+                    headers = _Headers(message["headers"])
+                    if headers.held_compressed(if_none_match, suffix):
+                        headers.add_vary(b"Accept-Encoding")
+                        headers.suffix_etag(suffix)
+                        message = {**message, "headers": headers.raw}
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                headers = _Headers(start_message["headers"])
+                if not self._should_compress(start_message["status"], headers, body, more_body):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding, self.gzip_level, self.brotli_quality)
+                headers.set(b"content-encoding", encoding.encode())
+                headers.add_vary(b"Accept-Encoding")
+                headers.suffix_etag(f"-{encoding}".encode())
+                if more_body:
+                    headers.remove(b"content-length")
+                    await send({**start_message, "headers": headers.raw})
+                else:
+                    compressed = compressor.compress(body) + compressor.finish()
+                    headers.set(b"content-length", str(len(compressed)).encode())
+                    await send({**start_message, "headers": headers.raw})
+                    await send({"type": "http.response.body", "body": compressed})
+                    return
+
+            if more_body:
+                chunk = compressor.compress(body) + compressor.flush()
+                if chunk:
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.compress(body) + compressor.finish()})
+
+        await self.app(scope, receive, send_wrapper)
+
+    def _should_compress(self, status: int, headers: "_Headers", body: bytes, more_body: bool) -> bool:
+        if status < 200 or status in (204, 304) or headers.get(b"content-encoding"):
+            return False
+        content_type = (headers.get(b"content-type") or b"").decode("latin-1").lower()
+        if not content_type.startswith(_COMPRESSIBLE_TYPES):
+            return False
+        # Streamed bodies are usually large (exports); one-shot ones must reach the threshold
+        return more_body or len(body) >= self.minimum_size
+
+
+class _Headers:
+    """Minimal mutable view over ASGI raw headers (list of (name, value) byte pairs)."""
+
+    def __init__(self, raw: List[Tuple[bytes, bytes]]):
+        self.raw = list(raw)
+
+    def get(self, name: bytes) -> Optional[bytes]:
+        return next((v for k, v in self.raw if k.lower() == name), None)
+
+    def remove(self, name: bytes):
+        self.raw = [(k, v) for k, v in self.raw if k.lower() != name]
+
+    def set(self, name: bytes, value: bytes):
+        self.remove(name)
+        self.raw.append((name, value))
+
+    def add_vary(self, value: bytes):
+        vary = self.get(b"vary")
+        self.set(b"vary", value if not vary else vary + b", " + value)
+
+    def held_compressed(self, if_none_match: bytes, suffix: bytes) -> bool:
+        """Whether If-None-Match lists this response's ETag with the encoding `suffix`."""
+        etag = self.get(b"etag")
+        if not etag or not etag.endswith(b'"'):
+            return False
+        held = {tag.strip().removeprefix(b"W/") for tag in if_none_match.split(b",")}
+        return etag[:-1] + suffix + b'"' in held
+
+    def suffix_etag(self, suffix: bytes):
+        etag = self.get(b"etag")
+        if etag and etag.startswith(b'"') and etag.endswith(b'"'):
+            self.set(b"etag", etag[:-1] + suffix + b'"')
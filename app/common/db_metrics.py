@@ -0,0 +1,142 @@
+"""
+PyMongo event listeners that keep connection pool and command metrics.
+
+The driver calls listeners synchronously from whatever thread runs the
+operation (Motor uses a thread pool), so every update takes a lock and does
+constant work. `snapshot()` returns plain dicts for the health endpoint.
+"""
+import threading
+from typing import Any, Dict, Tuple
+
+from pymongo import monitoring
+
+from app.common.metrics import Histogram
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Per server: pool size, connections checked out (saturation) and checkout wait times."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools: Dict[str, Dict[str, Any]] = {}
+
+    def _pool(self, address) -> Dict[str, Any]:
+        key = "%s:%s" % address
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "max_pool_size": None,
+                "open": 0,
+                "checked_out": 0,
+                "peak_checked_out": 0,
+                "checkout_failed": 0,
+                "cleared": 0,
+                "checkout_wait": Histogram(),
+            }
+        return pool
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)["max_pool_size"] = event.options.get("maxPoolSize")
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address)["cleared"] += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop("%s:%s" % event.address, None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event.address)["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["open"] = max(0, pool["open"] - 1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._pool(event.address)["checkout_failed"] += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checked_out"] += 1
+            pool["peak_checked_out"] = max(pool["peak_checked_out"], pool["checked_out"])
+            # `duration` (seconds, time spent waiting for the connection) exists since PyMongo 4.7
+            duration = getattr(event, "duration", None)
+            if duration is not None:
+                pool["checkout_wait"].observe(duration * 1000)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checked_out"] = max(0, pool["checked_out"] - 1)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            address: {**pool, "checkout_wait": pool["checkout_wait"].as_dict()}
+            for address, pool in self.state().items()
+        }
+
+    def state(self) -> Dict[str, Dict[str, Any]]:
+        """Copy of the per-server gauges, with saturation, and the checkout wait histogram in ms."""
+        with self._lock:
+            out = {}
+            for key, pool in self._pools.items():
+                max_size = pool["max_pool_size"]
+                out[key] = {
+                    **pool,
+                    "saturation": round(pool["checked_out"] / max_size, 4) if max_size else None,
+                    "checkout_wait": pool["checkout_wait"].copy(),
+                }
+            return out
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Latency and failures per command name (find, aggregate, bulkWrite, ...)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency: Dict[str, Histogram] = {}
+        self._failures: Dict[str, int] = {}
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        with self._lock:
+            stats = self._latency.get(event.command_name)
+            if stats is None:
+                stats = self._latency[event.command_name] = Histogram()
+            stats.observe(event.duration_micros / 1000)
+
+    def failed(self, event):
+        with self._lock:
+            self._failures[event.command_name] = self._failures.get(event.command_name, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: {**histogram.as_dict(), "failed": failed} for name, (histogram, failed) in self.state().items()}
+
+    def state(self) -> Dict[str, Tuple[Histogram, int]]:
+        """Copy of (latency histogram in ms, failures) per command name."""
+        with self._lock:
+            names = sorted(set(self._latency) | set(self._failures))
+            return {
+                name: (self._latency.get(name, Histogram()).copy(), self._failures.get(name, 0)) for name in names
+            }
+
+
+pool_metrics = PoolMetrics()
+command_metrics = CommandMetrics()
@@ -0,0 +1,66 @@
+"""
+Strong ETags for catalog reads, derived from per-collection versions.
+
+The version of a collection is its ReadThroughCache generation, bumped by every
+write this process makes and by change-stream events for writes made elsewhere.
+The ETag of a read is (process id, versions of every collection it reads,
+digest of the request parameters), so If-None-Match can be answered with a 304
+before Mongo or the serializer are touched.
+
+The process id keeps ETags of different workers apart: their generation
+counters are unrelated. For a collection without a live change stream this
+process cannot see other workers' writes, so its version also carries the
+cache TTL window: such ETags stop matching after at most one TTL, the same
+staleness bound the read cache has. So does the version of a collection whose
+list pages may lag (ReadThroughCache.discard); single-document reads also
+carry ReadThroughCache.doc_version, so they change as soon as the document does.
+"""
+import hashlib
+import os
+import time
+from typing import Hashable, Iterable, Optional
+
+from fastapi import Request, Response, status
+
+from app.common.cache import ReadThroughCache, read_cache
+from app.common.compression import ETAG_ENCODING_SUFFIXES
+
+PROCESS_ID = os.urandom(4).hex()
+
+
+def collection_version(collection: str, cache: ReadThroughCache = read_cache) -> str:
+    version = str(cache.generation(collection))
+    if (collection not in cache.watched or collection in cache.lagging) and cache.ttl > 0:
+        version += f"w{int(time.time() // cache.ttl)}"
+    return version
+
+
+def make_etag(collections: Iterable[str], *parts: Hashable) -> str:
+    versions = ".".join(f"{c}{collection_version(c)}" for c in sorted(set(collections)))
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).hexdigest()
+    return f'"{PROCESS_ID}-{hashlib.blake2b(versions.encode(), digest_size=6).hexdigest()}-{digest}"'
+
+
+def _normalize(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    for suffix in ETAG_ENCODING_SUFFIXES:
+        if tag.endswith(suffix + '"'):
+            return tag[: -len(suffix) - 1] + '"'
+    return tag
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """A 304 response if the request's If-None-Match matches `etag`, else None."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    if header.strip() == "*" or etag in {_normalize(tag) for tag in header.split(",")}:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+    return None
+
+
+def etag_headers(etag: str) -> dict:
+    # no-cache: clients may store the response but must revalidate it, which is a cheap 304
+    return {"ETag": etag, "Cache-Control": "no-cache"}
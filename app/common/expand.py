@@ -0,0 +1,134 @@
+from typing import Any, Dict, Iterable, List, Mapping
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pydantic import BaseModel, ConfigDict
+
+from app.common.raw_json import decode_json_native, raw_collection
+
+
+class Expansion(BaseModel):
+    """How to resolve one `expand=` name: the field holding the reference(s) and where they point."""
+    model_config = ConfigDict(frozen=True)
+    field: str
+    collection: str
+    # For list fields holding objects, e.g. [{"categoryId": ...}]
+    key: str | None = None
+    projection: Dict[str, int] | None = None
+
+
+def parse_expand(expand: str | None, allowed: Mapping[str, Expansion]) -> List[str]:
+    if not expand:
+        return []
+    names = list(dict.fromkeys(n.strip() for n in expand.split(",") if n.strip()))
+    bad = [n for n in names if n not in allowed]
+    if bad:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot expand {', '.join(bad)}. Allowed: {', '.join(allowed)}",
+        )
+    return names
+
+
+def expanded_collections(names: List[str], allowed: Mapping[str, Expansion]) -> List[str]:
+    """Collections read by the given expansions, e.g. for versioning a response that includes them."""
+    return list(dict.fromkeys(allowed[n].collection for n in names))
+
+
+def _reference_ids(value: Any, key: str | None) -> List[str]:
+    """Ids referenced by a field value: "id", {"key": "id"} or a list of either."""
+    if isinstance(value, list):
+        return [i for v in value for i in _reference_ids(v, key)]
+    if isinstance(value, dict):
+        value = value.get(key) if key else None
+    return [value] if isinstance(value, str) and ObjectId.is_valid(value) else []
+
+
+class ReferenceLoader:
+    """
+    Request-scoped batch loader. Ids are collected for the whole page and every collection
+    is fetched once with a single $in query; documents already loaded are not fetched again.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.db = db
+        self.loaded: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.queries = 0
+
+    async def load(self, collection: str, ids: Iterable[str], projection: Dict[str, int] | None = None):
+        known = self.loaded.setdefault(collection, {})
+        missing = [ObjectId(i) for i in dict.fromkeys(ids) if i not in known]
+        if not missing:
+            return known
+        self.queries += 1
+        docs = await raw_collection(self.db[collection]).find({"_id": {"$in": missing}}, projection).to_list(
+            length=len(missing)
+        )
+        for doc in docs:
+            decoded = decode_json_native(doc)
+            known[decoded["_id"]] = decoded
+        return known
+
+    async def expand(
+        self, docs: List[Dict[str, Any]], names: List[str], expansions: Mapping[str, Expansion]
+    ) -> List[Dict[str, Any]]:
+        """
+        Return shallow copies of `docs` with each requested expansion resolved under its name:
+        a document (or None) for a single reference, a list of documents for a list of references.
+        The input docs are left untouched since they may come from the read cache.
+        """
+        if not names or not docs:
+            return docs
+        wanted: Dict[str, List[str]] = {}
+        projections: Dict[str, Dict[str, int] | None] = {}
+        for name in names:
+            spec = expansions[name]
+            ids = wanted.setdefault(spec.collection, [])
+            for doc in docs:
+                ids += _reference_ids(doc.get(spec.field), spec.key)
+            # Different expansions on the same collection share one query, so only keep a projection if all agree
+            projections[spec.collection] = (
+                spec.projection if projections.get(spec.collection, spec.projection) == spec.projection else None
+            )
+        for collection, ids in wanted.items():
+            await self.load(collection, ids, projections[collection])
+
+        out = []
+        for doc in docs:
+            expanded = dict(doc)
+            for name in names:
+                spec = expansions[name]
+                known = self.loaded.get(spec.collection, {})
+                value = doc.get(spec.field)
+                if isinstance(value, list):
+                    expanded[name] = [known[i] for i in _reference_ids(value, spec.key) if i in known]
+                else:
+                    ids = _reference_ids(value, spec.key)
+                    expanded[name] = known.get(ids[0]) if ids else None
+            out.append(expanded)
+        return out
+
+
+BRAND_SUMMARY = {"brandName": 1, "brandSymbol": 1, "brandIcon": 1}
+CATEGORY_SUMMARY = {"categoryName": 1, "rootCategoryId": 1}
+
+ITEM_EXPANSIONS: Dict[str, Expansion] = {
+    "brand": Expansion(field="brandId", collection="brands", projection=BRAND_SUMMARY),
+    "category": Expansion(field="categoryId", collection="categories", projection=CATEGORY_SUMMARY),
+    "subCategory": Expansion(field="subCategoryId", collection="categories", projection=CATEGORY_SUMMARY),
+}
+
+BRAND_EXPANSIONS: Dict[str, Expansion] = {
+    "categories": Expansion(
+        field="categoryIdList", key="categoryId", collection="categories", projection=CATEGORY_SUMMARY
+    ),
+}
+
+CATEGORY_EXPANSIONS: Dict[str, Expansion] = {
+    "brands": Expansion(field="brands", key="brandId", collection="brands", projection=BRAND_SUMMARY),
+    "subCategories": Expansion(
+        field="subCategories", key="subCategoryId", collection="categories", projection=CATEGORY_SUMMARY
+    ),
+    "rootCategory": Expansion(field="rootCategoryId", collection="categories", projection=CATEGORY_SUMMARY),
+}
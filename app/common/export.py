@@ -0,0 +1,76 @@
+from typing import Any, AsyncIterator, Callable, Dict, List, Literal
+
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorCursor
+
+from app.common.mongo_utils import serialize_document
+from app.common.responses import dumps
+
+ExportFormat = Literal["ndjson", "json"]
+Serializer = Callable[[Dict[str, Any]], Dict[str, Any]]
+
+EXPORT_BATCH_SIZE = 500
+# Number of documents rendered before a chunk is flushed to the client
+FLUSH_EVERY = 100
+
+MEDIA_TYPES: Dict[str, str] = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+
+
+def _dumps(doc: Dict[str, Any], serializer: Serializer) -> bytes:
+    return dumps(serializer(doc))
+
+
+async def iter_ndjson(cursor: AsyncIOMotorCursor, serializer: Serializer = serialize_document) -> AsyncIterator[bytes]:
+    """Yield one JSON document per line, flushing every FLUSH_EVERY documents."""
+    buf: List[bytes] = []
+    async for doc in cursor:
+        buf.append(_dumps(doc, serializer))
+        if len(buf) >= FLUSH_EVERY:
+            yield b"\n".join(buf) + b"\n"
+            buf.clear()
+    if buf:
+        yield b"\n".join(buf) + b"\n"
+
+
+async def iter_json_array(cursor: AsyncIOMotorCursor, serializer: Serializer = serialize_document) -> AsyncIterator[bytes]:
+    """Yield a single JSON array, element by element, without materializing it."""
+    yield b"["
+    buf: List[bytes] = []
+    first = True
+    async for doc in cursor:
+        buf.append(_dumps(doc, serializer))
+        if len(buf) >= FLUSH_EVERY:
+            chunk = b",".join(buf)
+            yield chunk if first else b"," + chunk
+            first = False
+            buf.clear()
+    if buf:
+        chunk = b",".join(buf)
+        yield chunk if first else b"," + chunk
+    yield b"]"
+
+
+def export_response(
+    collection: AsyncIOMotorCollection,
+    fmt: ExportFormat,
+    *,
+    filename: str,
+    query: Dict[str, Any] | None = None,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    serializer: Serializer = serialize_document,
+) -> StreamingResponse:
+    """
+    Stream every document of `collection` matching `query`, in _id order.
+    Documents are serialized as they come off the Motor cursor, so memory stays
+    bounded by one batch regardless of the collection size.
+    """
+    cursor = collection.find(query or {}).sort("_id", 1).batch_size(batch_size)
+    body = iter_ndjson(cursor, serializer) if fmt == "ndjson" else iter_json_array(cursor, serializer)
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
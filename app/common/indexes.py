@@ -0,0 +1,116 @@
+"""
+Create and check the indexes declared in app.models.indexes.
+
+    python -m app.common.indexes ensure    # create missing indexes
+    python -m app.common.indexes drift     # exit 1 if declared and actual indexes differ
+    python -m app.common.indexes explain   # exit 1 if a registered query pattern does a COLLSCAN
+"""
+import asyncio
+import logging
+import sys
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import IndexModel
+
+from app.models.indexes import INDEXES, QUERY_PATTERNS, IndexSpec, QueryPattern
+from app.settings import get_app_settings
+
+logger = logging.getLogger(__name__)
+
+
+def _by_collection(specs: Iterable[IndexSpec]) -> Dict[str, List[IndexSpec]]:
+    grouped: Dict[str, List[IndexSpec]] = defaultdict(list)
+    for spec in specs:
+        grouped[spec.collection].append(spec)
+    return grouped
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase, specs: Iterable[IndexSpec] = INDEXES) -> List[str]:
+    """Create every declared index, one create_indexes call per collection. Existing ones are a no-op."""
+    created: List[str] = []
+    for collection, group in _by_collection(specs).items():
+        models = [IndexModel(list(spec.keys), name=spec.name, unique=spec.unique) for spec in group]
+        created += await db[collection].create_indexes(models)
+    return created
+
+
+async def index_drift(db: AsyncIOMotorDatabase, specs: Iterable[IndexSpec] = INDEXES) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Compare declared indexes with the ones on the server, per collection:
+    missing (declared, absent), mismatched (same name, other keys/options) and undeclared.
+    Collections without drift are left out.
+    """
+    report: Dict[str, Dict[str, List[str]]] = {}
+    for collection, group in _by_collection(specs).items():
+        actual = await db[collection].index_information()
+        actual.pop("_id_", None)
+        declared = {spec.name: spec for spec in group}
+        missing = [name for name in declared if name not in actual]
+        mismatched = [
+            name for name, spec in declared.items()
+            if name in actual and (
+                tuple((k, int(d)) for k, d in actual[name]["key"]) != spec.keys
+                or bool(actual[name].get("unique", False)) != spec.unique
+            )
+        ]
+        undeclared = [name for name in actual if name not in declared]
+        if missing or mismatched or undeclared:
+            report[collection] = {"missing": missing, "mismatched": mismatched, "undeclared": undeclared}
+    return report
+
+
+def _plan_stages(plan: Any) -> Iterable[str]:
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+
+async def explain_pattern(db: AsyncIOMotorDatabase, pattern: QueryPattern) -> List[str]:
+    """Stages of the winning plan the server picks for `pattern`."""
+    find: Dict[str, Any] = {"find": pattern.collection, "filter": pattern.filter}
+    if pattern.sort:
+        find["sort"] = dict(pattern.sort)
+    result = await db.command({"explain": find, "verbosity": "queryPlanner"})
+    return list(_plan_stages(result["queryPlanner"]["winningPlan"]))
+
+
+async def collscan_patterns(
+    db: AsyncIOMotorDatabase, patterns: Iterable[QueryPattern] = QUERY_PATTERNS
+) -> List[QueryPattern]:
+    """Registered query patterns whose winning plan scans the whole collection."""
+    return [pattern for pattern in patterns if "COLLSCAN" in await explain_pattern(db, pattern)]
+
+
+def ensure_indexes_on_startup() -> bool:
+    return get_app_settings().ensure_indexes
+
+
+async def _main(command: str) -> int:
+    from app.db import db
+
+    if command == "ensure":
+        print("\n".join(await ensure_indexes(db)) or "nothing to create")
+        return 0
+    if command == "drift":
+        report = await index_drift(db)
+        for collection, drift in report.items():
+            print(collection, drift)
+        return 1 if report else 0
+    if command == "explain":
+        bad = await collscan_patterns(db)
+        for pattern in bad:
+            print(f"COLLSCAN: {pattern.collection} filter={pattern.filter} sort={pattern.sort}")
+        return 1 if bad else 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "")))
@@ -0,0 +1,446 @@
+"""
+Denormalized item counters on brands and categories.
+
+Every brand and category document carries
+
+    itemCount        items referencing it
+    totalStock       sum of their quantity
+    inventoryValue   sum of their price * quantity
+
+so "how many items does this brand have" is a single document read. A
+category counts the items whose categoryId or subCategoryId is that category,
+each item once.
+
+Item writes keep the counters current with $inc deltas computed from the
+item's before and after state (counter_changes_ops):
+
+- create, update and delete of a single item run the item write and the
+  counter bulk_writes in one transaction (see app.common.transactions);
+- the bulk endpoints do the same per chunk (write_counted_chunk): the before
+  images, the chunk's bulk write and its deltas share one transaction. A
+  write error aborts a transaction, so a chunk with failing rows is written
+  again without them. On a standalone server there are no transactions: the
+  deltas follow the write, and a concurrent writer can make them drift.
+
+A counter change only drops the brand and category documents it touched from
+the read cache (ReadThroughCache.discard). Their list pages and list ETags are
+not invalidated by item writes; they show counters up to one read-cache TTL
+old.
+
+Brands and categories are inserted with zeroed counters (zero_counters).
+Documents from before the counters existed, or inserted outside the API, get
+theirs computed by backfill_counters, which the app runs at startup next to
+the index sync (ENSURE_INDEXES); it only reads documents missing a counter.
+
+reconcile_counters rebuilds the counters from `items` in batches of
+documents; run it after imports done outside the API or to repair drift:
+
+    python -m app.common.item_counters reconcile              # brands and categories
+    python -m app.common.item_counters reconcile brands
+    python -m app.common.item_counters backfill               # only documents missing counters
+"""
+import asyncio
+import sys
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClientSession, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.common.cache import read_cache
+from app.common.transactions import run_batches, run_in_transaction
+
+COUNTER_FIELDS: Tuple[str, ...] = ("itemCount", "totalStock", "inventoryValue")
+COUNTED_COLLECTIONS: Tuple[str, ...] = ("brands", "categories")
+
+# Item fields the counters depend on
+ITEM_COUNTER_FIELDS: Tuple[str, ...] = ("brandId", "categoryId", "subCategoryId", "price", "quantity")
+ITEM_COUNTER_PROJECTION: Dict[str, int] = {field: 1 for field in ITEM_COUNTER_FIELDS}
+
+RECONCILE_BATCH_SIZE = 500
+
+# Brands and categories without (some of) their counters
+MISSING_COUNTERS: Dict[str, Any] = {"$or": [{field: {"$exists": False}} for field in COUNTER_FIELDS]}
+
+# (before, after) state of one item; None before an insert and after a delete
+ItemChange = Tuple[Optional[Mapping[str, Any]], Optional[Mapping[str, Any]]]
+# collection -> ids whose counters were written
+Touched = Dict[str, List[ObjectId]]
+
+
+def _as_oid(value: Any) -> Optional[ObjectId]:
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+
+def _targets(item: Mapping[str, Any]) -> List[Tuple[str, ObjectId]]:
+    targets = []
+    brand = _as_oid(item.get("brandId"))
+    if brand is not None:
+        targets.append(("brands", brand))
+    # dict.fromkeys: an item whose category and subcategory are the same counts once
+    for category in dict.fromkeys(_as_oid(item.get(field)) for field in ("categoryId", "subCategoryId")):
+        if category is not None:
+            targets.append(("categories", category))
+    return targets
+
+
+def zero_counters() -> Dict[str, int]:
+    """Counters of a new brand or category, written with the document so the fields always exist."""
+    return dict.fromkeys(COUNTER_FIELDS, 0)
+
+
+def touches_counters(update_doc: Mapping[str, Any]) -> bool:
+    return any(field in update_doc for field in ITEM_COUNTER_FIELDS)
+
+
+def counter_deltas(changes: Iterable[ItemChange]) -> Dict[Tuple[str, ObjectId], List[int]]:
+    """Net (itemCount, totalStock, inventoryValue) change per (collection, id)."""
+    deltas: Dict[Tuple[str, ObjectId], List[int]] = defaultdict(lambda: [0, 0, 0])
+    for before, after in changes:
+        for item, sign in ((before, -1), (after, 1)):
+            if item is None:
+                continue
+            quantity = item.get("quantity") or 0
+            value = (item.get("price") or 0) * quantity
+            for target in _targets(item):
+                delta = deltas[target]
+                delta[0] += sign
+                delta[1] += sign * quantity
+                delta[2] += sign * value
+    return deltas
+
+
+def counter_changes_ops(changes: Iterable[ItemChange]) -> Dict[str, Dict[ObjectId, UpdateOne]]:
+    """One $inc UpdateOne per brand / category whose counters change, by collection and id."""
+    ops: Dict[str, Dict[ObjectId, UpdateOne]] = defaultdict(dict)
+    for (collection, oid), delta in counter_deltas(changes).items():
+        if any(delta):
+            ops[collection][oid] = UpdateOne({"_id": oid}, {"$inc": dict(zip(COUNTER_FIELDS, delta))})
+    return ops
+
+
+async def apply_counter_changes(
+    db: AsyncIOMotorDatabase, changes: Iterable[ItemChange], session: Optional[AsyncIOMotorClientSession] = None
+) -> Touched:
+    """Write the counter deltas of `changes`; one bulk_write per collection."""
+    ops = counter_changes_ops(changes)
+    await run_batches(session, *(
+        (lambda name=name, batch=list(batch.values()): db[name].bulk_write(batch, ordered=False, session=session))
+        for name, batch in ops.items()
+    ))
+    return {name: list(batch) for name, batch in ops.items()}
+
+
+def invalidate_counted(touched: Touched):
+    # Brand and category responses include the counters; list pages may show them one TTL late
+    for collection, ids in touched.items():
+        read_cache.discard(collection, ids)
+
+
+# (session, rows: indexes into the chunk) -> (bulk_api_result with chunk indexes, changes of the rows written)
+CountedWrite = Callable[
+    [Optional[AsyncIOMotorClientSession], List[int]], Awaitable[Tuple[Dict[str, Any], List[ItemChange]]]
+]
+
+
+class _ChunkAborted(Exception):
+    def __init__(self, write_errors: List[Dict[str, Any]]):
+        super().__init__("bulk write failed inside a transaction")
+        self.write_errors = write_errors
+
+
+def _chunk_result(result: Dict[str, Any], rows: List[int]) -> Dict[str, Any]:
+    """A bulk_api_result (or BulkWriteError.details) of the ops for `rows`, with indexes mapped back to the chunk."""
+    result = dict(result)
+    for key in ("writeErrors", "upserted"):
+        result[key] = [{**entry, "index": rows[entry["index"]]} for entry in result.get(key, [])]
+    return result
+
+
+async def write_counted_chunk(db: AsyncIOMotorDatabase, size: int, write: CountedWrite) -> Dict[str, Any]:
+    """
+    Run `write(session, rows)` for a chunk of `size` rows and apply the counter deltas it returns,
+    in one transaction. A write error aborts the transaction, so the failed rows are set aside and
+    the others written again. Returns the merged bulk_api_result; raises BulkWriteError with the
+    failed rows at the end, as an unordered bulk_write would.
+    """
+    merged: Dict[str, Any] = {"nInserted": 0, "nUpserted": 0, "nMatched": 0, "nModified": 0, "upserted": []}
+    failed: List[Dict[str, Any]] = []
+    rows = list(range(size))
+    while rows:
+        async def attempt(session):
+            result, changes = await write(session, rows)
+            if session is not None and result["writeErrors"]:
+                # The server has aborted the transaction already; raising makes with_transaction give up on it
+                raise _ChunkAborted(result["writeErrors"])
+            return result, await apply_counter_changes(db, changes, session)
+
+        try:
+            result, touched = await run_in_transaction(db.client, attempt)
+        except _ChunkAborted as aborted:
+            # Nothing of this attempt was written
+            failed.extend(aborted.write_errors)
+            bad = {error["index"] for error in aborted.write_errors}
+            rows = [row for row in rows if row not in bad]
+            continue
+        invalidate_counted(touched)
+        for key in ("nInserted", "nUpserted", "nMatched", "nModified"):
+            merged[key] += result.get(key, 0)
+        merged["upserted"] += result["upserted"]
+        failed.extend(result["writeErrors"])
+        break
+    if failed:
+        raise BulkWriteError({**merged, "writeErrors": sorted(failed, key=lambda error: error["index"])})
+    return merged
+
+
+# --- item writes that keep the counters ------------------------------------------
+
+async def insert_item(db: AsyncIOMotorDatabase, doc: Dict[str, Any]) -> ObjectId:
+    """Insert `doc` (its _id is set in place) and count it, in one transaction."""
+    async def write(session):
+        await db.items.insert_one(doc, session=session)
+        return await apply_counter_changes(db, [(None, doc)], session)
+
+    touched = await run_in_transaction(db.client, write)
+    read_cache.invalidate("items")
+    invalidate_counted(touched)
+    return doc["_id"]
+
+
+async def update_item(db: AsyncIOMotorDatabase, item_id: ObjectId, update_doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """$set `update_doc` and move the counters in one transaction. Returns the updated item, None if not found."""
+    async def write(session):
+        before = await db.items.find_one_and_update(
+            {"_id": item_id}, {"$set": update_doc}, return_document=ReturnDocument.BEFORE, session=session
+        )
+        if before is None:
+            return None, {}
+        after = {**before, **update_doc}
+        touched = await apply_counter_changes(db, [(before, after)], session) if touches_counters(update_doc) else {}
+        return after, touched
+
+    updated, touched = await run_in_transaction(db.client, write)
+    read_cache.invalidate("items", [item_id])
+    invalidate_counted(touched)
+    return updated
+
+
+async def delete_items(db: AsyncIOMotorDatabase, item_ids: List[ObjectId]) -> Tuple[List[ObjectId], int]:
+    """Delete items and uncount them in one transaction. Returns (ids that existed, deleted count)."""
+    async def write(session):
+        existing = await db.items.find(
+            {"_id": {"$in": item_ids}}, ITEM_COUNTER_PROJECTION, session=session
+        ).to_list(length=len(item_ids))
+        result = await db.items.delete_many({"_id": {"$in": [doc["_id"] for doc in existing]}}, session=session)
+        touched = await apply_counter_changes(db, [(doc, None) for doc in existing], session)
+        return [doc["_id"] for doc in existing], result.deleted_count or 0, touched
+
+    existing_ids, deleted, touched = await run_in_transaction(db.client, write)
+    read_cache.invalidate("items", item_ids)
+    invalidate_counted(touched)
+    return existing_ids, deleted
+
+
+async def insert_items(db: AsyncIOMotorDatabase, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Insert a bulk chunk and count the rows written (write_counted_chunk). insert_many sets each _id in place."""
+    async def write(session, rows):
+        batch = [docs[i] for i in rows]
+        try:
+            await db.items.insert_many(batch, ordered=False, session=session)
+            result: Dict[str, Any] = {"nInserted": len(batch)}
+        except BulkWriteError as error:
+            result = error.details
+        result = _chunk_result(result, rows)
+        failed = {error["index"] for error in result["writeErrors"]}
+        return result, [(None, docs[i]) for i in rows if i not in failed]
+
+    return await write_counted_chunk(db, len(docs), write)
+
+
+async def upsert_before_images(
+    db: AsyncIOMotorDatabase,
+    docs: List[Dict[str, Any]],
+    keys: Tuple[str, ...],
+    session: Optional[AsyncIOMotorClientSession] = None,
+) -> Dict[Tuple[Any, ...], Dict[str, Any]]:
+    """Current counter fields of the items a natural-key upsert will match, keyed by natural key."""
+    existing = await db.items.find(
+        {"$or": [{k: doc.get(k) for k in keys} for doc in docs]},
+        {**ITEM_COUNTER_PROJECTION, **{k: 1 for k in keys}},
+        session=session,
+    ).to_list(length=None)
+    return {tuple(doc.get(k) for k in keys): doc for doc in existing}
+
+
+async def upsert_items(db: AsyncIOMotorDatabase, docs: List[Dict[str, Any]], keys: Tuple[str, ...]) -> Dict[str, Any]:
+    """
+    Upsert a bulk chunk on the natural key `keys` (write_counted_chunk). Matched rows move the
+    counters from their previous values, read in the same transaction.
+    """
+    async def write(session, rows):
+        batch = [docs[i] for i in rows]
+        before = await upsert_before_images(db, batch, keys, session)
+        ops = [UpdateOne({k: doc.get(k) for k in keys}, {"$set": doc}, upsert=True) for doc in batch]
+        try:
+            result = (await db.items.bulk_write(ops, ordered=False, session=session)).bulk_api_result
+        except BulkWriteError as error:
+            result = error.details
+        result = _chunk_result(result, rows)
+        failed = {error["index"] for error in result["writeErrors"]}
+        changes: List[ItemChange] = []
+        for i in rows:
+            if i in failed:
+                continue
+            old = before.get(tuple(docs[i].get(k) for k in keys))
+            changes.append((old, {**old, **docs[i]} if old is not None else docs[i]))
+        return result, changes
+
+    return await write_counted_chunk(db, len(docs), write)
+
+
+async def bulk_update_items(
+    db: AsyncIOMotorDatabase, ops: List[UpdateOne], object_ids: List[ObjectId], update_docs: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """
+    Chunk writer for bulk_update_by_id (write_counted_chunk): reads the before images of the rows
+    that change counted fields, runs the bulk_write, then applies the deltas of the rows that succeeded.
+    """
+    async def write(session, rows):
+        tracked = [i for i in rows if touches_counters(update_docs[i])]
+        current: Dict[ObjectId, Dict[str, Any]] = {}
+        if tracked:
+            ids = list(dict.fromkeys(object_ids[i] for i in tracked))
+            docs = await db.items.find(
+                {"_id": {"$in": ids}}, ITEM_COUNTER_PROJECTION, session=session
+            ).to_list(length=len(ids))
+            current = {doc["_id"]: doc for doc in docs}
+        try:
+            result = (await db.items.bulk_write([ops[i] for i in rows], ordered=False, session=session)).bulk_api_result
+        except BulkWriteError as error:
+            result = error.details
+        result = _chunk_result(result, rows)
+        failed = {error["index"] for error in result["writeErrors"]}
+
+        changes: List[ItemChange] = []
+        for i in tracked:
+            before = current.get(object_ids[i])
+            if i in failed or before is None:
+                continue
+            after = {**before, **update_docs[i]}
+            changes.append((before, after))
+            # The same id may appear in several rows of a chunk; later rows start from the earlier result
+            current[object_ids[i]] = after
+        return result, changes
+
+    return await write_counted_chunk(db, len(ops), write)
+
+
+# --- reconcile --------------------------------------------------------------------
+
+def _counter_pipelines(collection: str, oids: List[ObjectId]) -> List[List[Dict[str, Any]]]:
+    """One $group pipeline per reference field, each led by a $match on that field's index."""
+    # References are stored as strings by the API, possibly as ObjectIds by older writes
+    refs = oids + [str(oid) for oid in oids]
+    quantity = {"$ifNull": ["$quantity", 0]}
+    group = {
+        "itemCount": {"$sum": 1},
+        "totalStock": {"$sum": quantity},
+        "inventoryValue": {"$sum": {"$multiply": [{"$ifNull": ["$price", 0]}, quantity]}},
+    }
+    if collection == "brands":
+        return [[{"$match": {"brandId": {"$in": refs}}}, {"$group": {"_id": "$brandId", **group}}]]
+    return [
+        [{"$match": {"categoryId": {"$in": refs}}}, {"$group": {"_id": "$categoryId", **group}}],
+        # An item whose subcategory is its category is already counted above
+        [
+            {"$match": {"subCategoryId": {"$in": refs}, "$expr": {"$ne": ["$subCategoryId", "$categoryId"]}}},
+            {"$group": {"_id": "$subCategoryId", **group}},
+        ],
+    ]
+
+
+async def _actual_counters(
+    items: AsyncIOMotorCollection, collection: str, oids: List[ObjectId]
+) -> Dict[ObjectId, Tuple[int, int, int]]:
+    totals: Dict[ObjectId, List[int]] = defaultdict(lambda: [0, 0, 0])
+    for pipeline in _counter_pipelines(collection, oids):
+        async for row in items.aggregate(pipeline):
+            oid = _as_oid(row["_id"])
+            if oid is not None:
+                for i, field in enumerate(COUNTER_FIELDS):
+                    totals[oid][i] += row[field]
+    return {oid: tuple(values) for oid, values in totals.items()}
+
+
+async def reconcile_counters(
+    db: AsyncIOMotorDatabase,
+    collection: str,
+    ids: Optional[List[ObjectId]] = None,
+    batch_size: int = RECONCILE_BATCH_SIZE,
+    only_missing: bool = False,
+) -> int:
+    """
+    Recompute the counters of `collection` ("brands" or "categories") from `items`,
+    `batch_size` documents at a time in _id order: one aggregation on the indexed
+    reference fields and at most one bulk_write per batch. Only `ids` when given,
+    only documents missing a counter field with `only_missing`.
+    Returns the number of documents whose counters were corrected.
+    """
+    corrected = 0
+    last_id: Optional[ObjectId] = None
+    while True:
+        id_filter: Dict[str, Any] = {} if ids is None else {"$in": ids}
+        if last_id is not None:
+            id_filter["$gt"] = last_id
+        query: Dict[str, Any] = {"_id": id_filter} if id_filter else {}
+        if only_missing:
+            query.update(MISSING_COUNTERS)
+        docs = await db[collection].find(
+            query, {field: 1 for field in COUNTER_FIELDS}
+        ).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+        actual = await _actual_counters(db.items, collection, [doc["_id"] for doc in docs])
+        stale = {}
+        for doc in docs:
+            counters = actual.get(doc["_id"], (0, 0, 0))
+            if tuple(doc.get(field) for field in COUNTER_FIELDS) != counters:
+                stale[doc["_id"]] = UpdateOne({"_id": doc["_id"]}, {"$set": dict(zip(COUNTER_FIELDS, counters))})
+        if stale:
+            await db[collection].bulk_write(list(stale.values()), ordered=False)
+            read_cache.invalidate(collection, stale)
+            corrected += len(stale)
+        if len(docs) < batch_size:
+            break
+    return corrected
+
+
+async def backfill_counters(db: AsyncIOMotorDatabase) -> Dict[str, int]:
+    """Compute the counters of brands and categories that have none yet. Returns the documents set per collection."""
+    return {
+        collection: await reconcile_counters(db, collection, only_missing=True) for collection in COUNTED_COLLECTIONS
+    }
+
+
+async def _main(command: str, collections: List[str]) -> int:
+    from app.db import db
+
+    if command in ("reconcile", "backfill") and all(c in COUNTED_COLLECTIONS for c in collections):
+        for collection in collections or COUNTED_COLLECTIONS:
+            corrected = await reconcile_counters(db, collection, only_missing=command == "backfill")
+            print(f"{collection}: corrected {corrected} documents")
+        return 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "", sys.argv[2:])))
@@ -0,0 +1,110 @@
+"""
+Inventory and price analytics over `items`, computed by the server.
+
+stats_pipeline scans the matching items once: a $facet computes the overall
+totals and one $group per reference field (brandId, categoryId,
+subCategoryId). Totals are counts, stock units, stock value (price * quantity),
+favorites and the number of low-stock items. A full scan is what the totals
+need, so results are cached in the read cache under the items generation:
+a dashboard refresh costs a cache hit until the next write to items.
+
+low_stock_pipeline starts with a $match on quantity, served by the
+quantity_1__id_1 index, and only groups the low-stock items themselves.
+"""
+from typing import Any, Dict, List, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+GROUP_FIELDS: Tuple[str, ...] = ("brandId", "categoryId", "subCategoryId")
+
+LOW_STOCK_THRESHOLD = 5
+
+LOW_STOCK_ITEM_FIELDS = ("name", "brandId", "categoryId", "subCategoryId", "price", "quantity")
+
+
+def parse_group_fields(by: str | None) -> Tuple[str, ...]:
+    """Comma separated reference fields to group by; all of them when empty. Raises ValueError."""
+    if not by:
+        return GROUP_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in by.split(",") if f.strip()))
+    bad = [f for f in fields if f not in GROUP_FIELDS]
+    if bad:
+        raise ValueError(f"Invalid group field(s): {', '.join(bad)}. Allowed: {', '.join(GROUP_FIELDS)}")
+    return fields
+
+
+def _accumulators(low_stock_threshold: int) -> Dict[str, Any]:
+    quantity = {"$ifNull": ["$quantity", 0]}
+    return {
+        "count": {"$sum": 1},
+        "quantity": {"$sum": quantity},
+        "stockValue": {"$sum": {"$multiply": [{"$ifNull": ["$price", 0]}, quantity]}},
+        "favorites": {"$sum": {"$cond": [{"$eq": ["$isFavoriteItem", True]}, 1, 0]}},
+        "lowStock": {"$sum": {"$cond": [{"$lte": [quantity, low_stock_threshold]}, 1, 0]}},
+        "minPrice": {"$min": "$price"},
+        "maxPrice": {"$max": "$price"},
+    }
+
+
+def stats_pipeline(query: Dict[str, Any], group_fields: Tuple[str, ...], low_stock_threshold: int) -> List[Dict[str, Any]]:
+    accumulators = _accumulators(low_stock_threshold)
+    facets: Dict[str, List[Dict[str, Any]]] = {
+        "totals": [{"$group": {"_id": None, **accumulators}}],
+    }
+    for field in group_fields:
+        facets[field] = [
+            {"$group": {"_id": f"${field}", **accumulators}},
+            {"$sort": {"stockValue": -1, "_id": 1}},
+        ]
+    return ([{"$match": query}] if query else []) + [{"$facet": facets}]
+
+
+def low_stock_pipeline(query: Dict[str, Any], group_field: str, threshold: int, limit: int) -> List[Dict[str, Any]]:
+    match = {**query, "quantity": {"$lte": threshold}}
+    return [
+        {"$match": match},
+        {"$sort": {"quantity": 1, "_id": 1}},
+        {"$group": {
+            "_id": f"${group_field}",
+            "count": {"$sum": 1},
+            "items": {"$push": {"_id": {"$toString": "$_id"}, **{f: f"${f}" for f in LOW_STOCK_ITEM_FIELDS}}},
+        }},
+        {"$project": {"count": 1, "items": {"$slice": ["$items", limit]}}},
+        {"$sort": {"count": -1, "_id": 1}},
+    ]
+
+
+def _group_row(row: Dict[str, Any], keyed: bool = True) -> Dict[str, Any]:
+    row = dict(row)
+    key = row.pop("_id")
+    if not keyed:
+        return row
+    # The reference value of the group; None for items without it
+    return {"key": None if key is None else str(key), **row}
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {"count": 0, "quantity": 0, "stockValue": 0, "favorites": 0, "lowStock": 0, "minPrice": None, "maxPrice": None}
+
+
+async def item_stats(
+    items: AsyncIOMotorCollection, query: Dict[str, Any], group_fields: Tuple[str, ...], low_stock_threshold: int
+) -> Dict[str, Any]:
+    [result] = await items.aggregate(stats_pipeline(query, group_fields, low_stock_threshold)).to_list(length=1)
+    totals = result.get("totals") or []
+    return {
+        "lowStockThreshold": low_stock_threshold,
+        "totals": _group_row(totals[0], keyed=False) if totals else _empty_totals(),
+        "groups": {field: [_group_row(row) for row in result.get(field, [])] for field in group_fields},
+    }
+
+
+async def low_stock(
+    items: AsyncIOMotorCollection, query: Dict[str, Any], group_field: str, threshold: int, limit: int
+) -> Dict[str, Any]:
+    rows = await items.aggregate(low_stock_pipeline(query, group_field, threshold, limit)).to_list(length=None)
+    return {
+        "threshold": threshold,
+        "groupBy": group_field,
+        "groups": [_group_row(row) for row in rows],
+    }
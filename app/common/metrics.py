@@ -0,0 +1,351 @@
+"""
+Per-request instrumentation.
+
+MetricsMiddleware opens a RequestTrace for every HTTP request and stores it in
+a context variable. Code on the request path adds to it:
+
+- Mongo time: RequestCommandListener, a PyMongo CommandListener. Motor runs the
+  driver in a thread pool but copies the context, so the listener sees the trace.
+- serialization / JSON encoding time: `with timed("serialize"):` / `timed("encode")`
+- documents returned: record_documents(n)
+
+When the response is finished the trace is folded into per-route histograms,
+rendered as Prometheus text at /admin/metrics. Requests slower than
+SLOW_REQUEST_MS are logged with the Mongo commands they issued.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from app.settings import get_app_settings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS_MS: Tuple[float, ...] = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+DOCUMENT_BUCKETS: Tuple[float, ...] = (0, 1, 10, 50, 100, 500, 1000, 5000)
+ROUND_TRIP_BUCKETS: Tuple[float, ...] = (0, 1, 2, 3, 4, 6, 10, 20, 50)
+PHASES = ("db", "serialize", "encode")
+
+_FROM_SETTINGS: Any = object()
+
+
+class Histogram:
+    """Count / sum / max plus fixed buckets; quantiles are interpolated within a bucket."""
+
+    __slots__ = ("bounds", "count", "total", "max", "buckets")
+
+    def __init__(self, bounds: Tuple[float, ...] = LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(bounds) + 1)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def copy(self) -> "Histogram":
+        other = Histogram(self.bounds)
+        other.count, other.total, other.max, other.buckets = self.count, self.total, self.max, list(self.buckets)
+        return other
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, n in enumerate(self.buckets):
+            upper = self.bounds[i] if i < len(self.bounds) else self.max
+            if n and seen + n >= rank:
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+            lower = upper
+        return self.max
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "total": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else 0.0,
+            "max": round(self.max, 3),
+            "p50": round(self.quantile(0.50), 3),
+            "p95": round(self.quantile(0.95), 3),
+            "p99": round(self.quantile(0.99), 3),
+        }
+
+
+class RequestTrace:
+    __slots__ = ("phases", "documents", "commands", "_started")
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+        self.documents = 0
+        # (command name, collection, ms); appended from driver threads
+        self.commands: List[Tuple[str, Optional[str], float]] = []
+        self._started: Dict[int, Optional[str]] = {}
+
+    def add(self, phase: str, ms: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + ms
+
+    def db_ms(self) -> float:
+        return sum(ms for _, _, ms in self.commands)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Add the time spent in the block to `phase` of the current request (no-op outside a request)."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(phase, (time.perf_counter() - start) * 1000)
+
+
+def record_documents(n: int):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.documents += n
+
+
+def record_command(name: str, collection: Optional[str] = None, ms: float = 0.0):
+    """Attribute a command to the current request, for clients without command monitoring (mongomock)."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.commands.append((name, collection, ms))
+
+
+class RequestCommandListener(monitoring.CommandListener):
+    """Attributes every Mongo command to the request that issued it."""
+
+    def started(self, event):
+        trace = _current_trace.get()
+        if trace is not None:
+            target = event.command.get(event.command_name)
+            trace._started[event.request_id] = target if isinstance(target, str) else None
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        trace = _current_trace.get()
+        if trace is not None:
+            collection = trace._started.pop(event.request_id, None)
+            trace.commands.append((event.command_name, collection, event.duration_micros / 1000))
+
+
+class RouteStats:
+    __slots__ = ("latency", "phases", "documents", "round_trips", "statuses")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.documents = Histogram(DOCUMENT_BUCKETS)
+        # Mongo commands per request, each one a network round-trip
+        self.round_trips = Histogram(ROUND_TRIP_BUCKETS)
+        self.statuses: Dict[int, int] = {}
+
+
+class RequestMetrics:
+    def __init__(self, slow_request_ms: Optional[float] = _FROM_SETTINGS):
+        # Default: SLOW_REQUEST_MS, read from the app settings on first use; None disables the slow log
+        self._slow_request_ms = slow_request_ms
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+
+    @property
+    def slow_request_ms(self) -> Optional[float]:
+        if self._slow_request_ms is _FROM_SETTINGS:
+            self._slow_request_ms = get_app_settings().slow_request_ms
+        return self._slow_request_ms
+
+    @slow_request_ms.setter
+    def slow_request_ms(self, value: Optional[float]) -> None:
+        self._slow_request_ms = value
+
+    def observe(self, method: str, route: str, status_code: int, total_ms: float, trace: RequestTrace):
+        db_ms = trace.db_ms()
+        with self._lock:
+            stats = self._routes.get((method, route))
+            if stats is None:
+                stats = self._routes[(method, route)] = RouteStats()
+            stats.latency.observe(total_ms)
+            stats.phases["db"].observe(db_ms)
+            stats.phases["serialize"].observe(trace.phases.get("serialize", 0.0))
+            stats.phases["encode"].observe(trace.phases.get("encode", 0.0))
+            stats.documents.observe(trace.documents)
+            stats.round_trips.observe(len(trace.commands))
+            stats.statuses[status_code] = stats.statuses.get(status_code, 0) + 1
+
+        if self.slow_request_ms is not None and total_ms >= self.slow_request_ms:
+            logger.warning(
+                "Slow request %s %s: %.1f ms (db %.1f ms, serialize %.1f ms, encode %.1f ms, %d docs) commands=%s",
+                method, route, total_ms, db_ms, trace.phases.get("serialize", 0.0),
+                trace.phases.get("encode", 0.0), trace.documents,
+                [f"{name}{'.' + coll if coll else ''} {ms:.1f}ms" for name, coll, ms in trace.commands],
+            )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                f"{method} {route}": {
+                    "latency_ms": stats.latency.as_dict(),
+                    "phases_ms": {phase: h.as_dict() for phase, h in stats.phases.items()},
+                    "documents": stats.documents.as_dict(),
+                    "round_trips": stats.round_trips.as_dict(),
+                    "statuses": dict(stats.statuses),
+                }
+                for (method, route), stats in sorted(self._routes.items())
+            }
+
+    def items(self) -> List[Tuple[Tuple[str, str], RouteStats]]:
+        with self._lock:
+            return list(self._routes.items())
+
+
+request_metrics = RequestMetrics()
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware (not BaseHTTPMiddleware) so the trace context is shared with the
+    endpoint and the timing covers the whole response body, including streamed exports.
+    """
+
+    def __init__(self, app, metrics: RequestMetrics = request_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            route = scope.get("route")
+            # Label with the route template, not the raw path, to keep cardinality bounded
+            path = getattr(route, "path", None) or "<unmatched>"
+            self.metrics.observe(scope["method"], path, status_code, (time.perf_counter() - start) * 1000, trace)
+
+
+# --- Prometheus text exposition ------------------------------------------------
+
+def _labels(**labels: Any) -> str:
+    def escape(value: Any) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, histogram: Histogram, scale: float = 1.0, **labels: Any) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, n in zip(histogram.bounds, histogram.buckets):
+        cumulative += n
+        lines.append(f"{name}_bucket{_labels(**labels, le=f'{bound * scale:g}')} {cumulative}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}")
+    lines.append(f"{name}_sum{_labels(**labels)} {histogram.total * scale:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {histogram.count}")
+    return lines
+
+
+def render_prometheus(
+    metrics: RequestMetrics,
+    pools: Dict[str, Dict[str, Any]],
+    commands: Dict[str, Tuple[Histogram, int]],
+) -> str:
+    """Prometheus text format 0.0.4. Latencies are exported in seconds, as Prometheus expects."""
+    out: List[str] = []
+    routes = metrics.items()
+
+    out += ["# HELP http_request_duration_seconds Request latency per route.",
+            "# TYPE http_request_duration_seconds histogram"]
+    for (method, route), stats in routes:
+        out += _histogram_lines("http_request_duration_seconds", stats.latency, 0.001, method=method, route=route)
+
+    out += ["# HELP http_request_phase_seconds Time per request spent in Mongo (db), serialization and JSON encoding.",
+            "# TYPE http_request_phase_seconds histogram"]
+    for (method, route), stats in routes:
+        for phase, histogram in stats.phases.items():
+            out += _histogram_lines(
+                "http_request_phase_seconds", histogram, 0.001, method=method, route=route, phase=phase
+            )
+
+    out += ["# HELP http_response_documents Documents returned per request.",
+            "# TYPE http_response_documents histogram"]
+    for (method, route), stats in routes:
+        out += _histogram_lines("http_response_documents", stats.documents, method=method, route=route)
+
+    out += ["# HELP http_request_mongo_round_trips Mongo commands sent per request.",
+            "# TYPE http_request_mongo_round_trips histogram"]
+    for (method, route), stats in routes:
+        out += _histogram_lines("http_request_mongo_round_trips", stats.round_trips, method=method, route=route)
+
+    out += ["# HELP http_requests_total Requests per route and status code.",
+            "# TYPE http_requests_total counter"]
+    for (method, route), stats in routes:
+        for code, n in sorted(stats.statuses.items()):
+            out.append(f"http_requests_total{_labels(method=method, route=route, status=code)} {n}")
+
+    out += ["# HELP mongo_command_duration_seconds Mongo command latency.",
+            "# TYPE mongo_command_duration_seconds histogram"]
+    failures = []
+    for command, (histogram, failed) in commands.items():
+        out += _histogram_lines("mongo_command_duration_seconds", histogram, 0.001, command=command)
+        failures.append(f"mongo_command_failures_total{_labels(command=command)} {failed}")
+    out += ["# HELP mongo_command_failures_total Failed Mongo commands.",
+            "# TYPE mongo_command_failures_total counter", *failures]
+
+    gauges = {
+        "mongo_pool_open_connections": ("open", "Open connections per server."),
+        "mongo_pool_checked_out_connections": ("checked_out", "Connections in use per server."),
+        "mongo_pool_max_size": ("max_pool_size", "maxPoolSize per server."),
+        "mongo_pool_saturation": ("saturation", "checked_out / maxPoolSize per server."),
+    }
+    for name, (key, help_text) in gauges.items():
+        out += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        for address, pool in pools.items():
+            if pool.get(key) is not None:
+                out.append(f"{name}{_labels(address=address)} {pool[key]}")
+    out += ["# HELP mongo_pool_checkout_wait_seconds Time spent waiting for a pooled connection.",
+            "# TYPE mongo_pool_checkout_wait_seconds histogram"]
+    for address, pool in pools.items():
+        out += _histogram_lines("mongo_pool_checkout_wait_seconds", pool["checkout_wait"], 0.001,
+                                address=address)
+    return "\n".join(out) + "\n"
@@ -1,8 +1,10 @@
-from typing import Any, Dict, Iterable, Tuple, Set,List
+from types import UnionType
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Tuple, Set, List, Type, Union, get_args, get_origin
 from datetime import date, datetime
 from bson import ObjectId, Decimal128
 from fastapi import HTTPException, status
 from motor.motor_asyncio import AsyncIOMotorCollection
+from pydantic import BaseModel
 import base64
 
 
@@ -11,24 +13,107 @@ def to_object_id(id_str: str) -> ObjectId:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Invalid ObjectId: {id_str}')
     return ObjectId(id_str)
 
+def _conv_str(v: Any) -> str:
+    return str(v)
+
+def _conv_isoformat(v: Any) -> str:
+    return v.isoformat()
+
+def _conv_decimal128(v: Decimal128) -> float:
+    return float(v.to_decimal())
+
+def _conv_bytes(v: bytes) -> str:
+    return base64.b64encode(v).decode("utf-8")
+
+def _conv_dict(v: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: _conv(x) for k, x in v.items()}
+
+def _conv_list(v: Iterable[Any]) -> List[Any]:
+    return [_conv(x) for x in v]
+
+def _identity(v: Any) -> Any:
+    return v
+
+# JSON-native scalars are returned untouched
+_NATIVE: FrozenSet[type] = frozenset({str, int, float, bool, type(None)})
+
+# Exact-type dispatch table; subclasses (Binary, SON, ...) are resolved once by
+# _resolve_converter and cached here so the isinstance chain runs once per type.
+_CONVERTERS: Dict[type, Callable[[Any], Any]] = {
+    **{t: _identity for t in _NATIVE},
+    ObjectId: _conv_str,
+    datetime: _conv_isoformat,
+    date: _conv_isoformat,
+    Decimal128: _conv_decimal128,
+    bytes: _conv_bytes,
+    dict: _conv_dict,
+    list: _conv_list,
+    tuple: _conv_list,
+    set: _conv_list,
+}
+
+# Checked in order, so more specific types come first (datetime is a subclass of date)
+_FALLBACK_ORDER: Tuple[Tuple[type, Callable[[Any], Any]], ...] = (
+    (ObjectId, _conv_str),
+    (datetime, _conv_isoformat),
+    (date, _conv_isoformat),
+    (Decimal128, _conv_decimal128),
+    (bytes, _conv_bytes),
+    (dict, _conv_dict),
+    ((list, tuple, set), _conv_list),
+)
+
+def _resolve_converter(t: type) -> Callable[[Any], Any]:
+    for base, fn in _FALLBACK_ORDER:
+        if issubclass(t, base):
+            break
+    else:
+        fn = _identity
+    _CONVERTERS[t] = fn
+    return fn
+
+def _conv(v: Any) -> Any:
+    fn = _CONVERTERS.get(v.__class__)
+    if fn is None:
+        fn = _resolve_converter(v.__class__)
+    return fn(v)
+
 def serialize_document(doc: Dict[str, Any]) -> Dict[str, Any]:
     """Recursively convert Mongo/BSON types to JSON-safe values."""
-    def conv(v: Any):
-        if isinstance(v, ObjectId):
-            return str(v)
-        if isinstance(v, (datetime, date)):
-            return v.isoformat()
-        if isinstance(v, Decimal128):
-            return float(v.to_decimal())
-        if isinstance(v, bytes):
-            return base64.b64encode(v).decode("utf-8")
-        if isinstance(v, dict):
-            return {k: conv(x) for k, x in v.items()}
-        if isinstance(v, (list, tuple, set)):
-            return [conv(x) for x in v]
-        return v
-
-    return conv(doc)
+    return _conv(doc)
+
+def _is_native_annotation(annotation: Any) -> bool:
+    """True for str/int/float/bool and their Optional forms."""
+    if annotation in _NATIVE:
+        return True
+    args = get_args(annotation)
+    return bool(args) and get_origin(annotation) in (Union, UnionType) and all(a in _NATIVE for a in args)
+
+def compile_serializer(model: Type[BaseModel]) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Build a serializer specialised for documents shaped like `model`.
+    Fields declared as JSON-native scalars are copied with a single type check
+    instead of going through the dispatcher; everything else (nested lists,
+    undeclared keys, legacy values stored with another type) falls back to the
+    generic conversion, so the output is identical to serialize_document.
+    """
+    native_keys = frozenset(
+        (field.alias or name)
+        for name, field in model.model_fields.items()
+        if _is_native_annotation(field.annotation)
+    )
+    native_types = _NATIVE
+
+    def serialize(doc: Dict[str, Any]) -> Dict[str, Any]:
+        out: Dict[str, Any] = {}
+        for k, v in doc.items():
+            if k in native_keys and v.__class__ in native_types:
+                out[k] = v
+            else:
+                out[k] = _conv(v)
+        return out
+
+    return serialize
 
 async def find_existing_and_missing_ids(
     collection: AsyncIOMotorCollection,
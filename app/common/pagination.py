@@ -0,0 +1,133 @@
+import base64
+import binascii
+from typing import Any, Callable, Dict, Iterable, List, Literal, Mapping, Optional, Tuple
+
+from bson import json_util
+from fastapi import HTTPException, Query, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pydantic import BaseModel, ConfigDict
+from pymongo import ASCENDING, DESCENDING
+
+from app.common.metrics import timed
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+class PageParams(BaseModel):
+    # Frozen so a page request can be used as a cache key
+    model_config = ConfigDict(frozen=True)
+
+    limit: int = DEFAULT_LIMIT
+    cursor: str | None = None
+    sort: str = "_id"
+    order: Literal["asc", "desc"] = "asc"
+    fields: Tuple[str, ...] | None = None
+
+
+def page_params(
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+    cursor: str | None = Query(None, description="Opaque cursor returned as next_cursor by the previous page"),
+    sort: str = Query("_id", description="Field to sort on"),
+    order: Literal["asc", "desc"] = Query("asc"),
+    fields: str | None = Query(None, description="Comma separated list of fields to return"),
+) -> PageParams:
+    """FastAPI dependency collecting the common list query parameters."""
+    field_list = tuple(f.strip() for f in fields.split(",") if f.strip()) if fields else None
+    return PageParams(limit=limit, cursor=cursor, sort=sort, order=order, fields=field_list)
+
+
+def encode_cursor(sort_field: str, last_doc: Mapping[str, Any]) -> str:
+    """Build an opaque cursor pointing just after `last_doc` for the given sort key."""
+    payload = {"s": sort_field, "v": last_doc.get(sort_field), "id": last_doc["_id"]}
+    raw = json_util.dumps(payload).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort_field: str) -> Tuple[Any, Any]:
+    """Return (sort_value, _id) stored in `cursor`; reject cursors built for another sort key."""
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        value, last_id = payload["v"], payload["id"]
+        if payload["s"] != sort_field:
+            raise ValueError("sort mismatch")
+    except (binascii.Error, ValueError, KeyError, TypeError, UnicodeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid cursor: {cursor}")
+    return value, last_id
+
+
+def keyset_filter(sort_field: str, value: Any, last_id: Any, descending: bool) -> Dict[str, Any]:
+    """
+    Filter matching documents strictly after (value, last_id) in (sort_field, _id) order.
+    Missing/null sort values sort before everything else, like Mongo does.
+    """
+    op = "$lt" if descending else "$gt"
+    if sort_field == "_id":
+        return {"_id": {op: last_id}}
+    if value is None:
+        tie = {sort_field: None, "_id": {op: last_id}}
+        return tie if descending else {"$or": [tie, {sort_field: {"$ne": None}}]}
+    return {"$or": [{sort_field: {op: value}}, {sort_field: value, "_id": {op: last_id}}]}
+
+
+def build_projection(fields: Iterable[str] | None, sort_field: str) -> Optional[Dict[str, int]]:
+    if not fields:
+        return None
+    projection = {f: 1 for f in fields}
+    # The sort key is needed to build next_cursor even if the caller did not ask for it
+    projection[sort_field] = 1
+    return projection
+
+
+async def paginate(
+    collection: AsyncIOMotorCollection,
+    params: PageParams,
+    *,
+    query: Dict[str, Any] | None = None,
+    sortable: Iterable[str] = ("_id",),
+    transform: Callable[[Mapping[str, Any]], Dict[str, Any]] = dict,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Fetch one page of `collection` using keyset pagination on (params.sort, _id).
+    Returns (docs, next_cursor); next_cursor is None on the last page.
+    `transform` turns each raw document into the returned dict (e.g. a serializer);
+    the cursor is built from the untransformed last document.
+    Cost is O(limit) through the index on the sort key, no matter how deep the page is.
+    """
+    sort_field = params.sort
+    if sort_field not in sortable:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot sort by {sort_field}. Allowed: {', '.join(sortable)}",
+        )
+    descending = params.order == "desc"
+    direction = DESCENDING if descending else ASCENDING
+
+    mongo_filter: Dict[str, Any] = dict(query or {})
+    if params.cursor:
+        value, last_id = decode_cursor(params.cursor, sort_field)
+        after = keyset_filter(sort_field, value, last_id, descending)
+        mongo_filter = {"$and": [mongo_filter, after]} if mongo_filter else after
+
+    sort_spec = [(sort_field, direction)] if sort_field == "_id" else [(sort_field, direction), ("_id", direction)]
+    projection = build_projection(params.fields, sort_field)
+
+    docs = await (
+        collection.find(mongo_filter, projection)
+        .sort(sort_spec)
+        .limit(params.limit + 1)
+        .to_list(length=params.limit + 1)
+    )
+
+    next_cursor = None
+    if len(docs) > params.limit:
+        docs = docs[:params.limit]
+        next_cursor = encode_cursor(sort_field, docs[-1])
+
+    with timed("serialize"):
+        out = [transform(doc) for doc in docs]
+    if params.fields and sort_field not in params.fields and sort_field != "_id":
+        for doc in out:
+            doc.pop(sort_field, None)
+    return out, next_cursor
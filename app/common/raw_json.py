@@ -0,0 +1,88 @@
+import base64
+from datetime import datetime
+from typing import Any, Dict, Mapping
+
+import bson
+from bson import Binary, Decimal128, ObjectId
+from bson.codec_options import CodecOptions, TypeDecoder, TypeRegistry
+from bson.raw_bson import RawBSONDocument
+from fastapi import Response, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+
+from app.common.metrics import timed
+from app.common.responses import dumps
+
+
+class _ObjectIdDecoder(TypeDecoder):
+    bson_type = ObjectId
+
+    def transform_bson(self, value: ObjectId) -> str:
+        return str(value)
+
+
+class _DatetimeDecoder(TypeDecoder):
+    bson_type = datetime
+
+    def transform_bson(self, value: datetime) -> str:
+        return value.isoformat()
+
+
+class _Decimal128Decoder(TypeDecoder):
+    bson_type = Decimal128
+
+    def transform_bson(self, value: Decimal128) -> float:
+        return float(value.to_decimal())
+
+
+class _BytesDecoder(TypeDecoder):
+    bson_type = bytes
+
+    def transform_bson(self, value: bytes) -> str:
+        return base64.b64encode(value).decode("utf-8")
+
+
+class _BinaryDecoder(_BytesDecoder):
+    bson_type = Binary
+
+
+# Decodes BSON straight into the same JSON-safe values serialize_document produces
+JSON_NATIVE_CODEC_OPTIONS = CodecOptions(
+    type_registry=TypeRegistry([
+        _ObjectIdDecoder(),
+        _DatetimeDecoder(),
+        _Decimal128Decoder(),
+        _BytesDecoder(),
+        _BinaryDecoder(),
+    ])
+)
+
+RAW_CODEC_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+
+def raw_collection(collection: AsyncIOMotorCollection) -> AsyncIOMotorCollection:
+    """Same collection, but reads return undecoded RawBSONDocument."""
+    return collection.with_options(codec_options=RAW_CODEC_OPTIONS)
+
+
+def decode_json_native(doc: Mapping[str, Any]) -> Dict[str, Any]:
+    """Decode a RawBSONDocument in a single pass into JSON-safe Python values."""
+    return bson.decode(doc.raw, codec_options=JSON_NATIVE_CODEC_OPTIONS)
+
+
+def render_json(content: Any) -> bytes:
+    with timed("encode"):
+        return dumps(content)
+
+
+def json_response(
+    content: Any, status_code: int = status.HTTP_200_OK, headers: Mapping[str, str] | None = None
+) -> Response:
+    """Pre-rendered JSON response; bypasses jsonable_encoder and response_model validation."""
+    return rendered_response(render_json(content), status_code, headers)
+
+
+def rendered_response(
+    body: bytes, status_code: int = status.HTTP_200_OK, headers: Mapping[str, str] | None = None
+) -> Response:
+    """Response for JSON already encoded by render_json, e.g. shared between coalesced requests."""
+    return Response(content=body, status_code=status_code, headers=headers, media_type="application/json")
@@ -0,0 +1,180 @@
+"""
+Batched validation of the ids a write references.
+
+Items point at a brand and two categories, categories at brands and
+subcategories, brands at categories. None of that was checked on write:
+create_item stored any string, and a category create only failed when none of
+its brands existed. validate_references collects every id referenced by a
+whole request, or a whole bulk chunk, and checks them with one $in query per
+referenced collection, run concurrently. Integrity checking therefore costs
+at most one round-trip per collection, not one per reference.
+
+Ids found to exist are remembered in a short-lived ExistenceCache, so a burst
+of item writes against the same brands and categories skips the queries.
+Only existence is cached; missing ids are looked up again every time, since
+they may have been created a moment ago. Deletes made by this process
+(cascade_delete) and delete events from the change streams drop ids from the
+cache. Otherwise an id deleted elsewhere is trusted for at most one TTL, the
+same staleness bound the read cache has.
+
+The check runs before the write, outside its transaction: a reference deleted
+in between is not caught, like any other race between two requests.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Set, Tuple
+
+from bson import ObjectId
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from app.common.mongo_utils import find_existing_and_missing_ids
+from app.settings import get_app_settings
+
+# Path of a reference in the document -> referenced collection. "a.b" is field b of every element of list a.
+ReferenceFields = Mapping[str, str]
+
+ITEM_REFERENCES: ReferenceFields = {
+    "brandId": "brands",
+    "categoryId": "categories",
+    "subCategoryId": "categories",
+}
+# rootCategoryId is checked by category_tree, which needs the parent's ancestors anyway
+CATEGORY_REFERENCES: ReferenceFields = {
+    "brands.brandId": "brands",
+    "subCategories.subCategoryId": "categories",
+}
+BRAND_REFERENCES: ReferenceFields = {
+    "categoryIdList.categoryId": "categories",
+}
+
+
+class ExistenceCache:
+    """
+    Ids known to exist, per collection, each trusted for `ttl` seconds.
+    max_entries and ttl left as None are read from the app settings on first use.
+    """
+
+    def __init__(
+        self, max_entries: int | None = None, ttl: float | None = None, clock: Callable[[], float] = time.monotonic
+    ):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock
+        self._known: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def max_entries(self) -> int:
+        if self._max_entries is None:
+            self._max_entries = get_app_settings().reference_cache_max_entries
+        return self._max_entries
+
+    @property
+    def ttl(self) -> float:
+        if self._ttl is None:
+            self._ttl = get_app_settings().reference_cache_ttl_seconds
+        return self._ttl
+
+    def known(self, collection: str, id: str) -> bool:
+        key = (collection, id)
+        expires_at = self._known.get(key)
+        if expires_at is None or expires_at <= self._clock():
+            if expires_at is not None:
+                del self._known[key]
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def add(self, collection: str, ids: Iterable[Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        expires_at = self._clock() + self.ttl
+        for id in ids:
+            key = (collection, str(id))
+            self._known[key] = expires_at
+            self._known.move_to_end(key)
+        while len(self._known) > self.max_entries:
+            self._known.popitem(last=False)
+
+    def discard(self, collection: str, ids: Iterable[Any]) -> None:
+        for id in ids:
+            self._known.pop((collection, str(id)), None)
+
+    def clear(self, collection: str | None = None) -> None:
+        if collection is None:
+            self._known.clear()
+            return
+        for key in [k for k in self._known if k[0] == collection]:
+            del self._known[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._known), "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+
+known_references = ExistenceCache()
+
+
+def reference_values(doc: Mapping[str, Any], path: str) -> List[str]:
+    """The ids stored under `path` in `doc`, as stripped strings; empty values are skipped."""
+    field, _, subfield = path.partition(".")
+    value = doc.get(field)
+    if subfield:
+        values = [v.get(subfield) for v in value or [] if isinstance(v, Mapping)]
+    else:
+        values = [value]
+    return [str(v).strip() for v in values if isinstance(v, (str, ObjectId)) and str(v).strip()]
+
+
+async def missing_ids(
+    db: AsyncIOMotorDatabase, wanted: Mapping[str, Set[str]], cache: ExistenceCache = known_references
+) -> Dict[str, Set[str]]:
+    """Of the ids wanted per collection, those that do not exist. Invalid ObjectIds never exist."""
+    missing: Dict[str, Set[str]] = {}
+    lookups: Dict[str, List[str]] = {}
+    for collection, ids in wanted.items():
+        missing[collection] = {i for i in ids if not ObjectId.is_valid(i)}
+        lookups[collection] = [i for i in ids if ObjectId.is_valid(i) and not cache.known(collection, i)]
+
+    async def lookup(collection: str) -> None:
+        existing, not_found = await find_existing_and_missing_ids(db[collection], lookups[collection])
+        cache.add(collection, existing)
+        missing[collection] |= set(not_found)
+
+    await asyncio.gather(*(lookup(c) for c, ids in lookups.items() if ids))
+    return missing
+
+
+async def reference_problems(
+    db: AsyncIOMotorDatabase, docs: List[Mapping[str, Any]], fields: ReferenceFields
+) -> Dict[int, str]:
+    """Check every reference of `docs` at once. Returns {index into docs: message} for docs with missing ids."""
+    wanted: Dict[str, Set[str]] = {}
+    for doc in docs:
+        for path, collection in fields.items():
+            wanted.setdefault(collection, set()).update(reference_values(doc, path))
+    if not any(wanted.values()):
+        return {}
+    missing = await missing_ids(db, wanted)
+
+    problems: Dict[int, str] = {}
+    for index, doc in enumerate(docs):
+        bad = [
+            f"{path}={value}"
+            for path, collection in fields.items()
+            for value in reference_values(doc, path)
+            if value in missing[collection]
+        ]
+        if bad:
+            problems[index] = f"Referenced id(s) not found: {', '.join(dict.fromkeys(bad))}"
+    return problems
+
+
+async def validate_references(db: AsyncIOMotorDatabase, doc: Mapping[str, Any], fields: ReferenceFields) -> None:
+    """Raise 404 unless every id `doc` references exists."""
+    problems = await reference_problems(db, [doc], fields)
+    if problems:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=problems[0])
@@ -0,0 +1,108 @@
+"""
+Fast JSON rendering.
+
+`dumps` encodes with orjson when it is installed (stdlib json otherwise) and
+handles BSON types natively, producing the same values serialize_document
+does: ObjectId as its hex string, datetime as ISO 8601, Decimal128 as a float,
+bytes as base64. FastJSONResponse uses it and is the app's default response
+class.
+
+Routes declaring a response_model normally pay for a full Pydantic validation
+of what they return, then jsonable_encoder, then json.dumps. They can return
+`model_response(...)` / `ModelRenderer.response(...)` instead: models they
+already built are serialized by pydantic-core without being validated again,
+plain documents are shaped like the model (declared fields, aliases, defaults)
+and encoded directly. With APP_DEBUG on, plain documents are validated against
+the model first, so a route drifting from its schema still fails loudly.
+"""
+import json
+from typing import Any, Callable, Dict, Tuple, Type
+
+from fastapi import Response, status
+from fastapi.exceptions import ResponseValidationError
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic.fields import FieldInfo
+
+from app.common.mongo_utils import compile_serializer, serialize_document
+from app.settings import get_app_settings
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def app_debug() -> bool:
+    return get_app_settings().app_debug
+
+
+def _default(value: Any) -> Any:
+    converted = serialize_document(value)
+    if converted is value:
+        raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+    return converted
+
+
+if orjson is not None:
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(content: Any) -> bytes:
+        return json.dumps(content, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def model_response(content: BaseModel, status_code: int = status.HTTP_200_OK) -> Response:
+    """Serialize an already validated model by alias, as response_model would, without re-validating it."""
+    return Response(
+        content=content.model_dump_json(by_alias=True), status_code=status_code, media_type="application/json"
+    )
+
+
+class ModelRenderer:
+    """Renders Mongo documents the way `model` as a response_model would."""
+
+    def __init__(self, model: Type[BaseModel], debug: bool | None = None):
+        self.model = model
+        # None: APP_DEBUG, read on first render; renderers are built at import, before .env is loaded
+        self._debug = debug
+        self._adapter = TypeAdapter(model)
+        self._serialize: Callable[[Dict[str, Any]], Dict[str, Any]] = compile_serializer(model)
+        self._fields: Tuple[Tuple[str, FieldInfo], ...] = tuple(
+            (field.alias or name, field) for name, field in model.model_fields.items()
+        )
+
+    def shape(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """JSON-safe dict with the model's fields only, missing optional ones set to their default."""
+        doc = self._serialize(doc)
+        out: Dict[str, Any] = {}
+        for key, field in self._fields:
+            if key in doc:
+                out[key] = doc[key]
+            elif not field.is_required():
+                out[key] = field.get_default(call_default_factory=True)
+        return out
+
+    @property
+    def debug(self) -> bool:
+        if self._debug is None:
+            self._debug = app_debug()
+        return self._debug
+
+    def render(self, doc: Dict[str, Any]) -> bytes:
+        if not self.debug:
+            return dumps(self.shape(doc))
+        content = self._serialize(doc)
+        try:
+            value = self._adapter.validate_python(content)
+        except ValidationError as error:
+            raise ResponseValidationError(errors=error.errors(), body=content)
+        return self._adapter.dump_json(value, by_alias=True)
+
+    def response(self, doc: Dict[str, Any], status_code: int = status.HTTP_200_OK) -> Response:
+        return Response(content=self.render(doc), status_code=status_code, media_type="application/json")
@@ -0,0 +1,106 @@
+"""
+Request coalescing ("single flight") for concurrent identical reads.
+
+When a dashboard loads, many requests for the same brand, category or list
+page arrive together. Each of them would miss the read cache at the same
+moment and run its own query, expansion and JSON encoding. SingleFlight keys
+an in-flight load by (collection, key): the first caller runs it in a task,
+callers arriving while it runs await that same task and get the same result.
+
+Routes use the ETag of the read as the key. It already combines the request
+parameters with the version of every collection the read touches, and a
+write bumps the version. So a caller arriving after a write never joins a
+load that started before it, and coalescing adds no staleness.
+
+The shared result is rendered JSON bytes, so it is immutable and safe to
+hand to every waiter. Exceptions such as a 404 are raised to every waiter as
+well. A waiter that is cancelled, e.g. because its client went away, does not
+cancel the load for the others.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from app.settings import get_app_settings
+
+T = TypeVar("T")
+
+
+class FlightStats:
+    __slots__ = ("calls", "loads", "shared", "errors")
+
+    def __init__(self):
+        self.calls = 0
+        # Loads actually run; calls - loads requests were answered by another caller's load
+        self.loads = 0
+        self.shared = 0
+        self.errors = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"calls": self.calls, "loads": self.loads, "shared": self.shared, "errors": self.errors}
+
+
+class SingleFlight:
+    def __init__(self, enabled: bool | None = None):
+        # None: READ_COALESCING, read from the app settings on first use
+        self._enabled = enabled
+        self._flights: Dict[Tuple[str, Hashable], "asyncio.Task[Any]"] = {}
+        self._stats: Dict[str, FlightStats] = {}
+
+    def _collection_stats(self, collection: str) -> FlightStats:
+        stats = self._stats.get(collection)
+        if stats is None:
+            stats = self._stats[collection] = FlightStats()
+        return stats
+
+    @property
+    def enabled(self) -> bool:
+        if self._enabled is None:
+            self._enabled = get_app_settings().read_coalescing
+        return self._enabled
+
+    @enabled.setter
+    def enabled(self, value: bool) -> None:
+        self._enabled = value
+
+    async def do(self, collection: str, key: Hashable, load: Callable[[], Awaitable[T]]) -> T:
+        """Await `load()`, or the load already running for (collection, key)."""
+        stats = self._collection_stats(collection)
+        stats.calls += 1
+        if not self.enabled:
+            stats.loads += 1
+            return await load()
+
+        flight_key = (collection, key)
+        task = self._flights.get(flight_key)
+        if task is None:
+            stats.loads += 1
+            # The task copies this request's context, so its db/encode time is traced on the first caller
+            task = asyncio.ensure_future(load())
+            self._flights[flight_key] = task
+            task.add_done_callback(lambda done: self._finish(flight_key, done, stats))
+        else:
+            stats.shared += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, flight_key: Tuple[str, Hashable], task: "asyncio.Task[Any]", stats: FlightStats) -> None:
+        if self._flights.get(flight_key) is task:
+            del self._flights[flight_key]
+        # Retrieving the exception also keeps asyncio from logging it when every waiter was cancelled
+        if not task.cancelled() and task.exception() is not None:
+            stats.errors += 1
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    def stats(self) -> Dict[str, Any]:
+        collections = {name: stats.as_dict() for name, stats in sorted(self._stats.items())}
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight(),
+            "calls": sum(s["calls"] for s in collections.values()),
+            "saved": sum(s["shared"] for s in collections.values()),
+            "collections": collections,
+        }
+
+
+read_flights = SingleFlight()
@@ -0,0 +1,53 @@
+import asyncio
+import weakref
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorClientSession
+
+T = TypeVar("T")
+
+# Keyed by the client object itself: an entry dies with its client, so a new client never inherits it
+_supports_transactions: "weakref.WeakKeyDictionary[AsyncIOMotorClient, bool]" = weakref.WeakKeyDictionary()
+
+
+async def supports_transactions(client: AsyncIOMotorClient) -> bool:
+    """Multi-document transactions need a replica set or a sharded cluster. Checked once per client."""
+    supported = _supports_transactions.get(client)
+    if supported is None:
+        try:
+            hello = await client.admin.command("hello")
+            supported = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+        except Exception:
+            supported = False
+        _supports_transactions[client] = supported
+    return supported
+
+
+def forget_client(client: AsyncIOMotorClient) -> None:
+    """Drop what was learned about `client`, e.g. when it is closed."""
+    _supports_transactions.pop(client, None)
+
+
+async def run_in_transaction(
+    client: AsyncIOMotorClient,
+    callback: Callable[[Optional[AsyncIOMotorClientSession]], Awaitable[T]],
+) -> T:
+    """
+    Run `callback(session)` inside a transaction, retried on transient errors by with_transaction.
+    On a standalone server there are no transactions: the callback runs once with session=None.
+    The callback may run more than once, so it must not have side effects outside the database.
+    """
+    if not await supports_transactions(client):
+        return await callback(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(callback)
+
+
+async def run_batches(session: Optional[AsyncIOMotorClientSession], *batches: Callable[[], Awaitable[Any]]) -> list:
+    """
+    Run independent write batches. A session cannot have concurrent operations in flight,
+    so inside a transaction they are sent one after another; without one they run concurrently.
+    """
+    if session is None:
+        return list(await asyncio.gather(*(batch() for batch in batches)))
+    return [await batch() for batch in batches]
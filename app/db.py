@@ -1,7 +1,168 @@
-from motor.motor_asyncio import AsyncIOMotorClient
-from dotenv import load_dotenv
+import asyncio
+import importlib.util
 import os
+from typing import Callable
 
-load_dotenv()
-client = AsyncIOMotorClient(os.getenv("MONGOOSE_CONNECTION"))
-db = client[os.getenv("DB_NAME")]
\ No newline at end of file
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pydantic import BaseModel, ConfigDict
+from pymongo.read_preferences import read_pref_mode_from_name, make_read_preference
+
+from app.common.db_metrics import command_metrics, pool_metrics
+from app.common.metrics import RequestCommandListener
+from app.common.transactions import forget_client
+from app.settings import int_env, load_env
+
+# Python modules the wire compressors need; compressors whose module is missing are skipped
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+
+class MongoSettings(BaseModel):
+    """Client options, read from the environment (see mongo_settings)."""
+    model_config = ConfigDict(frozen=True)
+    uri: str | None = None
+    db_name: str | None = None
+    max_pool_size: int = 100
+    min_pool_size: int = 10
+    max_idle_time_ms: int | None = 60_000
+    wait_queue_timeout_ms: int | None = 2_000
+    connect_timeout_ms: int = 5_000
+    server_selection_timeout_ms: int = 5_000
+    socket_timeout_ms: int | None = None
+    compressors: tuple[str, ...] = ("zstd", "snappy", "zlib")
+    # Read preference of the export endpoints. Everything else, in particular every read that is
+    # cached or answered with an ETag, stays on the primary: a lagging secondary could otherwise be
+    # stored under the generation of a write it has not replicated yet
+    list_read_preference: str = "secondaryPreferred"
+
+
+def mongo_settings() -> MongoSettings:
+    defaults = MongoSettings()
+    compressors = os.getenv("MONGO_COMPRESSORS")
+    return MongoSettings(
+        uri=os.getenv("MONGOOSE_CONNECTION"),
+        db_name=os.getenv("DB_NAME"),
+        max_pool_size=int_env("MONGO_MAX_POOL_SIZE", defaults.max_pool_size),
+        min_pool_size=int_env("MONGO_MIN_POOL_SIZE", defaults.min_pool_size),
+        max_idle_time_ms=int_env("MONGO_MAX_IDLE_TIME_MS", defaults.max_idle_time_ms),
+        wait_queue_timeout_ms=int_env("MONGO_WAIT_QUEUE_TIMEOUT_MS", defaults.wait_queue_timeout_ms),
+        connect_timeout_ms=int_env("MONGO_CONNECT_TIMEOUT_MS", defaults.connect_timeout_ms),
+        server_selection_timeout_ms=int_env(
+            "MONGO_SERVER_SELECTION_TIMEOUT_MS", defaults.server_selection_timeout_ms
+        ),
+        socket_timeout_ms=int_env("MONGO_SOCKET_TIMEOUT_MS", defaults.socket_timeout_ms),
+        compressors=(
+            tuple(c.strip() for c in compressors.split(",") if c.strip())
+            if compressors is not None else defaults.compressors
+        ),
+        list_read_preference=os.getenv("MONGO_LIST_READ_PREFERENCE", defaults.list_read_preference),
+    )
+
+
+def available_compressors(wanted: tuple[str, ...]) -> list[str]:
+    return [c for c in wanted if importlib.util.find_spec(_COMPRESSOR_MODULES.get(c, c)) is not None]
+
+
+def create_client(settings: MongoSettings) -> AsyncIOMotorClient:
+    """
+    Build the client. Motor connects lazily, but the driver starts its monitor
+    threads here, so this runs in the lifespan (open_client), not at import time;
+    the lifespan also warms the pool up (warm_up_pool) and closes the client on shutdown.
+    """
+    options = {
+        "maxPoolSize": settings.max_pool_size,
+        # maxPoolSize=0 means unbounded
+        "minPoolSize": min(settings.min_pool_size, settings.max_pool_size or settings.min_pool_size),
+        "maxIdleTimeMS": settings.max_idle_time_ms,
+        "waitQueueTimeoutMS": settings.wait_queue_timeout_ms,
+        "connectTimeoutMS": settings.connect_timeout_ms,
+        "serverSelectionTimeoutMS": settings.server_selection_timeout_ms,
+        "socketTimeoutMS": settings.socket_timeout_ms,
+    }
+    compressors = available_compressors(settings.compressors)
+    if compressors:
+        options["compressors"] = compressors
+    return AsyncIOMotorClient(
+        settings.uri,
+        event_listeners=[pool_metrics, command_metrics, RequestCommandListener()],
+        **{k: v for k, v in options.items() if v is not None},
+    )
+
+
+async def warm_up_pool(client: AsyncIOMotorClient, connections: int):
+    """Open `connections` sockets up front: concurrent pings each need their own connection."""
+    if connections <= 0:
+        return
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+
+
+class _LazyDatabase:
+    """
+    Stands in for an AsyncIOMotorDatabase that is only created on first use, so
+    modules can `from app.db import db` without opening a client at import time.
+    """
+
+    __slots__ = ("_resolve",)
+
+    def __init__(self, resolve: Callable[[], AsyncIOMotorDatabase]):
+        self._resolve = resolve
+
+    def __getattr__(self, name: str):
+        return getattr(self._resolve(), name)
+
+    def __getitem__(self, name: str):
+        return self._resolve()[name]
+
+
+class _Connection:
+    def __init__(self):
+        self.settings: MongoSettings | None = None
+        self.client: AsyncIOMotorClient | None = None
+        self.db: AsyncIOMotorDatabase | None = None
+        self.list_db: AsyncIOMotorDatabase | None = None
+
+
+_connection = _Connection()
+
+
+def get_settings() -> MongoSettings:
+    if _connection.settings is None:
+        load_env()
+        _connection.settings = mongo_settings()
+    return _connection.settings
+
+
+def open_client() -> AsyncIOMotorClient:
+    """The process-wide client, created on first call (normally from the app lifespan)."""
+    if _connection.client is None:
+        settings = get_settings()
+        client = create_client(settings)
+        _connection.db = client[settings.db_name]
+        # Same database, but export streams may be served by a secondary
+        _connection.list_db = _connection.db.with_options(
+            read_preference=make_read_preference(read_pref_mode_from_name(settings.list_read_preference), None)
+        )
+        _connection.client = client
+    return _connection.client
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    open_client()
+    return _connection.db
+
+
+def get_list_database() -> AsyncIOMotorDatabase:
+    open_client()
+    return _connection.list_db
+
+
+def close_client():
+    """Close the client; the next use of `db` opens a new one."""
+    client = _connection.client
+    _connection.client = _connection.db = _connection.list_db = None
+    if client is not None:
+        forget_client(client)
+        client.close()
+
+
+db = _LazyDatabase(get_database)
+list_db = _LazyDatabase(get_list_database)
@@ -1,22 +1,94 @@
-from fastapi import FastAPI, Depends
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.openapi.models import APIKey, APIKeyIn
-from fastapi.openapi.utils import get_openapi
-
-from app.routes.health import router as health_router
-from app.routes.items import router as items_router
-from app.routes.brand import router as brand_router
-from app.routes.category import router as category_router
-
-app = FastAPI(
-    title="The Fake Shop Admin API",
-    version="1.0.0",
-    # dependencies=[Depends()]   # 👈 Global auth
-)
+"""
+App factory. `create_app()` builds the FastAPI app; the routers (and the
+Pydantic models they pull in) are only imported then, and the Mongo client is
+opened in the lifespan, so importing this module is cheap and does no I/O.
 
-# This sets up Bearer Token security
-security_scheme = HTTPBearer()
+    uvicorn --factory app.main:create_app
+    uvicorn app.main:app                  # `app` is created on first access
+"""
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+
+from app.common.compression import CompressionMiddleware
+from app.common.metrics import MetricsMiddleware
+from app.common.responses import FastJSONResponse, app_debug
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from app.common.cache import read_cache
+    from app.common.change_streams import CacheInvalidationWatcher, change_streams_enabled
+    from app.common.indexes import ensure_indexes, ensure_indexes_on_startup
+    from app.common.item_counters import backfill_counters
+    from app.db import close_client, db, get_settings, open_client, warm_up_pool
+
+    client = open_client()
+    try:
+        await warm_up_pool(client, get_settings().min_pool_size)
+    except Exception as error:
+        # The driver keeps retrying in the background; requests will wait for server selection
+        logger.error("Could not warm up the connection pool: %s", error)
+
+    if ensure_indexes_on_startup():
+        try:
+            await ensure_indexes(db)
+        except Exception as error:
+            # Serving without indexes is slow, not broken: don't block startup on it
+            logger.error("Could not ensure indexes: %s", error)
+        try:
+            backfilled = await backfill_counters(db)
+            if any(backfilled.values()):
+                logger.info("Backfilled item counters: %s", backfilled)
+        except Exception as error:
+            logger.error("Could not backfill item counters: %s", error)
 
+    watcher = None
+    if change_streams_enabled():
+        watcher = CacheInvalidationWatcher(db, read_cache)
+        watcher.start()
+    try:
+        yield
+    finally:
+        if watcher:
+            await watcher.stop()
+        close_client()
+
+def include_routers(app: FastAPI):
+    from app.routes.brand import router as brand_router
+    from app.routes.category import router as category_router
+    from app.routes.health import metrics_router, router as health_router
+    from app.routes.items import router as items_router
+
+    app.include_router(health_router)
+    app.include_router(metrics_router)
+    app.include_router(items_router)
+    app.include_router(brand_router)
+    app.include_router(category_router)
+
+def create_app() -> FastAPI:
+    # The OpenAPI schema is generated on the first /openapi.json or /docs request, not here
+    app = FastAPI(
+        title="The Fake Shop Admin API",
+        version="1.0.0",
+        lifespan=lifespan,
+        debug=app_debug(),
+        default_response_class=FastJSONResponse,
+        # dependencies=[Depends()]   # 👈 Global auth
+    )
+    app.add_middleware(CompressionMiddleware)
+    # Added last so it is outermost and its timing includes compression
+    app.add_middleware(MetricsMiddleware)
+    include_routers(app)
+    return app
+
+# This sets up Bearer Token security
+# from fastapi.openapi.utils import get_openapi
+# from fastapi.security import HTTPBearer
+# security_scheme = HTTPBearer()
+#
 # def custom_openapi():
 #     if app.openapi_schema:
 #         return app.openapi_schema
@@ -48,8 +120,13 @@ security_scheme = HTTPBearer()
 # # 👇 Attach it to the app
 # app.openapi = custom_openapi
 
-app.include_router(health_router)
-app.include_router(items_router)
-app.include_router(brand_router)
-app.include_router(category_router)
+_app: FastAPI | None = None
 
+def __getattr__(name: str):
+    # `app.main:app` keeps working for uvicorn and tooling, without building the app on import
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
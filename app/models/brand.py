@@ -31,6 +31,10 @@ class BrandResponse(BaseModel):
     brandSymbol: str
     brandIcon: str | None = None
     categoryIdList: list[CategoryId]
+    # Maintained by app.common.item_counters
+    itemCount: int = 0
+    totalStock: int = 0
+    inventoryValue: int = 0
 
 class DeleteBrands(BaseModel):
     ids: List[str] = Field(..., description="Array of brand ids")
@@ -61,3 +65,8 @@ class UpdateBrand(BaseModel):
     @classmethod
     def _strip_strings(cls, v):
         return v.strip() if isinstance(v, str) else v
+
+class BulkUpdateBrand(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    id: str = Field(..., min_length=1)
+    changes: UpdateBrand
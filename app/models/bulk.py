@@ -0,0 +1,29 @@
+from typing import Any, Dict, Literal
+
+from pydantic import BaseModel
+
+
+class BulkRowError(BaseModel):
+    index: int
+    detail: Any
+
+
+class BulkUpdateResponse(BaseModel):
+    requested: int = 0
+    matched: int = 0
+    modified: int = 0
+    not_found: list[str] = []
+    errors: list[BulkRowError] = []
+    items: list[Dict[str, Any]] = []
+
+
+DeletePolicy = Literal["block", "reassign"]
+
+
+class CascadeDeleteResponse(BaseModel):
+    requested: int = 0
+    deleted: int = 0
+    not_found: list[str] = []
+    dry_run: bool = False
+    # "<collection>.<field>" -> number of documents referencing the deleted ids
+    references: Dict[str, int] = {}
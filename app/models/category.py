@@ -1,3 +1,4 @@
+from bson import ObjectId
 from typing import List
 
 from pydantic import BaseModel, ConfigDict, field_validator, Field
@@ -38,6 +39,11 @@ class CategoryResponse(BaseModel):
     rootCategoryId: str | None = None
     subCategories: list[SubCategory]
     brands: list[Brand]
+    ancestors: list[str] = Field(default_factory=list)
+    # Maintained by app.common.item_counters
+    itemCount: int = 0
+    totalStock: int = 0
+    inventoryValue: int = 0
 
 class UpdateCategory(BaseModel):
     categoryName: str | None = Field(default=None, min_length=1)
@@ -48,3 +54,19 @@ class UpdateCategory(BaseModel):
     @classmethod
     def _strip(cls, v):
         return v.strip() if isinstance(v, str) else v
+
+class BulkUpdateCategory(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    id: str = Field(..., min_length=1)
+    changes: UpdateCategory
+
+class DeleteCategories(BaseModel):
+    ids: List[str] = Field(..., min_length=1, description="Array of category ids")
+
+    @field_validator("ids")
+    @classmethod
+    def validate_ids(cls, v: List[str]) -> List[str]:
+        bad = [s for s in v if not ObjectId.is_valid(s)]
+        if bad:
+            raise ValueError(f"Invalid id(s): {', '.join(bad)}")
+        return v
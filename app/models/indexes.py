@@ -0,0 +1,79 @@
+from typing import Any, Dict, List, Tuple
+
+from pydantic import BaseModel, ConfigDict
+from pymongo import ASCENDING
+
+
+class IndexSpec(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    name: str
+    unique: bool = False
+
+
+class QueryPattern(BaseModel):
+    """A query the API runs, used to check that it is served by an index."""
+    model_config = ConfigDict(frozen=True)
+    collection: str
+    filter: Dict[str, Any]
+    sort: Tuple[Tuple[str, int], ...] = ()
+
+
+def _asc(*fields: str) -> Tuple[Tuple[str, int], ...]:
+    return tuple((f, ASCENDING) for f in fields)
+
+
+INDEXES: List[IndexSpec] = [
+    # items: reference lookups and the keyset sort keys of get_list_items.
+    # The compound ones follow equality -> sort -> range, and their prefixes
+    # also serve plain brandId / categoryId(+subCategoryId) / subCategoryId lookups.
+    IndexSpec(collection="items", keys=_asc("brandId", "price", "_id"), name="brandId_1_price_1__id_1"),
+    IndexSpec(
+        collection="items",
+        keys=_asc("categoryId", "subCategoryId", "price", "_id"),
+        name="categoryId_1_subCategoryId_1_price_1__id_1",
+    ),
+    IndexSpec(collection="items", keys=_asc("subCategoryId", "price", "_id"), name="subCategoryId_1_price_1__id_1"),
+    IndexSpec(collection="items", keys=_asc("name", "_id"), name="name_1__id_1"),
+    IndexSpec(collection="items", keys=_asc("price", "_id"), name="price_1__id_1"),
+    IndexSpec(collection="items", keys=_asc("quantity", "_id"), name="quantity_1__id_1"),
+    # brands
+    IndexSpec(collection="brands", keys=_asc("categoryIdList.categoryId"), name="categoryIdList.categoryId_1"),
+    IndexSpec(collection="brands", keys=_asc("brandName", "_id"), name="brandName_1__id_1"),
+    IndexSpec(collection="brands", keys=_asc("brandSymbol", "_id"), name="brandSymbol_1__id_1"),
+    # categories
+    IndexSpec(collection="categories", keys=_asc("rootCategoryId"), name="rootCategoryId_1"),
+    IndexSpec(
+        collection="categories", keys=_asc("subCategories.subCategoryId"), name="subCategories.subCategoryId_1"
+    ),
+    IndexSpec(collection="categories", keys=_asc("categoryName", "_id"), name="categoryName_1__id_1"),
+    IndexSpec(collection="categories", keys=_asc("ancestors"), name="ancestors_1"),
+    # reference lookups of the cascade delete (app.common.cascade)
+    IndexSpec(collection="categories", keys=_asc("brands.brandId"), name="brands.brandId_1"),
+    IndexSpec(
+        collection="categories", keys=_asc("categoryIdList.categoryId"), name="categoryIdList.categoryId_1"
+    ),
+]
+
+QUERY_PATTERNS: List[QueryPattern] = [
+    QueryPattern(collection="items", filter={"brandId": "x"}),
+    QueryPattern(collection="items", filter={"categoryId": "x"}),
+    QueryPattern(collection="items", filter={"subCategoryId": "x"}),
+    QueryPattern(collection="items", filter={}, sort=_asc("price", "_id")),
+    QueryPattern(collection="items", filter={}, sort=_asc("name", "_id")),
+    QueryPattern(collection="items", filter={"brandId": "x", "price": {"$gte": 1}}, sort=_asc("price", "_id")),
+    QueryPattern(
+        collection="items", filter={"categoryId": "x", "subCategoryId": "y"}, sort=_asc("price", "_id")
+    ),
+    QueryPattern(collection="items", filter={"name": {"$regex": "^x"}}, sort=_asc("name", "_id")),
+    QueryPattern(collection="items", filter={"quantity": {"$lte": 5}}, sort=_asc("quantity", "_id")),
+    QueryPattern(collection="brands", filter={"categoryIdList.categoryId": "x"}),
+    QueryPattern(collection="brands", filter={}, sort=_asc("brandName", "_id")),
+    QueryPattern(collection="categories", filter={"rootCategoryId": "x"}),
+    QueryPattern(collection="categories", filter={"subCategories.subCategoryId": "x"}),
+    QueryPattern(collection="categories", filter={}, sort=_asc("categoryName", "_id")),
+    QueryPattern(collection="categories", filter={"ancestors": "x"}),
+    QueryPattern(collection="categories", filter={"brands.brandId": {"$in": ["x"]}}),
+    QueryPattern(collection="categories", filter={"categoryIdList.categoryId": {"$in": ["x"]}}),
+]
@@ -1,8 +1,10 @@
 from bson import ObjectId
 from pydantic import BaseModel, Field, field_validator, ValidationError
-from typing import List
+from typing import Dict, List
 from pydantic.config import ConfigDict
 
+from app.models.bulk import BulkRowError
+
 class CreateItem(BaseModel):
     name: str = Field(..., min_length=1)
     currency: str = Field("$")
@@ -70,3 +72,65 @@ class BulkDeleteItemResponse(BaseModel):
     requested: int
     deleted: int
     not_found: list[str] = []
+
+class BulkCreateItemResponse(BaseModel):
+    requested: int = 0
+    inserted: int = 0
+    matched: int = 0
+    modified: int = 0
+    errors: list[BulkRowError] = []
+    items: list[ItemResponse] = []
+
+class BulkUpdateItem(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    id: str = Field(..., min_length=1)
+    changes: UpdateItem
+
+class ItemStatsTotals(BaseModel):
+    count: int
+    quantity: int
+    stockValue: int = Field(..., description="Sum of price * quantity")
+    favorites: int
+    lowStock: int = Field(..., description="Items with quantity <= lowStockThreshold")
+    minPrice: int | None = None
+    maxPrice: int | None = None
+
+class ItemStatsGroup(ItemStatsTotals):
+    key: str | None = Field(..., description="brandId / categoryId / subCategoryId of the group")
+
+class ItemStatsResponse(BaseModel):
+    lowStockThreshold: int
+    totals: ItemStatsTotals
+    # group field -> groups, by stock value descending
+    groups: Dict[str, list[ItemStatsGroup]]
+
+class LowStockItem(BaseModel):
+    id: str = Field(alias="_id")
+    name: str
+    brandId: str
+    categoryId: str
+    subCategoryId: str
+    price: int
+    quantity: int
+
+class LowStockGroup(BaseModel):
+    key: str | None
+    count: int
+    items: list[LowStockItem]
+
+class LowStockResponse(BaseModel):
+    threshold: int
+    groupBy: str
+    groups: list[LowStockGroup]
+
+class ItemFilters(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    brandId: str | None = None
+    categoryId: str | None = None
+    subCategoryId: str | None = None
+    minPrice: int | None = None
+    maxPrice: int | None = None
+    minQuantity: int | None = None
+    maxQuantity: int | None = None
+    isFavoriteItem: bool | None = None
+    name: str | None = None
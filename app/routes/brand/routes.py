@@ -1,48 +1,127 @@
 from bson import ObjectId
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from pymongo import ReturnDocument
 
-from app.common.mongo_utils import serialize_document, to_object_id, find_existing_and_missing_ids
-from app.db import db
-from app.models.brand import BrandResponse, CreateBrand, BulkDeleteBrandResponse, DeleteBrands, UpdateBrand
+from app.common.bulk import bulk_update_by_id
+from app.common.cache import read_cache
+from app.common.cascade import cascade_delete
+from app.common.etag import etag_headers, make_etag, not_modified
+from app.common.expand import BRAND_EXPANSIONS, ReferenceLoader, expanded_collections, parse_expand
+from app.common.export import ExportFormat, export_response
+from app.common.item_counters import zero_counters
+from app.common.metrics import record_documents
+from app.common.mongo_utils import compile_serializer, to_object_id
+from app.common.pagination import PageParams, page_params, paginate
+from app.common.raw_json import decode_json_native, raw_collection, render_json, rendered_response
+from app.common.references import BRAND_REFERENCES, validate_references
+from app.common.responses import ModelRenderer, model_response
+from app.common.single_flight import read_flights
+from app.db import db, list_db
+from app.models.brand import (
+    BrandResponse, CreateBrand, BulkUpdateBrand, DeleteBrands, UpdateBrand,
+)
+from app.models.bulk import BulkUpdateResponse, CascadeDeleteResponse, DeletePolicy
 
 router = APIRouter(prefix='/admin/brands', tags=['Brands'])
+serialize_brand = compile_serializer(BrandResponse)
+render_brand = ModelRenderer(BrandResponse)
+
+BRAND_SORT_FIELDS = ("_id", "brandName", "brandSymbol")
 
 @router.get('/')
-async def get_list_brand():
-    raw_brands = await db.brands.find().to_list(length=100)
-    return [serialize_document(br) for br in raw_brands]
+async def get_list_brand(
+    request: Request,
+    page: PageParams = Depends(page_params),
+    expand: str | None = Query(None, description="Comma separated references to resolve: categories"),
+):
+    names = parse_expand(expand, BRAND_EXPANSIONS)
+    etag = make_etag(["brands", *expanded_collections(names, BRAND_EXPANSIONS)], page, names)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    async def render():
+        brands, next_cursor = await read_cache.get_or_load(
+            read_cache.list_key("brands", page),
+            lambda: paginate(raw_collection(db.brands), page, sortable=BRAND_SORT_FIELDS, transform=decode_json_native),
+        )
+        brands = await ReferenceLoader(db).expand(brands, names, BRAND_EXPANSIONS)
+        record_documents(len(brands))
+        return render_json({"items": brands, "next_cursor": next_cursor})
+
+    return rendered_response(await read_flights.do("brands", etag, render), headers=etag_headers(etag))
+
+@router.get('/export')
+async def export_brands(format: ExportFormat = Query("ndjson")):
+    return export_response(list_db.brands, format, filename="brands", serializer=serialize_brand)
+
+async def load_brand(object_id: ObjectId):
+    doc = await raw_collection(db.brands).find_one({"_id": object_id})
+    return None if doc is None else decode_json_native(doc)
 
 @router.get("/{id}")
-async def get_detail_brand(id: str):
-    to_object_id(id)
+async def get_detail_brand(
+    request: Request,
+    id: str,
+    expand: str | None = Query(None, description="Comma separated references to resolve: categories"),
+):
+    names = parse_expand(expand, BRAND_EXPANSIONS)
+    object_id = to_object_id(id)
+    etag = make_etag(
+        ["brands", *expanded_collections(names, BRAND_EXPANSIONS)],
+        object_id, read_cache.doc_version("brands", object_id), names,
+    )
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
 
-    doc = await db.brands.find_one({"_id": ObjectId(id)})
-    if not doc:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Brand not found")
-    return serialize_document(doc)
+    async def render():
+        doc = await read_cache.get_or_load(read_cache.doc_key("brands", object_id), lambda: load_brand(object_id))
+        if doc is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Brand not found")
+        [brand] = await ReferenceLoader(db).expand([doc], names, BRAND_EXPANSIONS)
+        return render_json(brand)
+
+    return rendered_response(await read_flights.do("brands", etag, render), headers=etag_headers(etag))
 
 @router.post('/', response_model=BrandResponse, status_code=status.HTTP_201_CREATED)
 async def create_brand(payload: CreateBrand):
+    doc = payload.model_dump(exclude_none=True)
+    await validate_references(db, doc, BRAND_REFERENCES)
+    doc.update(zero_counters())
     try:
-        doc = payload.model_dump(exclude_none=True)
-        result = await db.brands.insert_one(doc)
-        created_brand = await db.brands.find_one({"_id": result.inserted_id})
-        return serialize_document(created_brand)
+        # insert_one sets doc["_id"]; the document as inserted is the response, no read back
+        await db.brands.insert_one(doc)
+        read_cache.invalidate("brands")
     except Exception as error:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    return render_brand.response(doc, status_code=status.HTTP_201_CREATED)
 
-@router.delete('/', response_model=BulkDeleteBrandResponse, status_code=status.HTTP_200_OK)
-async def delete_brand(payload: DeleteBrands):
-    ids = payload.ids
-    existing_ids, not_found = await find_existing_and_missing_ids(db.brands, ids)
-    obj_ids = [to_object_id(x) for x in existing_ids]
-    result = await db.brands.delete_many({"_id": {"$in": obj_ids}})
-    return BulkDeleteBrandResponse(
-        requested=len(ids),
-        deleted=result.deleted_count or 0,
-        not_found=not_found
-    )
+@router.delete('/', response_model=CascadeDeleteResponse, status_code=status.HTTP_200_OK)
+async def delete_brand(
+    payload: DeleteBrands,
+    policy: DeletePolicy = Query("block", description="Items using these brands: block the delete or reassign them"),
+    reassign_to: str | None = Query(None, description="Brand id items are moved to with policy=reassign"),
+    dry_run: bool = Query(False, description="Only report what would be deleted and which references would be pulled"),
+):
+    return model_response(await cascade_delete(
+        db, "brands", payload.ids, policy=policy, reassign_to=reassign_to, dry_run=dry_run
+    ))
+
+@router.patch('/bulk', response_model=BulkUpdateResponse, status_code=status.HTTP_200_OK)
+async def bulk_update_brands(
+    request: Request,
+    return_documents: bool = Query(False, description="Re-read and return the updated documents"),
+):
+    """Apply a JSON array or NDJSON stream of {id, changes: UpdateBrand} with one bulk_write per chunk."""
+    return model_response(await bulk_update_by_id(
+        db.brands,
+        request,
+        BulkUpdateBrand,
+        serializer=serialize_brand,
+        return_documents=return_documents,
+        references=BRAND_REFERENCES,
+    ))
 
 @router.patch('/{id}', response_model=BrandResponse, status_code=status.HTTP_202_ACCEPTED)
 async def update_brand(id: str, payload: UpdateBrand):
@@ -53,12 +132,14 @@ async def update_brand(id: str, payload: UpdateBrand):
 
     if not update_doc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid fields to update")
+    await validate_references(db, update_doc, BRAND_REFERENCES)
 
     updated = await db.brands.find_one_and_update(
         {"_id": object_id},
         {"$set": update_doc},
         return_document=ReturnDocument.AFTER
     )
+    read_cache.invalidate("brands", [object_id])
     if not updated:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Brand not found")
-    return serialize_document(updated)
\ No newline at end of file
+    return render_brand.response(updated, status_code=status.HTTP_202_ACCEPTED)
\ No newline at end of file
@@ -1,32 +1,137 @@
-import datetime
-from typing import Set, Dict, Any
+from typing import Dict, Any
 
 from bson import ObjectId
-from fastapi import APIRouter, HTTPException, status
-
-from app.common.mongo_utils import serialize_document, to_object_id, extract_ids
-from app.db import db
-from app.models.category import CategoryResponse, CreateCategory, Brand, UpdateCategory
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+
+from app.common.bulk import bulk_update_by_id
+from app.common.cache import read_cache
+from app.common.cascade import cascade_delete
+from app.common.category_sync import category_doc_from_payload, update_category_relations
+from app.common.category_tree import ancestors_for_parent, load_tree
+from app.common.etag import etag_headers, make_etag, not_modified
+from app.common.expand import CATEGORY_EXPANSIONS, ReferenceLoader, expanded_collections, parse_expand
+from app.common.export import ExportFormat, export_response
+from app.common.metrics import record_documents
+from app.common.mongo_utils import compile_serializer, to_object_id
+from app.common.pagination import PageParams, page_params, paginate
+from app.common.raw_json import decode_json_native, json_response, raw_collection, render_json, rendered_response
+from app.common.references import CATEGORY_REFERENCES, validate_references
+from app.common.responses import ModelRenderer, model_response
+from app.common.single_flight import read_flights
+from app.db import db, list_db
+from app.models.bulk import BulkUpdateResponse, CascadeDeleteResponse, DeletePolicy
+from app.models.category import BulkUpdateCategory, CategoryResponse, CreateCategory, Brand, DeleteCategories, UpdateCategory
 
 router = APIRouter(prefix="/admin/categories", tags=["Category"])
+serialize_category = compile_serializer(CategoryResponse)
+render_category = ModelRenderer(CategoryResponse)
+
+CATEGORY_SORT_FIELDS = ("_id", "categoryName")
 
 @router.get("/")
-async def get_list_categories():
-    raw_categories = await db.categories.find().to_list(length=100)
-    return [serialize_document(category) for category in raw_categories]
+async def get_list_categories(
+    request: Request,
+    page: PageParams = Depends(page_params),
+    expand: str | None = Query(None, description="Comma separated references to resolve: brands,subCategories,rootCategory"),
+):
+    names = parse_expand(expand, CATEGORY_EXPANSIONS)
+    etag = make_etag(["categories", *expanded_collections(names, CATEGORY_EXPANSIONS)], page, names)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    async def render():
+        categories, next_cursor = await read_cache.get_or_load(
+            read_cache.list_key("categories", page),
+            lambda: paginate(
+                raw_collection(db.categories), page, sortable=CATEGORY_SORT_FIELDS, transform=decode_json_native
+            ),
+        )
+        categories = await ReferenceLoader(db).expand(categories, names, CATEGORY_EXPANSIONS)
+        record_documents(len(categories))
+        return render_json({"items": categories, "next_cursor": next_cursor})
 
-@router.get("/{id}")
-async def get_detail_category(id: str):
-    to_object_id(id)
+    return rendered_response(await read_flights.do("categories", etag, render), headers=etag_headers(etag))
+
+@router.get("/export")
+async def export_categories(format: ExportFormat = Query("ndjson")):
+    return export_response(list_db.categories, format, filename="categories", serializer=serialize_category)
 
-    doc = await db.categories.find_one({"_id": ObjectId(id)})
-    if not doc:
+@router.get("/tree")
+async def get_category_tree(request: Request):
+    etag = make_etag(["categories"], "tree")
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    async def render():
+        tree = await read_cache.get_or_load(read_cache.list_key("categories", "tree"), lambda: load_tree(db.categories))
+        return render_json(tree)
+
+    return rendered_response(await read_flights.do("categories", etag, render), headers=etag_headers(etag))
+
+async def load_category(object_id: ObjectId):
+    doc = await raw_collection(db.categories).find_one({"_id": object_id})
+    return None if doc is None else decode_json_native(doc)
+
+@router.get("/{id}")
+async def get_detail_category(
+    request: Request,
+    id: str,
+    expand: str | None = Query(None, description="Comma separated references to resolve: brands,subCategories,rootCategory"),
+):
+    names = parse_expand(expand, CATEGORY_EXPANSIONS)
+    object_id = to_object_id(id)
+    etag = make_etag(
+        ["categories", *expanded_collections(names, CATEGORY_EXPANSIONS)],
+        object_id, read_cache.doc_version("categories", object_id), names,
+    )
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    async def render():
+        doc = await read_cache.get_or_load(read_cache.doc_key("categories", object_id), lambda: load_category(object_id))
+        if doc is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Category not found: {id}")
+        [category] = await ReferenceLoader(db).expand([doc], names, CATEGORY_EXPANSIONS)
+        return render_json(category)
+
+    return rendered_response(await read_flights.do("categories", etag, render), headers=etag_headers(etag))
+
+@router.get("/{id}/descendants")
+async def get_category_descendants(id: str, page: PageParams = Depends(page_params)):
+    object_id = to_object_id(id)
+    if await db.categories.find_one({"_id": object_id}, {"_id": 1}) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Category not found: {id}")
+    # Paged like the list endpoints: a top-level category can have most of the catalog under it
+    descendants, next_cursor = await paginate(
+        raw_collection(db.categories),
+        page,
+        query={"ancestors": object_id},
+        sortable=CATEGORY_SORT_FIELDS,
+        transform=decode_json_native,
+    )
+    return json_response({"items": descendants, "next_cursor": next_cursor})
+
+@router.get("/{id}/ancestors")
+async def get_category_ancestors(id: str):
+    object_id = to_object_id(id)
+    pipeline = [
+        {"$match": {"_id": object_id}},
+        {"$lookup": {"from": "categories", "localField": "ancestors", "foreignField": "_id", "as": "path"}},
+        {"$project": {"ancestors": 1, "path": 1}},
+    ]
+    found = await db.categories.aggregate(pipeline).to_list(length=1)
+    if not found:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Category not found: {id}")
-    return serialize_document(doc)
+    # $lookup does not keep the order of `ancestors`; restore top-down order
+    by_id = {doc["_id"]: doc for doc in found[0]["path"]}
+    path = [by_id[oid] for oid in found[0].get("ancestors", []) if oid in by_id]
+    return json_response({"items": [serialize_category(doc) for doc in path]})
 
 async def update_brands(brands: list[Brand], created_category_id: ObjectId):
-    brand_ids_str = extract_ids(brands, "brandId")
-    brand_ids = [to_object_id(x) for x in brand_ids_str]
+    brand_ids = [to_object_id(b.brandId) for b in brands]
 
     # Update brand
     if brand_ids:
@@ -34,183 +139,86 @@ async def update_brands(brands: list[Brand], created_category_id: ObjectId):
             {"_id": {"$in": brand_ids}},
             {"$addToSet": {"categoryIdList": {"categoryId": str(created_category_id)}}}
         )
+        read_cache.invalidate("brands", brand_ids)
         if updated_brands.matched_count == 0:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Brand not found")
 
-async def update_root_category(root_category_id: str, created_category_id: ObjectId):
-    root_category_oid = to_object_id(root_category_id)
+async def update_root_category(root_category_oid: ObjectId, created_category_id: ObjectId):
+    # Same form as the link category_sync writes on a move
     updated_root_category = await db.categories.update_one(
         {"_id": root_category_oid},
-        {"$addToSet": {"subCategories": {"subCategoryId": str(created_category_id)}}}
+        {"$addToSet": {"subCategories": {"subCategoryId": created_category_id}}}
     )
+    read_cache.invalidate("categories", [root_category_oid])
     if updated_root_category.matched_count == 0:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Root Category not found")
 
 @router.post("/", response_model=CategoryResponse, status_code=status.HTTP_201_CREATED)
 async def create_category(payload: CreateCategory):
+    # Every brand and subcategory must exist, not just one of them
+    await validate_references(db, payload.model_dump(exclude_none=True), CATEGORY_REFERENCES)
+    doc = category_doc_from_payload(payload)
+    root_category_oid = doc.get("rootCategoryId")
+    # 404 when the parent does not exist
+    doc["ancestors"] = await ancestors_for_parent(db.categories, root_category_oid) if root_category_oid else []
     try:
-        doc = payload.model_dump(exclude_none=True)
+        # insert_one sets doc["_id"]; the document as inserted is the response, no read back
         result = await db.categories.insert_one(doc)
         created_category_id = result.inserted_id
-        created_category = await db.categories.find_one({"_id": created_category_id})
+        read_cache.invalidate("categories")
 
         # Update brand
         if payload.brands:
             await update_brands(payload.brands, created_category_id)
 
         # Update rootId
-        if payload.rootCategoryId:
-            await update_root_category(payload.rootCategoryId, created_category_id)
-
-        return serialize_document(created_category)
-
+        if root_category_oid:
+            await update_root_category(root_category_oid, created_category_id)
+    except HTTPException:
+        raise
     except Exception as error:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
-
-def normalize_brand_oid_set(raw: Any) -> Set[ObjectId]:
-    """
-    Accept either:
-      - [ObjectId, ...]
-      - [{"brandId": <OID|str>}, ...]
-    Return a set of ObjectIds.
-    """
-    if not raw:
-        return set()
-    s: Set[ObjectId] = set()
-    for it in raw:
-        if isinstance(it, ObjectId):
-            s.add(it)
-        elif isinstance(it, dict) and "brandId" in it:
-            s.add(to_object_id(it["brandId"]))
-        else:
-            # tolerate stray strings
-            s.add(to_object_id(it))
-    return s
-
-def normalize_sub_oid_set(raw: Any) -> Set[ObjectId]:
-    """
-    Accept list like:
-      - [{"subCategoryId": <OID|str>}, ...]
-      - [<OID|str>, ...]  (if you happened to store raw IDs)
-    Return a set of ObjectIds.
-    """
-    if not raw:
-        return set()
-    s: Set[ObjectId] = set()
-    for it in raw:
-        if isinstance(it, dict) and "subCategoryId" in it:
-            s.add(to_object_id(it["subCategoryId"]))
-        else:
-            s.add(to_object_id(it))
-    return s
+    return render_category.response(doc, status_code=status.HTTP_201_CREATED)
+
+@router.delete("/", response_model=CascadeDeleteResponse, status_code=status.HTTP_200_OK)
+async def delete_categories(
+    payload: DeleteCategories,
+    policy: DeletePolicy = Query("block", description="Items using these categories: block the delete or reassign them"),
+    reassign_to: str | None = Query(None, description="Category id items are moved to with policy=reassign"),
+    dry_run: bool = Query(False, description="Only report what would be deleted and which references would be pulled"),
+):
+    """Delete categories, pull them from brands and parents, and detach their children to the top level."""
+    return model_response(await cascade_delete(
+        db, "categories", payload.ids, policy=policy, reassign_to=reassign_to, dry_run=dry_run
+    ))
+
+RELATION_FIELDS = ("rootCategoryId", "subCategories", "brands")
+
+def reject_relation_changes(update_doc: Dict[str, Any]) -> str | None:
+    # These need the inverse-relation sync done by update_category, which a plain $set cannot do
+    touched = [f for f in RELATION_FIELDS if f in update_doc]
+    if touched:
+        return f"{', '.join(touched)} can only be changed through PATCH /admin/categories/{{id}}"
+    return None
+
+@router.patch("/bulk", response_model=BulkUpdateResponse, status_code=status.HTTP_200_OK)
+async def bulk_update_categories(
+    request: Request,
+    return_documents: bool = Query(False, description="Re-read and return the updated documents"),
+):
+    """Apply a JSON array or NDJSON stream of {id, changes: UpdateCategory} with one bulk_write per chunk."""
+    return model_response(await bulk_update_by_id(
+        db.categories,
+        request,
+        BulkUpdateCategory,
+        serializer=serialize_category,
+        return_documents=return_documents,
+        check_changes=reject_relation_changes,
+    ))
 
 @router.patch("/{id}", response_model=CategoryResponse, status_code=status.HTTP_202_ACCEPTED)
 async def update_category(id: str, payload: UpdateCategory):
-    cat_id = to_object_id(id)
-
-    current = await db.categories.find_one({"_id": cat_id})
-    if not current:
-        raise HTTPException(status_code=404, detail="Category not found")
-
-    # --- NEW values from payload ------------------------------------------
-    # Brands
-    new_brand_id_strs = extract_ids(payload.brands, "brandId")
-    new_brand_oids = [to_object_id(x) for x in new_brand_id_strs]
-    new_brand_oid_set: Set[ObjectId] = set(new_brand_oids)
-
-    # SubCategories
-    new_sub_id_strs = extract_ids(payload.subCategories, "subCategoryId")
-    new_sub_oids = [to_object_id(x) for x in new_sub_id_strs]
-    new_sub_oid_set: Set[ObjectId] = set(new_sub_oids)
-
-    # Root
-    new_root_oid = None
-    if payload.rootCategoryId is not None:
-        new_root_oid = to_object_id(payload.rootCategoryId) if payload.rootCategoryId else None
-
-    # --- EXISTING values from DB ------------------------------------------
-    # Brands may be stored as [ObjectId] or [{"brandId": <id>}]
-    existing_brand_oid_set: Set[ObjectId] = normalize_brand_oid_set(current.get("brands", []))
-
-    # SubCategories usually stored as [{"subCategoryId": <id>}]
-    existing_sub_oid_set: Set[ObjectId] = normalize_sub_oid_set(current.get("subCategories", []))
-
-    existing_root_oid = None
-    if current.get("rootCategoryId") is not None:
-        try:
-            existing_root_oid = to_object_id(current["rootCategoryId"])
-        except HTTPException:
-            existing_root_oid = None  # tolerate legacy bad value
-
-    # --- compute diffs -----------------------------------------------------
-    to_add_brands = new_brand_oid_set - existing_brand_oid_set
-    to_remove_brands = existing_brand_oid_set - new_brand_oid_set
-
-    to_add_subs = new_sub_oid_set - existing_sub_oid_set
-    to_remove_subs = existing_sub_oid_set - new_sub_oid_set
-
-    root_changed = (existing_root_oid != new_root_oid)
-
-    # --- write category doc ------------------------------------------------
-    category_set: Dict[str, Any] = {}
-
-    if payload.categoryName is not None:
-        category_set["categoryName"] = payload.categoryName
-
-    # Store root as ObjectId (recommended)
-    if payload.rootCategoryId is not None:
-        category_set["rootCategoryId"] = new_root_oid
-
-    # Replace full lists with normalized forms
-    # Store brands as list[ObjectId]
-    category_set["brands"] = list(new_brand_oid_set)
-
-    # Store subCategories as objects with ObjectId inside (works with your serializers)
-    category_set["subCategories"] = [{"subCategoryId": oid} for oid in new_sub_oid_set]
-
-    await db.categories.update_one({"_id": cat_id}, {"$set": category_set})
-
-    # --- sync inverse relations -------------------------------------------
-    # Brands: keep string categoryId in brand.categoryIdList for portability
-    if to_add_brands:
-        await db.brands.update_many(
-            {"_id": {"$in": list(to_add_brands)}},
-            {"$addToSet": {"categoryIdList": {"categoryId": str(cat_id)}}},
-        )
-    if to_remove_brands:
-        await db.brands.update_many(
-            {"_id": {"$in": list(to_remove_brands)}},
-            {"$pull": {"categoryIdList": {"categoryId": str(cat_id)}}},
-        )
-
-    # SubCategories: mirror the same pattern (categoryIdList on subcategories)
-    if to_add_subs:
-        await db.categories.update_many(
-            {"_id": {"$in": list(to_add_subs)}},
-            {"$addToSet": {"categoryIdList": {"categoryId": str(cat_id)}}},
-        )
-    if to_remove_subs:
-        await db.categories.update_many(
-            {"_id": {"$in": list(to_remove_subs)}},
-            {"$pull": {"categoryIdList": {"categoryId": str(cat_id)}}},
-        )
-
-    # Root category parent: move this category between parents' children
-    if root_changed:
-        # Remove from old parent
-        if existing_root_oid:
-            await db.categories.update_one(
-                {"_id": existing_root_oid},
-                {"$pull": {"subCategories": {"categoryId": str(cat_id)}}},
-            )
-        # Add to new parent
-        if new_root_oid:
-            await db.categories.update_one(
-                {"_id": new_root_oid},
-                {"$addToSet": {"subCategories": {"categoryId": str(cat_id)}}},
-            )
-
-    # --- return fresh document --------------------------------------------
-    updated = await db.categories.find_one({"_id": cat_id})
-    # Important: return via response model so serializers run
-    return serialize_document(updated)
+    await validate_references(db, payload.model_dump(include=payload.model_fields_set), CATEGORY_REFERENCES)
+    # The category and its inverse relations (brands, subcategories, parent, paths) are written in one transaction
+    updated = await update_category_relations(db, to_object_id(id), payload)
+    return render_category.response(updated, status_code=status.HTTP_202_ACCEPTED)
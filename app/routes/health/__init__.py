@@ -1 +1 @@
-from .routes import router
\ No newline at end of file
+from .routes import metrics_router, router
\ No newline at end of file
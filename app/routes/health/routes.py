@@ -1,7 +1,17 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.common.cache import read_cache
+from app.common.db_metrics import command_metrics, pool_metrics
+from app.common.metrics import render_prometheus, request_metrics
+from app.common.indexes import collscan_patterns, index_drift
+from app.common.references import known_references
+from app.common.single_flight import read_flights
 from app.db import db
 
 router = APIRouter(prefix="/admin/health", tags=["Health"])
+# Prometheus scrapes /admin/metrics by convention, outside the /health prefix
+metrics_router = APIRouter(prefix="/admin", tags=["Health"])
 
 @router.get("/")
 async def health_check():
@@ -10,4 +20,37 @@ async def health_check():
         await db.command("ping")
         return {"status": "connected"}
     except Exception as e:
-        return {"status": "error", "details": str(e)}
\ No newline at end of file
+        return {"status": "error", "details": str(e)}
+
+@router.get("/cache")
+async def cache_stats():
+    return {**read_cache.stats(), "references": known_references.stats()}
+
+@router.get("/coalescing")
+async def coalescing_stats():
+    """Concurrent identical reads answered by another request's in-flight load ("saved")."""
+    return read_flights.stats()
+
+@router.get("/indexes")
+async def index_report():
+    collscans = await collscan_patterns(db)
+    return {
+        "drift": await index_drift(db),
+        "collscans": [pattern.model_dump() for pattern in collscans],
+    }
+
+@router.get("/db")
+async def db_metrics():
+    return {"pools": pool_metrics.snapshot(), "commands": command_metrics.snapshot()}
+
+@router.get("/requests")
+async def request_stats():
+    """Per-route latency and phase (db / serialize / encode) percentiles in ms, and Mongo round-trips per request."""
+    return request_metrics.snapshot()
+
+@metrics_router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(
+        render_prometheus(request_metrics, pool_metrics.state(), command_metrics.state()),
+        media_type="text/plain; version=0.0.4",
+    )
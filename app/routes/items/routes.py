@@ -1,70 +1,340 @@
-from fastapi import APIRouter, HTTPException, status
-from pymongo import ReturnDocument
+import re
+from functools import partial
+from typing import Any, Dict, List, Tuple
 
-from app.common.mongo_utils import serialize_document, to_object_id
-from app.db import db
-from bson import ObjectId
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pymongo.errors import BulkWriteError
 
-from app.models.item import ItemResponse, CreateItem, BulkDeleteItemResponse, DeleteItems, UpdateItem
+from app.common import item_counters
+from app.common.bulk import bulk_update_by_id, iter_request_rows, validate_rows, write_errors
+from app.common.cache import read_cache
+from app.common.etag import etag_headers, make_etag, not_modified
+from app.common.expand import ITEM_EXPANSIONS, ReferenceLoader, expanded_collections, parse_expand
+from app.common.export import ExportFormat, export_response
+from app.common.item_stats import GROUP_FIELDS, LOW_STOCK_THRESHOLD, item_stats, low_stock, parse_group_fields
+from app.common.metrics import record_documents
+from app.common.mongo_utils import compile_serializer, to_object_id
+from app.common.pagination import PageParams, page_params, paginate
+from app.common.raw_json import decode_json_native, raw_collection, render_json, rendered_response
+from app.common.references import ITEM_REFERENCES, reference_problems, validate_references
+from app.common.responses import ModelRenderer, model_response
+from app.common.single_flight import read_flights
+from app.db import db, list_db
+
+from app.models.item import (
+    ItemResponse, CreateItem, BulkCreateItemResponse, BulkDeleteItemResponse, BulkUpdateItem, DeleteItems, ItemFilters,
+    ItemStatsResponse, LowStockResponse, UpdateItem,
+)
+from app.models.bulk import BulkRowError, BulkUpdateResponse
 
 router = APIRouter(prefix="/admin/items", tags=["Items"])
+serialize_item = compile_serializer(ItemResponse)
+render_item = ModelRenderer(ItemResponse)
+
+
+ITEM_SORT_FIELDS = ("_id", "name", "price", "quantity")
+ITEM_NATURAL_KEY_FIELDS = ("name", "brandId", "categoryId", "subCategoryId")
+
+
+def item_filters(
+    brandId: str | None = Query(None),
+    categoryId: str | None = Query(None),
+    subCategoryId: str | None = Query(None),
+    minPrice: int | None = Query(None, ge=0),
+    maxPrice: int | None = Query(None, ge=0),
+    minQuantity: int | None = Query(None, ge=0),
+    maxQuantity: int | None = Query(None, ge=0),
+    isFavoriteItem: bool | None = Query(None),
+    name: str | None = Query(None, min_length=1, description="Case-sensitive prefix of the item name"),
+) -> ItemFilters:
+    return ItemFilters(
+        brandId=brandId, categoryId=categoryId, subCategoryId=subCategoryId,
+        minPrice=minPrice, maxPrice=maxPrice, minQuantity=minQuantity, maxQuantity=maxQuantity,
+        isFavoriteItem=isFavoriteItem, name=name,
+    )
+
+
+def _range(low: int | None, high: int | None) -> Dict[str, int] | None:
+    bounds = {op: v for op, v in (("$gte", low), ("$lte", high)) if v is not None}
+    return bounds or None
+
+
+def item_query(filters: ItemFilters) -> Dict[str, Any]:
+    """
+    Build an index-friendly filter: equality on the reference ids first, ranges on price/quantity,
+    and an anchored, case-sensitive regex for the name prefix so it can use the name index.
+    """
+    query: Dict[str, Any] = {}
+    for field in ("brandId", "categoryId", "subCategoryId", "isFavoriteItem"):
+        value = getattr(filters, field)
+        if value is not None:
+            query[field] = value.strip() if isinstance(value, str) else value
+    for field, bounds in (
+        ("price", _range(filters.minPrice, filters.maxPrice)),
+        ("quantity", _range(filters.minQuantity, filters.maxQuantity)),
+    ):
+        if bounds:
+            query[field] = bounds
+    if filters.name:
+        query["name"] = {"$regex": f"^{re.escape(filters.name)}"}
+    return query
 
 
 @router.get('/')
-async def get_list_items():
-    raw_items = await db.items.find().to_list(length=1000)  # You can set the max number here
-    print('items', raw_items)
-    return [serialize_document(item) for item in raw_items]
+async def get_list_items(
+    request: Request,
+    page: PageParams = Depends(page_params),
+    filters: ItemFilters = Depends(item_filters),
+    count: bool = Query(False, description="Only return the number of matching items"),
+    expand: str | None = Query(None, description="Comma separated references to resolve: brand,category,subCategory"),
+):
+    names = parse_expand(expand, ITEM_EXPANSIONS)
+    query = item_query(filters)
+    etag = make_etag(["items", *expanded_collections(names, ITEM_EXPANSIONS)], page, filters, count, names)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    async def render():
+        if count:
+            # Cached and ETagged like the pages, so counted on the primary as well
+            total = await db.items.count_documents(query) if query else await db.items.estimated_document_count()
+            return render_json({"count": total})
+        items, next_cursor = await paginate(
+            raw_collection(db.items), page, query=query, sortable=ITEM_SORT_FIELDS, transform=decode_json_native
+        )
+        items = await ReferenceLoader(db).expand(items, names, ITEM_EXPANSIONS)
+        record_documents(len(items))
+        return render_json({"items": items, "next_cursor": next_cursor})
+
+    return rendered_response(await read_flights.do("items", etag, render), headers=etag_headers(etag))
+
+
+@router.get('/export')
+async def export_items(format: ExportFormat = Query("ndjson")):
+    return export_response(list_db.items, format, filename="items", serializer=serialize_item)
+
+
+@router.get('/stats', response_model=ItemStatsResponse)
+async def get_item_stats(
+    request: Request,
+    filters: ItemFilters = Depends(item_filters),
+    by: str | None = Query(None, description=f"Comma separated fields to group by ({', '.join(GROUP_FIELDS)}); all by default"),
+    low_stock_threshold: int = Query(LOW_STOCK_THRESHOLD, ge=0),
+):
+    """Item count, stock units, stock value (price * quantity), favorites and low-stock counts, overall and per group."""
+    try:
+        group_fields = parse_group_fields(by)
+    except ValueError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    params = ("stats", filters, group_fields, low_stock_threshold)
+    etag = make_etag(["items"], *params)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    async def render():
+        stats = await read_cache.get_or_load(
+            read_cache.list_key("items", params),
+            lambda: item_stats(db.items, item_query(filters), group_fields, low_stock_threshold),
+        )
+        return render_json(stats)
+
+    return rendered_response(await read_flights.do("items", etag, render), headers=etag_headers(etag))
+
+
+@router.get('/stats/low-stock', response_model=LowStockResponse)
+async def get_low_stock_items(
+    request: Request,
+    filters: ItemFilters = Depends(item_filters),
+    by: str = Query("brandId", description=f"Field to group by ({', '.join(GROUP_FIELDS)})"),
+    threshold: int = Query(LOW_STOCK_THRESHOLD, ge=0),
+    limit: int = Query(20, ge=1, le=500, description="Items listed per group, lowest quantity first"),
+):
+    """Items with quantity <= threshold, grouped by brand, category or subcategory."""
+    if by not in GROUP_FIELDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid group field: {by}. Allowed: {', '.join(GROUP_FIELDS)}"
+        )
+    params = ("low-stock", filters, by, threshold, limit)
+    etag = make_etag(["items"], *params)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
+
+    async def render():
+        report = await read_cache.get_or_load(
+            read_cache.list_key("items", params),
+            lambda: low_stock(db.items, item_query(filters), by, threshold, limit),
+        )
+        return render_json(report)
+
+    return rendered_response(await read_flights.do("items", etag, render), headers=etag_headers(etag))
 
 
 @router.get("/{id}")
-async def get_detail_item(id: str):
-    to_object_id(id)
+async def get_detail_item(
+    request: Request,
+    id: str,
+    expand: str | None = Query(None, description="Comma separated references to resolve: brand,category,subCategory"),
+):
+    names = parse_expand(expand, ITEM_EXPANSIONS)
+    object_id = to_object_id(id)
+    etag = make_etag(["items", *expanded_collections(names, ITEM_EXPANSIONS)], object_id, names)
+    cached = not_modified(request, etag)
+    if cached is not None:
+        return cached
 
-    doc = await db.items.find_one({"_id": ObjectId(id)})
-    if not doc:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Item not found: {id}')
-    return serialize_document(doc)
+    async def render():
+        doc = await raw_collection(db.items).find_one({"_id": object_id})
+        if doc is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Item not found: {id}')
+        [item] = await ReferenceLoader(db).expand([decode_json_native(doc)], names, ITEM_EXPANSIONS)
+        return render_json(item)
+
+    return rendered_response(await read_flights.do("items", etag, render), headers=etag_headers(etag))
+
+
+def item_document(payload: CreateItem) -> Dict[str, Any]:
+    # Turn Pydantic model into a plain dict for MongoDB
+    doc = payload.model_dump(exclude_none=True)  # Pydantic v2; use .dict() in v1
+
+    # Optional: normalize/trim incoming string IDs
+    doc["categoryId"] = doc["categoryId"].strip()
+    doc["subCategoryId"] = doc["subCategoryId"].strip()
+    return doc
 
 
 @router.post('/', response_model=ItemResponse, status_code=status.HTTP_201_CREATED)
 async def create_item(payload: CreateItem):
+    doc = item_document(payload)
+    await validate_references(db, doc, ITEM_REFERENCES)
     try:
-        # Turn Pydantic model into a plain dict for MongoDB
-        doc = payload.model_dump(exclude_none=True)  # Pydantic v2; use .dict() in v1
-
-        # Optional: normalize/trim incoming string IDs
-        doc["categoryId"] = doc["categoryId"].strip()
-        doc["subCategoryId"] = doc["subCategoryId"].strip()
-        result = await db.items.insert_one(doc)
-        created = await db.items.find_one({"_id": result.inserted_id})
-        return serialize_document(created)  # converts _id -> id for JSON
-
+        # Counts the item on its brand and categories in the same transaction; sets doc["_id"]
+        await item_counters.insert_item(db, doc)
     except Exception as error:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    return render_item.response(doc, status_code=status.HTTP_201_CREATED)
+
+
+def parse_natural_key(upsert_on: str | None) -> Tuple[str, ...]:
+    if not upsert_on:
+        return ()
+    keys = tuple(k.strip() for k in upsert_on.split(",") if k.strip())
+    bad = [k for k in keys if k not in ITEM_NATURAL_KEY_FIELDS]
+    if bad:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid upsert key(s): {', '.join(bad)}. Allowed: {', '.join(ITEM_NATURAL_KEY_FIELDS)}",
+        )
+    return keys
+
+
+async def insert_item_chunk(docs: List[Dict[str, Any]], row_indexes: List[int], response: BulkCreateItemResponse):
+    # insert_many assigns _id on each doc in place, so the docs double as the response
+    try:
+        await item_counters.insert_items(db, docs)
+        failed = {}
+    except BulkWriteError as error:
+        failed = write_errors(error, row_indexes)
+    response.inserted += len(docs) - len(failed)
+    response.errors.extend(failed.values())
+    return [doc for i, doc in enumerate(docs) if i not in failed]
+
+
+async def upsert_item_chunk(
+    docs: List[Dict[str, Any]], row_indexes: List[int], keys: Tuple[str, ...], response: BulkCreateItemResponse
+):
+    try:
+        result = await item_counters.upsert_items(db, docs, keys)
+        failed = {}
+    except BulkWriteError as error:
+        result = error.details
+        failed = write_errors(error, row_indexes)
+    response.inserted += result.get("nUpserted", 0)
+    response.matched += result.get("nMatched", 0)
+    response.modified += result.get("nModified", 0)
+    response.errors.extend(failed.values())
+    # Only upserted rows have a known _id without re-reading; matched rows are counted, not echoed
+    for upserted in result.get("upserted", []):
+        docs[upserted["index"]]["_id"] = upserted["_id"]
+    return [doc for doc in docs if "_id" in doc]
+
+
+@router.post('/bulk', response_model=BulkCreateItemResponse, status_code=status.HTTP_200_OK)
+async def bulk_create_items(
+    request: Request,
+    upsert_on: str | None = Query(
+        None, description=f"Comma separated natural key to upsert on ({', '.join(ITEM_NATURAL_KEY_FIELDS)})"
+    ),
+    return_documents: bool = Query(True, description="Echo the written documents back"),
+):
+    """
+    Create items from a JSON array of CreateItem, or an NDJSON stream (Content-Type: application/x-ndjson).
+    Rows are validated and written in chunks with one unordered insert_many / bulk_write per chunk;
+    invalid or failed rows are reported in `errors` without failing the rest of the batch.
+    """
+    keys = parse_natural_key(upsert_on)
+    response = BulkCreateItemResponse()
+    async for rows in iter_request_rows(request):
+        response.requested += len(rows)
+        valid, errors = validate_rows(rows, CreateItem)
+        response.errors.extend(errors)
+        if not valid:
+            continue
+        docs = [item_document(payload) for _, payload in valid]
+        # One $in per referenced collection for the whole chunk
+        problems = await reference_problems(db, docs, ITEM_REFERENCES)
+        response.errors.extend(BulkRowError(index=valid[i][0], detail=problem) for i, problem in problems.items())
+        row_indexes = [index for i, (index, _) in enumerate(valid) if i not in problems]
+        docs = [doc for i, doc in enumerate(docs) if i not in problems]
+        if not docs:
+            continue
+        if keys:
+            written = await upsert_item_chunk(docs, row_indexes, keys, response)
+        else:
+            written = await insert_item_chunk(docs, row_indexes, response)
+        read_cache.invalidate("items")
+        if return_documents:
+            response.items.extend(ItemResponse.model_validate(serialize_item(doc)) for doc in written)
+    response.errors.sort(key=lambda e: e.index)
+    # The echoed items were validated when they were built; don't validate them again as response_model
+    return model_response(response)
 
 
 @router.delete('/', response_model=BulkDeleteItemResponse, status_code=status.HTTP_200_OK)
 async def delete_items(payload: DeleteItems):
     obj_ids = [to_object_id(x) for x in payload.ids]
 
-    existing = await db.items.find(
-        {"_id": {"$in": obj_ids}},
-        {"_id": 1}
-    ).to_list(length=len(obj_ids))
-    existing_ids = {str(doc["_id"]) for doc in existing}
+    # Uncounts the items from their brands and categories in the same transaction
+    existing, deleted = await item_counters.delete_items(db, obj_ids)
+    existing_ids = {str(oid) for oid in existing}
     not_found = [x for x in payload.ids if x not in existing_ids]
-
-    result = await db.items.delete_many({"_id": {"$in": obj_ids}})
-    return BulkDeleteItemResponse(
+    return model_response(BulkDeleteItemResponse(
         requested=len(payload.ids),
-        deleted=result.deleted_count or 0,
+        deleted=deleted,
         not_found=not_found,
-    )
+    ))
+
+@router.patch('/bulk', response_model=BulkUpdateResponse, status_code=status.HTTP_200_OK)
+async def bulk_update_items(
+    request: Request,
+    return_documents: bool = Query(False, description="Re-read and return the updated documents"),
+):
+    """Apply a JSON array or NDJSON stream of {id, changes: UpdateItem} with one bulk_write per chunk."""
+    return model_response(await bulk_update_by_id(
+        db.items,
+        request,
+        BulkUpdateItem,
+        serializer=serialize_item,
+        return_documents=return_documents,
+        write_chunk=partial(item_counters.bulk_update_items, db),
+        references=ITEM_REFERENCES,
+    ))
 
 @router.patch("/{id}", response_model=ItemResponse, status_code=status.HTTP_202_ACCEPTED)
 async def update_item(id: str, payload: UpdateItem):
-    to_object_id(id)
+    object_id = to_object_id(id)
 
     update_doc = payload.model_dump(exclude_unset= True, exclude_none=True)
     update_doc.pop("_id", None)
@@ -72,13 +342,11 @@ async def update_item(id: str, payload: UpdateItem):
 
     if not update_doc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Invalid fields to update')
+    await validate_references(db, update_doc, ITEM_REFERENCES)
 
-    updated = await db.items.find_one_and_update(
-        {"_id": ObjectId(id)},
-        {"$set": update_doc},
-        return_document=ReturnDocument.AFTER
-    )
+    # Moves the counters when brandId / categoryId / subCategoryId / price / quantity change
+    updated = await item_counters.update_item(db, object_id, update_doc)
 
     if not updated:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f'Item not found: {id}')
-    return serialize_document(updated)
+    return render_item.response(updated, status_code=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,96 @@
+"""
+Application settings, read from the environment (and .env) on first use.
+
+Nothing here runs at import time: `get_app_settings()` loads .env and parses
+the variables the first time it is called, which is normally while the first
+request is served or in the lifespan, and returns the same object afterwards.
+The Mongo client options have their own model, app.db.MongoSettings, read the
+same way through app.db.get_settings().
+"""
+import os
+
+from dotenv import load_dotenv
+from pydantic import BaseModel, ConfigDict
+
+_TRUE = ("1", "true", "yes", "on")
+_FALSE = ("0", "false", "no", "off")
+
+
+class AppSettings(BaseModel):
+    model_config = ConfigDict(frozen=True)
+    # Validate plain-document responses against their response model (app.common.responses)
+    app_debug: bool = False
+    # Bodies smaller than this are sent uncompressed (app.common.compression)
+    compression_min_size: int = 1024
+    # Requests at least this slow are logged with their Mongo commands; None disables the log
+    slow_request_ms: float | None = None
+    cache_change_streams: bool = True
+    # Create missing indexes and backfill missing item counters at startup (app.main lifespan)
+    ensure_indexes: bool = True
+    read_cache_max_entries: int = 10_000
+    read_cache_ttl_seconds: float = 30.0
+    read_coalescing: bool = True
+    reference_cache_max_entries: int = 100_000
+    reference_cache_ttl_seconds: float = 30.0
+
+
+def bool_env(name: str, default: bool) -> bool:
+    value = os.getenv(name, "").strip().lower()
+    if value in _TRUE:
+        return True
+    if value in _FALSE:
+        return False
+    return default
+
+
+def int_env(name: str, default: int | None) -> int | None:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return None if value.lower() == "none" else int(value)
+
+
+def float_env(name: str, default: float | None) -> float | None:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return None if value.lower() == "none" else float(value)
+
+
+def app_settings() -> AppSettings:
+    defaults = AppSettings()
+    return AppSettings(
+        app_debug=bool_env("APP_DEBUG", defaults.app_debug),
+        compression_min_size=int_env("COMPRESSION_MIN_SIZE", defaults.compression_min_size),
+        slow_request_ms=float_env("SLOW_REQUEST_MS", defaults.slow_request_ms),
+        cache_change_streams=bool_env("CACHE_CHANGE_STREAMS", defaults.cache_change_streams),
+        ensure_indexes=bool_env("ENSURE_INDEXES", defaults.ensure_indexes),
+        read_cache_max_entries=int_env("READ_CACHE_MAX_ENTRIES", defaults.read_cache_max_entries),
+        read_cache_ttl_seconds=float_env("READ_CACHE_TTL_SECONDS", defaults.read_cache_ttl_seconds),
+        read_coalescing=bool_env("READ_COALESCING", defaults.read_coalescing),
+        reference_cache_max_entries=int_env("REFERENCE_CACHE_MAX_ENTRIES", defaults.reference_cache_max_entries),
+        reference_cache_ttl_seconds=float_env("REFERENCE_CACHE_TTL_SECONDS", defaults.reference_cache_ttl_seconds),
+    )
+
+
+class _State:
+    def __init__(self):
+        self.env_loaded = False
+        self.settings: AppSettings | None = None
+
+
+_state = _State()
+
+
+def load_env() -> None:
+    """Load .env into os.environ, once per process."""
+    if not _state.env_loaded:
+        load_dotenv()
+        _state.env_loaded = True
+
+
+def get_app_settings() -> AppSettings:
+    if _state.settings is None:
+        load_env()
+        _state.settings = app_settings()
+    return _state.settings
@@ -0,0 +1,478 @@
+"""
+Load benchmark: seeds a database and drives every router at fixed concurrency
+through httpx.AsyncClient + ASGITransport (no network, no uvicorn).
+
+    python -m benchmarks.bench_load                               # mongomock-motor, in process
+    python -m benchmarks.bench_load --uri mongodb://localhost:27017 --db fake_shop_bench
+    python -m benchmarks.bench_load --save benchmarks/baseline.json
+    python -m benchmarks.bench_load --compare benchmarks/baseline.json [--tolerance 0.25]
+
+For every scenario it reports throughput, latency percentiles, the peak
+memory allocated per request (tracemalloc) and the Mongo round-trips per
+request, both measured in a separate sequential pass so tracing does not skew
+the timings. --compare exits with status 1 when a scenario's p95 or
+throughput is worse than the baseline by more than --tolerance, or when it
+makes more round-trips per request than the baseline.
+
+Round-trips are the commands the request metrics attribute to each request:
+the driver's command events against a mongod, one per collection / cursor
+call on mongomock.
+
+With --uri the items, brands and categories of --db are EMPTIED and re-seeded.
+Without it the app runs against mongomock-motor, which cannot return
+RawBSONDocument and rejects the `sort` argument PyMongo 4.9+ passes to bulk
+operations; both are adapted below, so use a real mongod for absolute numbers
+and mongomock for relative ones.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List
+
+from bson import ObjectId
+
+Scenario = Callable[["BenchContext", int], Awaitable[Any]]
+
+
+# --- backends ------------------------------------------------------------------
+
+def use_mongomock():
+    """Build the app's client with mongomock-motor. Must run before `app` is imported."""
+    import bson
+    import motor.motor_asyncio
+    from bson.raw_bson import RawBSONDocument
+    from mongomock_motor import AsyncMongoMockClient
+
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    # No change streams on mongomock
+    os.environ["CACHE_CHANGE_STREAMS"] = "false"
+    os.environ.setdefault("DB_NAME", "fake_shop_bench")
+
+    # mongomock ignores the RawBSONDocument document_class: re-encode its dicts instead
+    class RawCursor:
+        def __init__(self, cursor):
+            self._cursor = cursor
+
+        def __getattr__(self, name):
+            attr = getattr(self._cursor, name)
+            if name in ("sort", "limit", "skip", "batch_size", "hint"):
+                return lambda *a, **k: RawCursor(attr(*a, **k))
+            return attr
+
+        async def to_list(self, length=None):
+            return [RawBSONDocument(bson.encode(d)) for d in await self._cursor.to_list(length)]
+
+        def __aiter__(self):
+            return self._iterate()
+
+        async def _iterate(self):
+            async for doc in self._cursor:
+                yield RawBSONDocument(bson.encode(doc))
+
+    class RawCollection:
+        def __init__(self, collection):
+            self._collection = collection
+
+        def __getattr__(self, name):
+            return getattr(self._collection, name)
+
+        def find(self, *args, **kwargs):
+            return RawCursor(self._collection.find(*args, **kwargs))
+
+        async def find_one(self, *args, **kwargs):
+            doc = await self._collection.find_one(*args, **kwargs)
+            return None if doc is None else RawBSONDocument(bson.encode(doc))
+
+    import app.common.raw_json
+    app.common.raw_json.raw_collection = RawCollection
+
+    patch_mongomock_bulk_sort()
+    count_mongomock_round_trips()
+
+
+def patch_mongomock_bulk_sort():
+    """mongomock's bulk builder rejects the `sort` argument PyMongo 4.9+ passes; drop it. Idempotent."""
+    import mongomock.collection
+
+    def drop_sort(method):
+        def wrapper(self, *args, sort=None, **kwargs):
+            return method(self, *args, **kwargs)
+        wrapper.drops_sort = True
+        return wrapper
+
+    for name in ("add_update", "add_replace", "add_delete"):
+        method = getattr(mongomock.collection.BulkOperationBuilder, name, None)
+        if method is not None and not getattr(method, "drops_sort", False):
+            setattr(mongomock.collection.BulkOperationBuilder, name, drop_sort(method))
+
+
+def count_mongomock_round_trips():
+    """mongomock has no command monitoring: record every awaited collection / cursor call as one command."""
+    import mongomock_motor
+    from app.common.metrics import record_command
+
+    def counted(method, name):
+        async def wrapper(self, *args, **kwargs):
+            record_command(name, getattr(self, "name", None))
+            return await method(self, *args, **kwargs)
+        return wrapper
+
+    collection_class = mongomock_motor.AsyncMongoMockCollection
+    for name in (
+        "bulk_write", "count_documents", "delete_many", "delete_one", "distinct", "estimated_document_count",
+        "find_one", "find_one_and_delete", "find_one_and_replace", "find_one_and_update", "insert_many",
+        "insert_one", "replace_one", "update_many", "update_one",
+    ):
+        setattr(collection_class, name, counted(getattr(collection_class, name), name))
+    for cursor_class, name in (
+        (mongomock_motor.AsyncCursor, "find"), (mongomock_motor.AsyncLatentCommandCursor, "aggregate"),
+    ):
+        cursor_class.to_list = counted(cursor_class.to_list, name)
+
+
+def patch_mongomock_imports():
+    """
+    Routers import raw_collection and list_db by name; point them at the adapted
+    raw_collection and at the plain database (mongomock-motor does not wrap
+    Database.with_options, and there are no secondaries to read from anyway).
+    """
+    import app.common.raw_json
+    import app.db
+    for name, module in list(sys.modules.items()):
+        if not name.startswith("app."):
+            continue
+        if getattr(module, "raw_collection", None) is not None:
+            module.raw_collection = app.common.raw_json.raw_collection
+        if getattr(module, "list_db", None) is not None:
+            module.list_db = app.db.db
+
+
+# --- seeding -------------------------------------------------------------------
+
+async def seed(db, *, items: int, brands: int, categories: int, rng: random.Random) -> Dict[str, List[str]]:
+    """Insert a consistent catalog: a category tree, brands linked both ways, and items."""
+    for name in ("items", "brands", "categories"):
+        await db[name].delete_many({})
+
+    category_ids = [ObjectId() for _ in range(categories)]
+    roots = category_ids[: max(1, categories // 5)]
+    category_docs = []
+    ancestors: Dict[ObjectId, List[ObjectId]] = {}
+    for i, cid in enumerate(category_ids):
+        parent = None if cid in roots else rng.choice(category_ids[:i])
+        ancestors[cid] = [] if parent is None else ancestors[parent] + [parent]
+        category_docs.append({
+            "_id": cid,
+            "categoryName": f"Category {i:05d}",
+            "rootCategoryId": str(parent) if parent else None,
+            "subCategories": [],
+            "brands": [],
+            "ancestors": ancestors[cid],
+        })
+    by_id = {doc["_id"]: doc for doc in category_docs}
+    for doc in category_docs:
+        if doc["rootCategoryId"]:
+            by_id[ObjectId(doc["rootCategoryId"])]["subCategories"].append({"subCategoryId": str(doc["_id"])})
+
+    brand_docs = []
+    for i in range(brands):
+        bid = ObjectId()
+        linked = rng.sample(category_ids, k=min(3, categories))
+        brand_docs.append({
+            "_id": bid,
+            "brandName": f"Brand {i:05d}",
+            "brandSymbol": f"B{i}",
+            "categoryIdList": [{"categoryId": str(c)} for c in linked],
+        })
+        for c in linked:
+            by_id[c]["brands"].append({"brandId": str(bid)})
+
+    leaves = [cid for cid in category_ids if ancestors[cid]] or category_ids
+    item_docs = []
+    for i in range(items):
+        sub = rng.choice(leaves)
+        item_docs.append({
+            "name": f"Item {i:07d}",
+            "currency": "$",
+            "price": rng.randint(0, 5000),
+            "description": "Lorem ipsum dolor sit amet",
+            "brandId": str(rng.choice(brand_docs)["_id"]),
+            "categoryId": str((ancestors[sub] or [sub])[0]),
+            "subCategoryId": str(sub),
+            "quantity": rng.randint(0, 100),
+            "isFavoriteItem": i % 7 == 0,
+        })
+
+    await db.categories.insert_many(category_docs)
+    await db.brands.insert_many(brand_docs)
+    for start in range(0, len(item_docs), 5000):
+        await db.items.insert_many(item_docs[start:start + 5000])
+    item_ids = [str(doc["_id"]) for doc in await db.items.find({}, {"_id": 1}).limit(5000).to_list(length=None)]
+    return {
+        "items": item_ids,
+        "brands": [str(doc["_id"]) for doc in brand_docs],
+        "categories": [str(c) for c in category_ids],
+        "parents": [str(c) for c in category_ids if by_id[c]["subCategories"]] or [str(category_ids[0])],
+    }
+
+
+# --- scenarios -----------------------------------------------------------------
+
+class BenchContext:
+    def __init__(self, client, ids: Dict[str, List[str]], rng: random.Random):
+        self.client = client
+        self.ids = ids
+        self.rng = rng
+
+    def pick(self, kind: str) -> str:
+        return self.rng.choice(self.ids[kind])
+
+    async def call(self, method: str, url: str, **kwargs):
+        response = await self.client.request(method, url, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url} -> {response.status_code}: {response.text[:200]}")
+        return response
+
+
+def new_item(ctx: BenchContext, n: int) -> Dict[str, Any]:
+    return {
+        "name": f"Bench item {n}-{ctx.rng.random()}",
+        "price": ctx.rng.randint(0, 5000),
+        "brandId": ctx.pick("brands"),
+        "categoryId": ctx.pick("categories"),
+        "subCategoryId": ctx.pick("categories"),
+    }
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    # items
+    "items.list": lambda ctx, n: ctx.call("GET", "/admin/items/?limit=50"),
+    "items.list_sorted": lambda ctx, n: ctx.call("GET", "/admin/items/?limit=50&sort=price&order=desc"),
+    "items.list_filtered": lambda ctx, n: ctx.call("GET", f"/admin/items/?limit=50&brandId={ctx.pick('brands')}"),
+    "items.list_expand": lambda ctx, n: ctx.call("GET", "/admin/items/?limit=50&expand=brand,category,subCategory"),
+    "items.count": lambda ctx, n: ctx.call("GET", f"/admin/items/?count=true&minPrice={n % 1000}"),
+    # Cached per items generation: after the first request these are cache hits until a write
+    "items.stats": lambda ctx, n: ctx.call("GET", "/admin/items/stats"),
+    "items.stats_filtered": lambda ctx, n: ctx.call("GET", f"/admin/items/stats?by=subCategoryId&brandId={ctx.pick('brands')}"),
+    "items.low_stock": lambda ctx, n: ctx.call("GET", "/admin/items/stats/low-stock?by=categoryId&limit=10"),
+    "items.detail": lambda ctx, n: ctx.call("GET", f"/admin/items/{ctx.pick('items')}"),
+    # Every worker asks for the same document: concurrent requests share one load (see /admin/health/coalescing)
+    "items.detail_hot": lambda ctx, n: ctx.call("GET", f"/admin/items/{ctx.ids['items'][0]}"),
+    "items.create": lambda ctx, n: ctx.call("POST", "/admin/items/", json=new_item(ctx, n)),
+    "items.update": lambda ctx, n: ctx.call(
+        "PATCH", f"/admin/items/{ctx.pick('items')}", json={"price": ctx.rng.randint(0, 5000), "quantity": n % 20}
+    ),
+    "items.bulk_create": lambda ctx, n: ctx.call(
+        "POST", "/admin/items/bulk", json=[new_item(ctx, n * 100 + i) for i in range(100)]
+    ),
+    "items.bulk_update": lambda ctx, n: ctx.call(
+        "PATCH", "/admin/items/bulk",
+        json=[{"id": ctx.pick("items"), "changes": {"price": ctx.rng.randint(0, 5000)}} for _ in range(100)],
+    ),
+    # brands
+    "brands.list": lambda ctx, n: ctx.call("GET", "/admin/brands/?limit=50"),
+    "brands.detail": lambda ctx, n: ctx.call("GET", f"/admin/brands/{ctx.pick('brands')}"),
+    "brands.detail_hot": lambda ctx, n: ctx.call("GET", f"/admin/brands/{ctx.ids['brands'][0]}?expand=categories"),
+    "brands.create": lambda ctx, n: ctx.call(
+        "POST", "/admin/brands/", json={"brandName": f"Bench brand {n}", "brandSymbol": f"B{n}"}
+    ),
+    "brands.update": lambda ctx, n: ctx.call("PATCH", f"/admin/brands/{ctx.pick('brands')}", json={"brandIcon": str(n)}),
+    # categories
+    "categories.list": lambda ctx, n: ctx.call("GET", "/admin/categories/?limit=50"),
+    "categories.tree": lambda ctx, n: ctx.call("GET", "/admin/categories/tree"),
+    "categories.detail": lambda ctx, n: ctx.call("GET", f"/admin/categories/{ctx.pick('categories')}"),
+    "categories.descendants": lambda ctx, n: ctx.call("GET", f"/admin/categories/{ctx.pick('parents')}/descendants"),
+    "categories.create": lambda ctx, n: ctx.call(
+        "POST", "/admin/categories/",
+        json={"categoryName": f"Bench category {n}", "rootCategoryId": ctx.pick("parents"),
+              "brands": [{"brandId": ctx.pick("brands")}]},
+    ),
+    "categories.update": lambda ctx, n: ctx.call(
+        "PATCH", f"/admin/categories/{ctx.pick('categories')}",
+        json={"brands": [{"brandId": ctx.pick("brands")} for _ in range(3)]},
+    ),
+    # health
+    "health.ping": lambda ctx, n: ctx.call("GET", "/admin/health/"),
+}
+
+
+# --- runner --------------------------------------------------------------------
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run_scenario(ctx: BenchContext, scenario: Scenario, requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors: List[str] = []
+    counter = iter(range(requests))
+
+    async def worker():
+        for n in counter:
+            start = time.perf_counter()
+            try:
+                await scenario(ctx, n)
+            except Exception as error:
+                errors.append(str(error))
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+    }
+
+
+async def measure_allocations(ctx: BenchContext, scenario: Scenario, samples: int) -> float:
+    """Mean peak KiB allocated while serving one request, requests run one at a time."""
+    peaks = []
+    tracemalloc.start()
+    try:
+        for n in range(samples):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            try:
+                await scenario(ctx, n)
+            except Exception:
+                pass
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+    return round(sum(peaks) / len(peaks) / 1024, 1) if peaks else 0.0
+
+
+async def measure_round_trips(ctx: BenchContext, scenario: Scenario, samples: int) -> float:
+    """Mean Mongo round-trips per request, requests run one at a time."""
+    from app.common.metrics import request_metrics
+
+    def total() -> float:
+        return sum(stats.round_trips.total for _, stats in request_metrics.items())
+
+    before = total()
+    for n in range(samples):
+        try:
+            await scenario(ctx, n)
+        except Exception:
+            pass
+    return round((total() - before) / samples, 2) if samples else 0.0
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if base["p95_ms"] and result["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {base['p95_ms']} -> {result['p95_ms']} ms")
+        if base["rps"] and result["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['rps']} -> {result['rps']} req/s")
+        # Round-trips barely depend on timing: any extra half a command per request is a real change
+        if "round_trips" in base and result["round_trips"] > base["round_trips"] + 0.5:
+            regressions.append(f"{name}: round-trips {base['round_trips']} -> {result['round_trips']} per request")
+    return regressions
+
+
+async def main_async(args) -> int:
+    if args.uri:
+        os.environ["MONGOOSE_CONNECTION"] = args.uri
+        os.environ["DB_NAME"] = args.db
+    else:
+        use_mongomock()
+
+    import httpx
+    from app.common.single_flight import read_flights
+    from app.db import db
+    from app.main import app
+    if not args.uri:
+        patch_mongomock_imports()
+
+    rng = random.Random(args.seed)
+    ids = await seed(db, items=args.items, brands=args.brands, categories=args.categories, rng=rng)
+    print(f"seeded {args.items} items, {args.brands} brands, {args.categories} categories "
+          f"({'mongod ' + args.uri if args.uri else 'mongomock'})")
+
+    selected = [name for name in SCENARIOS if not args.only or any(name.startswith(p) for p in args.only)]
+    results: Dict[str, Dict[str, Any]] = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            ctx = BenchContext(client, ids, rng)
+            print(f"{'scenario':<26}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'KiB/req':>9}"
+                  f"{'trips':>7}{'errors':>8}")
+            for name in selected:
+                scenario = SCENARIOS[name]
+                # Warm caches and code paths before timing
+                await run_scenario(ctx, scenario, min(args.concurrency, args.requests), args.concurrency)
+                result = await run_scenario(ctx, scenario, args.requests, args.concurrency)
+                result["alloc_kib"] = await measure_allocations(ctx, scenario, args.alloc_samples)
+                result["round_trips"] = await measure_round_trips(ctx, scenario, args.alloc_samples)
+                results[name] = result
+                print(f"{name:<26}{result['rps']:>9.1f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                      f"{result['p99_ms']:>9.2f}{result['alloc_kib']:>9.1f}{result['round_trips']:>7.1f}"
+                      f"{result['errors']:>8}")
+                if result["first_error"]:
+                    print(f"    first error: {result['first_error']}")
+    coalescing = read_flights.stats()
+    print(f"coalesced reads: {coalescing['saved']} of {coalescing['calls']} shared an in-flight load")
+
+    config = {k: getattr(args, k) for k in ("items", "brands", "categories", "requests", "concurrency")}
+    config["backend"] = "mongod" if args.uri else "mongomock"
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"config": config, "results": results}, f, indent=2)
+        print(f"saved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"warning: baseline was recorded with {baseline.get('config')}, this run used {config}")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print(f"no regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 1 if any(r["errors"] for r in results.values()) else 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", help="mongod to run against; omit for mongomock-motor")
+    parser.add_argument("--db", default="fake_shop_bench", help="database to empty and seed (with --uri)")
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--brands", type=int, default=200)
+    parser.add_argument("--categories", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=300, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--alloc-samples", type=int, default=20,
+                        help="sequential requests per scenario for the allocation and round-trip passes")
+    parser.add_argument("--only", nargs="*", help="scenario name prefixes, e.g. items. categories.update")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    sys.exit(asyncio.run(main_async(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Micro-benchmark: serialize_document / compile_serializer against the previous
+closure-based implementation, on batches of 10k documents.
+
+    python -m benchmarks.bench_serialize [--docs 10000] [--repeat 5]
+"""
+import argparse
+import base64
+import timeit
+from datetime import date, datetime, timezone
+from typing import Any, Dict
+
+from bson import Decimal128, ObjectId
+
+from app.common.mongo_utils import compile_serializer, serialize_document
+from app.models.brand import BrandResponse
+from app.models.category import CategoryResponse
+from app.models.item import ItemResponse
+
+
+def legacy_serialize_document(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """The serializer as it was before the dispatch-table rewrite, kept for comparison."""
+    def conv(v: Any):
+        if isinstance(v, ObjectId):
+            return str(v)
+        if isinstance(v, (datetime, date)):
+            return v.isoformat()
+        if isinstance(v, Decimal128):
+            return float(v.to_decimal())
+        if isinstance(v, bytes):
+            return base64.b64encode(v).decode("utf-8")
+        if isinstance(v, dict):
+            return {k: conv(x) for k, x in v.items()}
+        if isinstance(v, (list, tuple, set)):
+            return [conv(x) for x in v]
+        return v
+
+    return conv(doc)
+
+
+def make_item(i: int) -> Dict[str, Any]:
+    return {
+        "_id": ObjectId(),
+        "name": f"Item {i}",
+        "currency": "$",
+        "price": i % 500,
+        "description": "Lorem ipsum dolor sit amet " * 3,
+        "imageUrl": f"https://cdn.example.com/items/{i}.png",
+        "brandId": str(ObjectId()),
+        "categoryId": str(ObjectId()),
+        "subCategoryId": str(ObjectId()),
+        "quantity": i % 40,
+        "isFavoriteItem": i % 7 == 0,
+        "updatedAt": datetime.now(timezone.utc),
+    }
+
+
+def make_brand(i: int) -> Dict[str, Any]:
+    return {
+        "_id": ObjectId(),
+        "brandName": f"Brand {i}",
+        "brandSymbol": f"B{i}",
+        "brandIcon": None,
+        "categoryIdList": [{"categoryId": str(ObjectId())} for _ in range(5)],
+    }
+
+
+def make_category(i: int) -> Dict[str, Any]:
+    return {
+        "_id": ObjectId(),
+        "categoryName": f"Category {i}",
+        "rootCategoryId": ObjectId(),
+        "subCategories": [{"subCategoryId": ObjectId()} for _ in range(4)],
+        "brands": [ObjectId() for _ in range(6)],
+    }
+
+
+CASES = (
+    ("items", make_item, ItemResponse),
+    ("brands", make_brand, BrandResponse),
+    ("categories", make_category, CategoryResponse),
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'collection':<12}{'legacy ms':>12}{'dispatch ms':>14}{'schema ms':>12}{'speedup':>10}")
+    for name, factory, model in CASES:
+        docs = [factory(i) for i in range(args.docs)]
+        schema_serializer = compile_serializer(model)
+        assert [schema_serializer(d) for d in docs[:100]] == [legacy_serialize_document(d) for d in docs[:100]]
+
+        def best(fn) -> float:
+            return min(timeit.repeat(lambda: [fn(d) for d in docs], number=1, repeat=args.repeat)) * 1000
+
+        legacy = best(legacy_serialize_document)
+        dispatch = best(serialize_document)
+        schema = best(schema_serializer)
+        print(f"{name:<12}{legacy:>12.1f}{dispatch:>14.1f}{schema:>12.1f}{legacy / min(dispatch, schema):>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Cold-start benchmark: every run is a fresh interpreter that imports app.main,
+builds the app with create_app() and serves its first requests through
+httpx.AsyncClient + ASGITransport (no network, no uvicorn).
+
+    python -m benchmarks.bench_startup [--runs 10]
+    python -m benchmarks.bench_startup --uri mongodb://localhost:27017 --db fake_shop   # + lifespan
+    python -m benchmarks.bench_startup --importtime 15       # slowest imports of app.main
+    python -m benchmarks.bench_startup --save benchmarks/startup.json
+    python -m benchmarks.bench_startup --compare benchmarks/startup.json [--tolerance 0.25]
+
+Phases, in ms (median and max over --runs):
+
+- process: interpreter start to the first response, as seen by the parent
+- import: `import app.main`
+- create_app: create_app(), i.e. importing the routers and registering the routes
+- lifespan: opening the client, warming the pool and ensuring indexes (--uri only)
+- first_request: the first GET /admin/health/requests (no Mongo involved)
+- openapi: the first GET /openapi.json, where FastAPI builds the schema
+
+--compare exits with status 1 when a phase's median is worse than the baseline
+by more than --tolerance.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+PHASES = ("process", "import", "create_app", "lifespan", "first_request", "openapi")
+
+# Runs in the child interpreter; prints one JSON line of phase timings
+CHILD = """
+import asyncio, json, os, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+application = app.main.create_app()
+created = time.perf_counter()
+
+async def main():
+    import httpx
+    timings = {"import": (imported - start) * 1000, "create_app": (created - imported) * 1000}
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        if os.environ.get("BENCH_LIFESPAN"):
+            t = time.perf_counter()
+            async with application.router.lifespan_context(application):
+                timings["lifespan"] = (time.perf_counter() - t) * 1000
+                await requests(client, timings)
+        else:
+            await requests(client, timings)
+    print(json.dumps(timings))
+
+async def requests(client, timings):
+    t = time.perf_counter()
+    (await client.get("/admin/health/requests")).raise_for_status()
+    timings["first_request"] = (time.perf_counter() - t) * 1000
+    timings["ready_at"] = time.time()
+    t = time.perf_counter()
+    (await client.get("/openapi.json")).raise_for_status()
+    timings["openapi"] = (time.perf_counter() - t) * 1000
+
+asyncio.run(main())
+"""
+
+
+def child_env(args) -> Dict[str, str]:
+    env = dict(os.environ)
+    env["CACHE_CHANGE_STREAMS"] = "false"
+    if args.uri:
+        env["MONGOOSE_CONNECTION"] = args.uri
+        env["DB_NAME"] = args.db
+        env["BENCH_LIFESPAN"] = "1"
+    return env
+
+
+def run_once(args) -> Dict[str, float]:
+    started = time.time()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD], env=child_env(args), capture_output=True, text=True, check=True
+    ).stdout
+    timings = json.loads(out.strip().splitlines()[-1])
+    timings["process"] = (timings.pop("ready_at") - started) * 1000
+    return timings
+
+
+def slowest_imports(args, top: int) -> List[str]:
+    """Cumulative import time per module (python -X importtime), slowest first."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main; app.main.create_app()"],
+        env=child_env(args), capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative), name))
+    rows.sort(reverse=True)
+    return [f"{us / 1000:>9.1f} ms  {name}" for us, name in rows[:top]]
+
+
+def summarize(runs: List[Dict[str, float]]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for phase in PHASES:
+        values = [run[phase] for run in runs if phase in run]
+        if values:
+            summary[phase] = {
+                "median_ms": round(statistics.median(values), 2),
+                "max_ms": round(max(values), 2),
+            }
+    return summary
+
+
+def compare(summary: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], tolerance: float) -> List[str]:
+    regressions = []
+    for phase, result in summary.items():
+        base = baseline.get(phase)
+        if base and base["median_ms"] and result["median_ms"] > base["median_ms"] * (1 + tolerance):
+            regressions.append(f"{phase}: median {base['median_ms']} -> {result['median_ms']} ms")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", help="mongod to open in the lifespan; omit to skip the lifespan")
+    parser.add_argument("--db", default="fake_shop_bench")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--importtime", type=int, metavar="N", help="also list the N slowest imports")
+    parser.add_argument("--save", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    # One unmeasured run so the .pyc files exist and the OS file cache is warm
+    run_once(args)
+    summary = summarize([run_once(args) for _ in range(args.runs)])
+    print(f"{'phase':<16}{'median ms':>11}{'max ms':>11}")
+    for phase, result in summary.items():
+        print(f"{phase:<16}{result['median_ms']:>11.2f}{result['max_ms']:>11.2f}")
+
+    if args.importtime:
+        print("\nslowest imports (cumulative):")
+        print("\n".join(slowest_imports(args, args.importtime)))
+
+    config = {"runs": args.runs, "lifespan": bool(args.uri), "python": sys.version.split()[0]}
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"config": config, "results": summary}, f, indent=2)
+        print(f"saved baseline to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print(f"warning: baseline was recorded with {baseline.get('config')}, this run used {config}")
+        regressions = compare(summary, baseline["results"], args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Tests run against a single-node replica set when one is available, and
+against mongomock-motor otherwise.
+
+    MONGO_TEST_URI="mongodb://localhost:27017/?replicaSet=rs0" python -m pytest tests
+
+Without MONGO_TEST_URI, a mongod is started with --replSet from the binary
+pymongo_inmemory downloads (pip install -r requirements-dev.txt). When that is
+not possible either, the `db` fixture is a mongomock-motor database: it has
+no transactions, so the code under test takes its standalone path, and tests
+that need change streams (the `replica_set_uri` fixture) are skipped.
+MONGO_TEST_BACKEND=mongomock skips the replica set lookup.
+"""
+import os
+import socket
+import subprocess
+import time
+from tempfile import TemporaryDirectory
+from typing import Iterator, Optional, Tuple
+from uuid import uuid4
+
+import pymongo
+import pytest
+from motor.motor_asyncio import AsyncIOMotorClient
+
+REPLICA_SET = "rs0"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _mongod_binary() -> Optional[str]:
+    try:
+        from pymongo_inmemory.context import Context
+        from pymongo_inmemory.downloader import download
+    except ImportError:  # optional test dependency
+        return None
+    try:
+        return os.path.join(download(Context()), "mongod")
+    except Exception:
+        return None
+
+
+def _wait_for_primary(client: pymongo.MongoClient, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not client.admin.command("hello").get("isWritablePrimary"):
+        if time.monotonic() > deadline:
+            raise TimeoutError("replica set member did not become primary")
+        time.sleep(0.2)
+
+
+def _start_replica_set(binary: str, dbpath: str) -> Tuple[subprocess.Popen, str]:
+    port = _free_port()
+    process = subprocess.Popen(
+        [binary, "--replSet", REPLICA_SET, "--port", str(port), "--bind_ip", "127.0.0.1", "--dbpath", dbpath],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    client = pymongo.MongoClient(port=port, directConnection=True, serverSelectionTimeoutMS=30_000)
+    try:
+        client.admin.command(
+            "replSetInitiate", {"_id": REPLICA_SET, "members": [{"_id": 0, "host": f"127.0.0.1:{port}"}]}
+        )
+        _wait_for_primary(client)
+    except Exception:
+        process.terminate()
+        raise
+    finally:
+        client.close()
+    return process, f"mongodb://127.0.0.1:{port}/?replicaSet={REPLICA_SET}"
+
+
+@pytest.fixture(scope="session")
+def mongo_uri() -> Iterator[Optional[str]]:
+    """URI of a replica set to test against, None when tests fall back to mongomock."""
+    uri = os.getenv("MONGO_TEST_URI")
+    if uri or os.getenv("MONGO_TEST_BACKEND") == "mongomock":
+        yield uri
+        return
+    binary = _mongod_binary()
+    if binary is None:
+        yield None
+        return
+    with TemporaryDirectory(prefix="rs0-") as dbpath:
+        process, uri = _start_replica_set(binary, dbpath)
+        try:
+            yield uri
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+
+@pytest.fixture(scope="session")
+def replica_set_uri(mongo_uri):
+    if mongo_uri is None:
+        pytest.skip("needs a replica set: set MONGO_TEST_URI or install pymongo_inmemory")
+    return mongo_uri
+
+
+@pytest.fixture
+def anyio_backend():
+    # Motor runs on asyncio
+    return "asyncio"
+
+
+@pytest.fixture
+async def db(mongo_uri):
+    """A fresh database per test, dropped afterwards."""
+    name = f"test_{uuid4().hex[:12]}"
+    if mongo_uri is None:
+        from mongomock_motor import AsyncMongoMockClient
+
+        from benchmarks.bench_load import patch_mongomock_bulk_sort
+
+        patch_mongomock_bulk_sort()
+        client = AsyncMongoMockClient()
+    else:
+        client = AsyncIOMotorClient(mongo_uri)
+    database = client[name]
+    try:
+        yield database
+    finally:
+        await client.drop_database(name)
+        client.close()
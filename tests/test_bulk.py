@@ -0,0 +1,35 @@
+import json
+
+import pytest
+from bson import ObjectId
+from starlette.requests import Request
+
+from app.common.bulk import bulk_update_by_id
+from app.models.brand import BulkUpdateBrand
+
+pytestmark = pytest.mark.anyio
+
+
+def json_request(rows) -> Request:
+    body = json.dumps(rows).encode()
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = {"type": "http", "method": "PATCH", "headers": [(b"content-type", b"application/json")]}
+    return Request(scope, receive)
+
+
+@pytest.mark.parametrize("return_documents", [False, True])
+async def test_unknown_ids_are_reported_with_or_without_documents(db, return_documents):
+    brand_id = (await db.brands.insert_one({"brandName": "a", "brandSymbol": "a"})).inserted_id
+    missing = str(ObjectId())
+    rows = [{"id": str(brand_id), "changes": {"brandName": "b"}}, {"id": missing, "changes": {"brandName": "c"}}]
+
+    response = await bulk_update_by_id(
+        db.brands, json_request(rows), BulkUpdateBrand, serializer=dict, return_documents=return_documents
+    )
+
+    assert (response.matched, response.not_found) == (1, [missing])
+    assert len(response.items) == (1 if return_documents else 0)
+    assert (await db.brands.find_one({"_id": brand_id}))["brandName"] == "b"
@@ -0,0 +1,114 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.common.cascade import cascade_delete
+
+pytestmark = pytest.mark.anyio
+
+
+async def brand_with_items(db, name: str, items: int) -> ObjectId:
+    brand_id = (await db.brands.insert_one({"brandName": name, "brandSymbol": name.lower()})).inserted_id
+    if items:
+        await db.items.insert_many([
+            {"name": f"{name}-{i}", "brandId": str(brand_id), "price": 2, "quantity": 1} for i in range(items)
+        ])
+    return brand_id
+
+
+async def test_block_refuses_delete_while_items_reference_the_brand(db):
+    brand_id = await brand_with_items(db, "A", 2)
+
+    with pytest.raises(HTTPException) as raised:
+        await cascade_delete(db, "brands", [str(brand_id)], policy="block")
+
+    assert raised.value.status_code == 409
+    assert await db.brands.count_documents({"_id": brand_id}) == 1
+    assert await db.items.count_documents({"brandId": str(brand_id)}) == 2
+
+
+async def test_reassign_moves_items_and_pulls_references(db):
+    old = await brand_with_items(db, "A", 2)
+    new = await brand_with_items(db, "B", 0)
+    category_id = (await db.categories.insert_one(
+        {"categoryName": "C", "brands": [{"brandId": old}, {"brandId": new}], "subCategories": [], "ancestors": []}
+    )).inserted_id
+
+    response = await cascade_delete(db, "brands", [str(old)], policy="reassign", reassign_to=str(new))
+
+    assert response.deleted == 1
+    assert response.references == {"items.brandId": 2, "categories.brands": 1}
+    assert await db.brands.find_one({"_id": old}) is None
+    assert await db.items.distinct("brandId") == [str(new)]
+    category = await db.categories.find_one({"_id": category_id})
+    assert category["brands"] == [{"brandId": new}]
+    # The reassigned items are counted on their new brand
+    brand = await db.brands.find_one({"_id": new})
+    assert (brand["itemCount"], brand["totalStock"], brand["inventoryValue"]) == (2, 2, 4)
+
+
+async def test_reassign_rejects_a_missing_target(db):
+    brand_id = await brand_with_items(db, "A", 1)
+
+    with pytest.raises(HTTPException) as raised:
+        await cascade_delete(db, "brands", [str(brand_id)], policy="reassign", reassign_to=str(ObjectId()))
+
+    assert raised.value.status_code == 404
+    assert await db.brands.count_documents({"_id": brand_id}) == 1
+    assert await db.items.distinct("brandId") == [str(brand_id)]
+
+
+async def test_dry_run_reports_without_writing(db):
+    brand_id = await brand_with_items(db, "A", 3)
+    missing = str(ObjectId())
+
+    response = await cascade_delete(db, "brands", [str(brand_id), missing], dry_run=True)
+
+    assert response.dry_run is True
+    assert response.requested == 2
+    assert response.deleted == 1
+    assert response.not_found == [missing]
+    assert response.references["items.brandId"] == 3
+    assert await db.brands.count_documents({"_id": brand_id}) == 1
+    assert await db.items.count_documents({}) == 3
+
+
+async def test_category_delete_detaches_children_and_rewrites_their_subtrees(db):
+    parent, child, grandchild, brand = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    await db.brands.insert_one({"_id": brand, "brandName": "A", "categoryIdList": [{"categoryId": str(parent)}]})
+    await db.categories.insert_many([
+        {"_id": parent, "categoryName": "P", "subCategories": [{"subCategoryId": child}], "ancestors": []},
+        {"_id": child, "categoryName": "C", "rootCategoryId": parent, "ancestors": [parent],
+         "subCategories": [{"subCategoryId": grandchild}]},
+        {"_id": grandchild, "categoryName": "G", "rootCategoryId": child, "ancestors": [parent, child],
+         "subCategories": []},
+    ])
+
+    await cascade_delete(db, "categories", [str(parent)])
+
+    assert await db.categories.find_one({"_id": parent}) is None
+    child_doc = await db.categories.find_one({"_id": child})
+    assert (child_doc["rootCategoryId"], child_doc["ancestors"]) == (None, [])
+    assert (await db.categories.find_one({"_id": grandchild}))["ancestors"] == [child]
+    assert (await db.brands.find_one({"_id": brand}))["categoryIdList"] == []
+
+
+async def test_reassign_moves_category_counters_in_the_same_write(db):
+    old, new, sub = ObjectId(), ObjectId(), ObjectId()
+    await db.categories.insert_many([
+        {"_id": old, "categoryName": "old", "subCategories": [], "ancestors": [], "itemCount": 2, "totalStock": 3, "inventoryValue": 9},
+        {"_id": new, "categoryName": "new", "subCategories": [], "ancestors": [], "itemCount": 1, "totalStock": 1, "inventoryValue": 3},
+        {"_id": sub, "categoryName": "sub", "subCategories": [], "ancestors": [], "itemCount": 1, "totalStock": 2, "inventoryValue": 6},
+    ])
+    await db.items.insert_many([
+        # Its subcategory is the target: after the reassign it counts once there
+        {"categoryId": str(old), "subCategoryId": str(new), "price": 3, "quantity": 1},
+        {"categoryId": str(old), "subCategoryId": str(sub), "price": 3, "quantity": 2},
+    ])
+
+    await cascade_delete(db, "categories", [str(old)], policy="reassign", reassign_to=str(new))
+
+    counters = {
+        doc["_id"]: (doc["itemCount"], doc["totalStock"], doc["inventoryValue"]) async for doc in db.categories.find()
+    }
+    assert counters == {new: (2, 3, 9), sub: (1, 2, 6)}
@@ -0,0 +1,99 @@
+from bson import ObjectId
+import pytest
+from pymongo import UpdateMany, UpdateOne
+
+from app.common.category_sync import _pull_child_op, compile_relation_ops, update_category_relations
+from app.common.category_tree import move_subtree_op
+from app.models.category import UpdateCategory
+
+pytestmark = pytest.mark.anyio
+
+
+def test_brand_diff_adds_and_pulls_the_backref():
+    cat, kept, dropped, added = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    before = {"_id": cat, "brands": [{"brandId": kept}, {"brandId": str(dropped)}]}
+
+    category_ops, brand_ops, touched, moved = compile_relation_ops(
+        cat, before, {"brands": [{"brandId": kept}, {"brandId": added}]}
+    )
+
+    backref = {"categoryIdList": {"categoryId": str(cat)}}
+    assert category_ops == []
+    assert brand_ops == [
+        UpdateMany({"_id": {"$in": [added]}}, {"$addToSet": backref}),
+        UpdateMany({"_id": {"$in": [dropped]}}, {"$pull": backref}),
+    ]
+    assert touched == {"categories": {cat}, "brands": {added, dropped}}
+    assert not moved
+
+
+def test_unchanged_parent_is_not_a_move():
+    cat, parent = ObjectId(), ObjectId()
+    before = {"_id": cat, "rootCategoryId": str(parent), "ancestors": [parent]}
+
+    category_ops, brand_ops, touched, moved = compile_relation_ops(
+        cat, before, {"rootCategoryId": parent, "ancestors": [parent]}
+    )
+
+    assert (category_ops, brand_ops, moved) == ([], [], False)
+
+
+def test_parent_change_relinks_both_parents_then_rewrites_the_subtree():
+    cat, old, new = ObjectId(), ObjectId(), ObjectId()
+    before = {"_id": cat, "rootCategoryId": old, "ancestors": [old]}
+
+    category_ops, _, _, moved = compile_relation_ops(cat, before, {"rootCategoryId": new, "ancestors": [new]})
+
+    assert moved
+    assert category_ops == [
+        _pull_child_op(old, cat),
+        UpdateOne({"_id": new}, {"$addToSet": {"subCategories": {"subCategoryId": cat}}}),
+        move_subtree_op(cat, [old], [new]),
+    ]
+
+
+def test_subcategory_moves_come_after_the_category_own_move():
+    cat, parent, child, other = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    before = {"_id": cat, "ancestors": [], "subCategories": []}
+    children = {child: {"_id": child, "rootCategoryId": other, "ancestors": [other]}}
+
+    category_ops, _, touched, moved = compile_relation_ops(
+        cat,
+        before,
+        {"rootCategoryId": parent, "ancestors": [parent], "subCategories": [{"subCategoryId": child}]},
+        children,
+    )
+
+    assert moved
+    assert touched["categories"] == {cat, child, other}
+    assert category_ops == [
+        UpdateMany({"_id": {"$in": [child]}}, {"$addToSet": {"categoryIdList": {"categoryId": str(cat)}}}),
+        UpdateOne({"_id": parent}, {"$addToSet": {"subCategories": {"subCategoryId": cat}}}),
+        move_subtree_op(cat, [], [parent]),
+        _pull_child_op(other, child),
+        UpdateOne({"_id": child}, {"$set": {"rootCategoryId": cat, "ancestors": [parent, cat]}}),
+        move_subtree_op(child, [other], [parent, cat]),
+    ]
+
+
+async def test_brand_changes_sync_the_brand_backrefs(db):
+    cat, kept, dropped, added = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    backref = {"categoryId": str(cat)}
+    await db.brands.insert_many([
+        {"_id": kept, "categoryIdList": [backref]},
+        {"_id": dropped, "categoryIdList": [backref]},
+        {"_id": added, "categoryIdList": []},
+    ])
+    await db.categories.insert_one({
+        "_id": cat, "categoryName": "c", "ancestors": [], "subCategories": [],
+        "brands": [{"brandId": kept}, {"brandId": dropped}],
+    })
+
+    updated = await update_category_relations(
+        db, cat, UpdateCategory(categoryName="renamed", brands=[{"brandId": str(kept)}, {"brandId": str(added)}])
+    )
+
+    assert updated["categoryName"] == "renamed"
+    assert updated["brands"] == [{"brandId": kept}, {"brandId": added}]
+    lists = {doc["_id"]: doc["categoryIdList"] async for doc in db.brands.find()}
+    assert lists == {kept: [backref], dropped: [], added: [backref]}
@@ -0,0 +1,179 @@
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from app.common.category_sync import update_category_relations
+from app.common.category_tree import ancestors_for_move, build_tree
+from app.models.category import UpdateCategory
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeCategories:
+    """Just enough of a collection for ancestors_for_parent: find_one by _id."""
+
+    def __init__(self, *docs):
+        self.docs = {doc["_id"]: doc for doc in docs}
+
+    async def find_one(self, flt, projection=None, session=None):
+        return self.docs.get(flt["_id"])
+
+
+def test_build_tree_nests_by_path_and_falls_back_to_root_category_id():
+    a, b, c, orphan = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    docs = [
+        {"_id": a, "categoryName": "a", "ancestors": []},
+        {"_id": b, "categoryName": "b", "ancestors": [a]},
+        # No path yet (written before ancestors existed): placed by rootCategoryId
+        {"_id": c, "categoryName": "c", "rootCategoryId": str(b)},
+        # Parent deleted: shown at the top level
+        {"_id": orphan, "categoryName": "o", "ancestors": [ObjectId()]},
+    ]
+
+    tree = build_tree(docs)
+
+    assert [node["_id"] for node in tree] == [str(a), str(orphan)]
+    [b_node] = tree[0]["children"]
+    assert b_node["_id"] == str(b)
+    assert [node["_id"] for node in b_node["children"]] == [str(c)]
+
+
+async def test_ancestors_for_move_returns_the_parent_path():
+    a, b, moved = ObjectId(), ObjectId(), ObjectId()
+    categories = FakeCategories({"_id": a, "ancestors": []}, {"_id": b, "ancestors": [a]})
+
+    assert await ancestors_for_move(categories, moved, b) == [a, b]
+    assert await ancestors_for_move(categories, moved, None) == []
+
+
+@pytest.mark.parametrize("parent", ["self", "descendant"])
+async def test_ancestors_for_move_rejects_cycles(parent):
+    a, b = ObjectId(), ObjectId()
+    categories = FakeCategories({"_id": a, "ancestors": []}, {"_id": b, "ancestors": [a]})
+
+    with pytest.raises(HTTPException) as raised:
+        await ancestors_for_move(categories, a, a if parent == "self" else b)
+
+    assert raised.value.status_code == 400
+
+
+async def test_ancestors_for_move_404s_on_a_missing_parent():
+    with pytest.raises(HTTPException) as raised:
+        await ancestors_for_move(FakeCategories(), ObjectId(), ObjectId())
+
+    assert raised.value.status_code == 404
+
+
+async def make_tree(db):
+    """a -> b -> c, and d on its own."""
+    a, b, c, d = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    await db.categories.insert_many([
+        {"_id": a, "categoryName": "a", "ancestors": [], "subCategories": [{"subCategoryId": b}], "brands": []},
+        {"_id": b, "categoryName": "b", "rootCategoryId": a, "ancestors": [a],
+         "subCategories": [{"subCategoryId": c}], "brands": []},
+        {"_id": c, "categoryName": "c", "rootCategoryId": b, "ancestors": [a, b], "subCategories": [], "brands": []},
+        {"_id": d, "categoryName": "d", "ancestors": [], "subCategories": [], "brands": []},
+    ])
+    return a, b, c, d
+
+
+async def stored(db, category_id):
+    return await db.categories.find_one({"_id": category_id})
+
+
+async def test_move_rewrites_the_subtree_and_both_parents(db):
+    a, b, c, d = await make_tree(db)
+
+    updated = await update_category_relations(db, b, UpdateCategory(rootCategoryId=str(d)))
+
+    assert updated["ancestors"] == [d]
+    assert (await stored(db, b))["rootCategoryId"] == d
+    assert (await stored(db, b))["ancestors"] == [d]
+    assert (await stored(db, c))["ancestors"] == [d, b]
+    assert (await stored(db, a))["subCategories"] == []
+    assert (await stored(db, d))["subCategories"] == [{"subCategoryId": b}]
+
+
+async def test_detach_lifts_the_subtree_to_the_top(db):
+    a, b, c, d = await make_tree(db)
+
+    await update_category_relations(db, b, UpdateCategory(rootCategoryId=""))
+
+    assert (await stored(db, b))["ancestors"] == []
+    assert (await stored(db, b))["rootCategoryId"] is None
+    assert (await stored(db, c))["ancestors"] == [b]
+    assert (await stored(db, a))["subCategories"] == []
+
+
+@pytest.mark.parametrize("parent", ["self", "child", "grandchild"])
+async def test_move_under_itself_or_a_descendant_is_rejected(db, parent):
+    a, b, c, d = await make_tree(db)
+    target = {"self": a, "child": b, "grandchild": c}[parent]
+    before = await db.categories.find().sort("_id", 1).to_list(length=None)
+
+    with pytest.raises(HTTPException) as raised:
+        await update_category_relations(db, a, UpdateCategory(rootCategoryId=str(target)))
+
+    assert raised.value.status_code == 400
+    assert await db.categories.find().sort("_id", 1).to_list(length=None) == before
+
+
+async def test_move_under_a_missing_parent_is_404(db):
+    a, b, c, d = await make_tree(db)
+
+    with pytest.raises(HTTPException) as raised:
+        await update_category_relations(db, b, UpdateCategory(rootCategoryId=str(ObjectId())))
+
+    assert raised.value.status_code == 404
+    assert (await stored(db, b))["ancestors"] == [a]
+
+
+async def test_adding_a_subcategory_moves_it_and_its_subtree(db):
+    a, b, c, d = await make_tree(db)
+
+    await update_category_relations(
+        db, d, UpdateCategory(subCategories=[{"subCategoryId": str(b)}])
+    )
+
+    assert (await stored(db, b))["rootCategoryId"] == d
+    assert (await stored(db, b))["ancestors"] == [d]
+    assert (await stored(db, c))["ancestors"] == [d, b]
+    assert (await stored(db, a))["subCategories"] == []
+    assert (await stored(db, d))["subCategories"] == [{"subCategoryId": b}]
+
+
+async def test_dropping_a_subcategory_detaches_it(db):
+    a, b, c, d = await make_tree(db)
+
+    await update_category_relations(db, a, UpdateCategory(subCategories=[]))
+
+    assert (await stored(db, b))["rootCategoryId"] is None
+    assert (await stored(db, b))["ancestors"] == []
+    assert (await stored(db, c))["ancestors"] == [b]
+
+
+async def test_subcategories_follow_a_move_in_the_same_update(db):
+    a, b, c, d = await make_tree(db)
+
+    # c leaves b for d, which makes adopting its old parent b legal
+    await update_category_relations(
+        db, c, UpdateCategory(rootCategoryId=str(d), subCategories=[{"subCategoryId": str(b)}])
+    )
+
+    assert (await stored(db, c))["ancestors"] == [d]
+    assert (await stored(db, b))["rootCategoryId"] == c
+    assert (await stored(db, b))["ancestors"] == [d, c]
+    assert (await stored(db, a))["subCategories"] == []
+
+
+@pytest.mark.parametrize("child", ["self", "parent", "grandparent"])
+async def test_adding_itself_or_an_ancestor_as_subcategory_is_rejected(db, child):
+    a, b, c, d = await make_tree(db)
+    target = {"self": c, "parent": b, "grandparent": a}[child]
+    before = await db.categories.find().sort("_id", 1).to_list(length=None)
+
+    with pytest.raises(HTTPException) as raised:
+        await update_category_relations(db, c, UpdateCategory(subCategories=[{"subCategoryId": str(target)}]))
+
+    assert raised.value.status_code == 400
+    assert await db.categories.find().sort("_id", 1).to_list(length=None) == before
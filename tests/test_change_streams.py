@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from bson import ObjectId
+
+from app.common.cache import ReadThroughCache
+from app.common.change_streams import CacheInvalidationWatcher
+
+pytestmark = pytest.mark.anyio
+
+
+async def eventually(predicate, timeout: float = 10.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.05)
+
+
+@pytest.fixture
+async def watcher(replica_set_uri, db):
+    cache = ReadThroughCache(max_entries=100, ttl=60)
+    watcher = CacheInvalidationWatcher(db, cache, ["brands"])
+    watcher.start()
+    await eventually(lambda: "brands" in cache.watched)
+    try:
+        yield watcher
+    finally:
+        await watcher.stop()
+
+
+async def test_write_invalidates_document_and_list_pages(db, watcher):
+    cache = watcher.cache
+    brand_id = (await db.brands.insert_one({"brandName": "A"})).inserted_id
+    await eventually(lambda: watcher.events_applied == 1)
+    cache.set(cache.doc_key("brands", brand_id), {"brandName": "A"})
+    generation = cache.generation("brands")
+
+    await db.brands.update_one({"_id": brand_id}, {"$set": {"brandName": "B"}})
+
+    await eventually(lambda: watcher.events_applied == 2)
+    assert cache.generation("brands") == generation + 1
+    assert cache.doc_key("brands", brand_id) not in cache._entries
+
+
+async def test_counter_only_update_keeps_list_pages(db, watcher):
+    cache = watcher.cache
+    brand_id = (await db.brands.insert_one({"brandName": "A", "itemCount": 0})).inserted_id
+    await eventually(lambda: watcher.events_applied == 1)
+    generation = cache.generation("brands")
+
+    await db.brands.update_one({"_id": brand_id}, {"$inc": {"itemCount": 1, "totalStock": 3}})
+
+    await eventually(lambda: watcher.events_applied == 2)
+    assert cache.generation("brands") == generation
+    assert cache.doc_version("brands", brand_id) == 1
+    assert "brands" in cache.lagging
+
+
+async def test_unexpected_error_is_a_gap_and_the_watch_resumes(db, watcher, monkeypatch):
+    cache = watcher.cache
+    gaps = []
+    apply = watcher.apply
+
+    def fail_once(collection, change):
+        if not gaps:
+            raise RuntimeError("boom")
+        apply(collection, change)
+
+    monkeypatch.setattr(watcher, "apply", fail_once)
+    monkeypatch.setattr(watcher, "_on_gap", lambda collection, error: (
+        gaps.append(error), CacheInvalidationWatcher._on_gap(watcher, collection, error)
+    ))
+    generation = cache.generation("brands")
+
+    await db.brands.insert_one({"brandName": "A"})
+    await eventually(lambda: len(gaps) == 1)
+    assert isinstance(gaps[0], RuntimeError)
+    # No resume token yet: everything cached for the collection was dropped
+    assert cache.generation("brands") > generation
+
+    # The failed stream is closed, then reopened after the backoff
+    await eventually(lambda: "brands" not in cache.watched)
+    await eventually(lambda: "brands" in cache.watched)
+    await db.brands.insert_one({"_id": ObjectId(), "brandName": "B"})
+    await eventually(lambda: watcher.events_applied >= 1)
+    assert all(not task.done() for task in watcher._tasks)
@@ -0,0 +1,48 @@
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from app.common.compression import CompressionMiddleware
+from app.common.etag import etag_headers, not_modified
+
+pytestmark = pytest.mark.anyio
+
+ETAG = '"v1"'
+
+
+def make_app(size: int) -> CompressionMiddleware:
+    app = FastAPI()
+
+    @app.get("/doc")
+    async def doc(request: Request):
+        return not_modified(request, ETAG) or JSONResponse({"data": "x" * size}, headers=etag_headers(ETAG))
+
+    return CompressionMiddleware(app, minimum_size=100)
+
+
+async def get(app, **headers) -> httpx.Response:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+        return await client.get("/doc", headers={"accept-encoding": "gzip", **headers})
+
+
+async def test_304_names_the_compressed_etag_the_200_sent():
+    app = make_app(size=1000)
+    ok = await get(app)
+    assert (ok.headers["content-encoding"], ok.headers["etag"]) == ("gzip", '"v1-gzip"')
+
+    revalidated = await get(app, **{"if-none-match": ok.headers["etag"]})
+
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == ok.headers["etag"]
+    assert "Accept-Encoding" in revalidated.headers["vary"]
+
+
+async def test_304_of_an_uncompressed_200_keeps_the_plain_etag():
+    app = make_app(size=10)
+    ok = await get(app)
+    assert "content-encoding" not in ok.headers
+
+    revalidated = await get(app, **{"if-none-match": ok.headers["etag"]})
+
+    assert (revalidated.status_code, revalidated.headers["etag"]) == (304, ETAG)
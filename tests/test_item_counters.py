@@ -0,0 +1,133 @@
+import pytest
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.common import item_counters
+from app.common.item_counters import COUNTER_FIELDS, backfill_counters, counter_deltas, reconcile_counters, zero_counters
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def catalog(db):
+    ids = {name: ObjectId() for name in ("brand", "other_brand", "category", "sub")}
+    zero = zero_counters()
+    await db.brands.insert_many([{"_id": ids["brand"], **zero}, {"_id": ids["other_brand"], **zero}])
+    await db.categories.insert_many([{"_id": ids["category"], **zero}, {"_id": ids["sub"], **zero}])
+    return ids
+
+
+def item(catalog, price: int, quantity: int, brand: str = "brand", sub: str = "sub"):
+    return {
+        "name": f"item-{ObjectId()}",
+        "brandId": str(catalog[brand]),
+        "categoryId": str(catalog["category"]),
+        "subCategoryId": str(catalog[sub]),
+        "price": price,
+        "quantity": quantity,
+    }
+
+
+def test_counter_deltas_net_out_per_target():
+    brand, other, category = ObjectId(), ObjectId(), ObjectId()
+    before = {"brandId": str(brand), "categoryId": str(category), "subCategoryId": str(category), "price": 2, "quantity": 3}
+    after = {**before, "brandId": other, "quantity": 5}
+
+    deltas = counter_deltas([(None, before), (before, after), (after, None), (None, {"price": 4})])
+
+    assert deltas == {
+        ("brands", brand): [0, 0, 0],
+        ("brands", other): [0, 0, 0],
+        # Same category and subcategory: counted once
+        ("categories", category): [0, 0, 0],
+    }
+    assert counter_deltas([(before, after)]) == {
+        ("brands", brand): [-1, -3, -6],
+        ("brands", other): [1, 5, 10],
+        ("categories", category): [0, 2, 4],
+    }
+
+
+async def counters(db, collection, oid):
+    doc = await db[collection].find_one({"_id": oid})
+    return tuple(doc.get(field, 0) for field in COUNTER_FIELDS)
+
+
+async def test_insert_update_delete_move_the_counters(db, catalog):
+    first = await item_counters.insert_item(db, item(catalog, price=3, quantity=2))
+    await item_counters.insert_item(db, item(catalog, price=5, quantity=1))
+    assert await counters(db, "brands", catalog["brand"]) == (2, 3, 11)
+    assert await counters(db, "categories", catalog["category"]) == (2, 3, 11)
+    assert await counters(db, "categories", catalog["sub"]) == (2, 3, 11)
+
+    await item_counters.update_item(db, first, {"brandId": str(catalog["other_brand"]), "quantity": 4})
+    assert await counters(db, "brands", catalog["brand"]) == (1, 1, 5)
+    assert await counters(db, "brands", catalog["other_brand"]) == (1, 4, 12)
+    assert await counters(db, "categories", catalog["category"]) == (2, 5, 17)
+
+    await item_counters.delete_items(db, [first])
+    assert await counters(db, "brands", catalog["other_brand"]) == (0, 0, 0)
+    assert await counters(db, "categories", catalog["category"]) == (1, 1, 5)
+
+
+async def test_item_whose_subcategory_is_its_category_counts_once(db, catalog):
+    await item_counters.insert_item(db, item(catalog, price=2, quantity=2, sub="category"))
+
+    assert await counters(db, "categories", catalog["category"]) == (1, 2, 4)
+    assert await counters(db, "categories", catalog["sub"]) == (0, 0, 0)
+
+
+async def test_bulk_insert_counts_only_the_rows_written(db, catalog):
+    duplicate = ObjectId()
+    await db.items.insert_one({"_id": duplicate})
+    docs = [item(catalog, 1, 1), {**item(catalog, 100, 100), "_id": duplicate}, item(catalog, 2, 3)]
+
+    with pytest.raises(BulkWriteError) as raised:
+        await item_counters.insert_items(db, docs)
+
+    assert [error["index"] for error in raised.value.details["writeErrors"]] == [1]
+    assert raised.value.details["nInserted"] == 2
+    assert await db.items.count_documents({"brandId": str(catalog["brand"])}) == 2
+    assert await counters(db, "brands", catalog["brand"]) == (2, 4, 7)
+
+
+async def test_bulk_upsert_and_update_move_the_counters(db, catalog):
+    doc = item(catalog, 2, 5)
+    await item_counters.upsert_items(db, [dict(doc)], ("name", "brandId"))
+    await item_counters.upsert_items(db, [{**doc, "quantity": 1}], ("name", "brandId"))
+    assert await counters(db, "brands", catalog["brand"]) == (1, 1, 2)
+
+    item_id = (await db.items.find_one({"name": doc["name"]}))["_id"]
+    update = {"brandId": str(catalog["other_brand"]), "price": 10}
+    await item_counters.bulk_update_items(db, [UpdateOne({"_id": item_id}, {"$set": update})], [item_id], [update])
+    assert await counters(db, "brands", catalog["brand"]) == (0, 0, 0)
+    assert await counters(db, "brands", catalog["other_brand"]) == (1, 1, 10)
+
+
+async def test_reconcile_repairs_drifted_counters(db, catalog):
+    await item_counters.insert_item(db, item(catalog, price=3, quantity=2))
+    await db.brands.update_one({"_id": catalog["brand"]}, {"$set": {"itemCount": 9, "totalStock": 0}})
+    await db.categories.update_one({"_id": catalog["sub"]}, {"$unset": {"inventoryValue": ""}})
+
+    assert await reconcile_counters(db, "brands") == 1
+    assert await reconcile_counters(db, "categories") == 1
+    assert await counters(db, "brands", catalog["brand"]) == (1, 2, 6)
+    assert await counters(db, "categories", catalog["sub"]) == (1, 2, 6)
+    assert await reconcile_counters(db, "brands") == 0
+
+
+async def test_backfill_only_sets_documents_missing_counters(db, catalog):
+    await item_counters.insert_item(db, item(catalog, price=3, quantity=2))
+    legacy = ObjectId()
+    await db.brands.insert_one({"_id": legacy})
+    await db.items.insert_one({"brandId": str(legacy), "price": 1, "quantity": 4})
+    # Drifted, but has its counters: left to reconcile
+    await db.brands.update_one({"_id": catalog["brand"]}, {"$set": {"itemCount": 9}})
+    await db.categories.update_one({"_id": catalog["sub"]}, {"$unset": {"itemCount": ""}})
+
+    assert await backfill_counters(db) == {"brands": 1, "categories": 1}
+    assert await counters(db, "brands", legacy) == (1, 4, 4)
+    assert await counters(db, "categories", catalog["sub"]) == (1, 2, 6)
+    assert await counters(db, "brands", catalog["brand"]) == (9, 2, 6)
+    assert await backfill_counters(db) == {"brands": 0, "categories": 0}